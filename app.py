@@ -1,17 +1,42 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_socketio import SocketIO, emit, disconnect, join_room, leave_room
 from flask_wtf.csrf import CSRFProtect
 from werkzeug.security import generate_password_hash, check_password_hash
 import requests
+import atexit
 import json
 import os
+import sqlite3
 import re
 import urllib.parse
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import time
 from bs4 import BeautifulSoup
-from models import db, User, ChatSession, ChatMessage, ModelRating, SystemConfig, UserFeedback
+from sqlalchemy import event
+from models import db, User, ChatSession, ChatMessage, ModelRating, UserFeedback, MessageMetrics, ArchivedSession, ArchivedMessageDay
+from ollama_client import OllamaClient
+from model_catalog import ModelCatalog
+from config_cache import ConfigCache
+from conversation import ConversationEngine
+from chat_export import export_stream
+import user_stats
+import usage_rollup
+from persistence_queue import WriteBehindQueue
+from session_archive import SessionArchive
+from stream_batcher import ChunkBatcher
+from generation_scheduler import GenerationScheduler, QueueFull
+from response_cache import ResponseCache
+from search_cache import SearchCache
+from search_intent import classifier_for, compile_patterns, DEFAULT_PATTERNS, DEFAULT_NEGATIVE_PATTERNS
+from page_text import snippet_from_response
+from local_index import LocalIndex
+import message_search
+import migrate_db
+from token_metrics import TokenEstimator, ollama_timings
+from pagination import keyset_page, InvalidCursor
+from prompt_builder import PromptBuilder, parse_budgets, MESSAGE_OVERHEAD_TOKENS
+from telemetry import record_generation, latency_summary
 from forms import LoginForm, RegisterForm, ChangePasswordForm, FeedbackForm
 
 app = Flask(__name__)
@@ -38,13 +63,37 @@ login_manager.session_protection = 'strong'  # Strong session protection
 login_manager.remember_cookie_duration = timedelta(days=30)  # 30-day remember me duration
 socketio = SocketIO(app, cors_allowed_origins="*")
 
+# In-memory copy of SystemConfig, loaded once by init_database()
+config_cache = ConfigCache(check_interval=int(os.environ.get('CONFIG_CHECK_INTERVAL', 5)))
+
+# SQLite lock wait before "database is locked" errors
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+def configure_sqlite_connection(dbapi_connection, connection_record=None):
+    """WAL, synchronous=NORMAL and busy_timeout on every new SQLite connection"""
+    migrate_db.configure_connection(dbapi_connection, SQLITE_BUSY_TIMEOUT_MS)
+
 # Initialize database and create admin user
 def init_database():
     """Initialize database tables and create admin user if needed"""
     try:
         with app.app_context():
+            if db.engine.dialect.name == 'sqlite':
+                event.listen(db.engine, 'connect', configure_sqlite_connection)
             db.create_all()
             
+            # create_all() only adds new tables; columns and indexes added later come from migrate_db
+            if db.engine.dialect.name == 'sqlite':
+                conn = sqlite3.connect(db.engine.url.database, isolation_level=None)
+                try:
+                    configure_sqlite_connection(conn)
+                    migrate_db.migrate(conn)
+                finally:
+                    conn.close()
+            
+            # Full-text index over chat history, maintained by triggers
+            message_search.ensure_index()
+            
             # Create admin user if it doesn't exist
             admin_user = User.query.filter_by(username='admin').first()
             if not admin_user:
@@ -71,6 +120,9 @@ def init_database():
                 db.session.add(prompt_config)
                 db.session.commit()
                 print("Default system prompt initialized")
+            
+            # Load all config rows into memory in one query
+            config_cache.load()
                 
     except Exception as e:
         print(f"Database initialization error: {e}")
@@ -81,31 +133,94 @@ init_database()
 # Ollama configuration
 OLLAMA_BASE_URL = os.environ.get('OLLAMA_URL', 'http://localhost:11434')
 
+# Shared keep-alive client used for every call to Ollama
+ollama_client = OllamaClient(
+    OLLAMA_BASE_URL,
+    pool_size=int(os.environ.get('OLLAMA_POOL_SIZE', 4))
+)
+
+# Cached model listing, refreshed in the background
+model_catalog = ModelCatalog(ollama_client, ttl=int(os.environ.get('MODEL_CATALOG_TTL', 60)))
+model_catalog.start(socketio)
+
 # Global variable to track streaming states per user session
 streaming_sessions = {}
 
+# message_chunk batching: flush window, size threshold and debug fields
+STREAM_FLUSH_MS = int(os.environ.get('STREAM_FLUSH_MS', 40))
+STREAM_FLUSH_BYTES = int(os.environ.get('STREAM_FLUSH_BYTES', 512))
+STREAM_DEBUG = os.environ.get('STREAM_DEBUG', 'false').lower() == 'true'
+
+# Admission queue in front of Ollama: the Pi runs about one generation at a time
+generation_scheduler = GenerationScheduler(
+    max_concurrent=int(os.environ.get('GENERATION_CONCURRENCY', 1)),
+    max_queue_depth=int(os.environ.get('GENERATION_QUEUE_DEPTH', 16))
+)
+
+# Opt-in cache of low-temperature answers to repeated opening prompts
+response_cache = ResponseCache(
+    enabled=os.environ.get('RESPONSE_CACHE_ENABLED', 'false').lower() == 'true',
+    max_temperature=float(os.environ.get('RESPONSE_CACHE_MAX_TEMPERATURE', 0.3)),
+    max_bytes=int(os.environ.get('RESPONSE_CACHE_MAX_KB', 4096)) * 1024,
+    path=os.environ.get('RESPONSE_CACHE_PATH', os.path.join(app.instance_path, 'response_cache.db'))
+)
+
+# Live token estimates while streaming, calibrated against Ollama's eval_count
+token_estimator = TokenEstimator()
+
+# Prompts are fitted into a per-model token budget, estimated with a ratio
+# calibrated against Ollama's prompt_eval_count
+prompt_token_estimator = TokenEstimator()
+# A load_duration this long means the model was just loaded, so no prompt
+# prefix can have come from its KV cache
+COLD_LOAD_MS = 1000
+prompt_builder = PromptBuilder(
+    prompt_token_estimator,
+    default_budget=int(os.environ.get('PROMPT_TOKEN_BUDGET', 2048)),
+    budgets=parse_budgets(os.environ.get('PROMPT_TOKEN_BUDGETS', ''))
+)
+
+# Per-session chat history sent to Ollama, reused across turns
+conversation_engine = ConversationEngine(
+    max_messages=int(os.environ.get('CONVERSATION_MAX_MESSAGES', 40)),
+    keep_alive=os.environ.get('OLLAMA_KEEP_ALIVE', '30m')
+)
+
+# Messages, metrics and ratings are committed in batches by a writer in its
+# own OS thread so a slow SQLite commit never blocks the eventlet hub
+persistence_queue = WriteBehindQueue(
+    app,
+    batch_size=int(os.environ.get('PERSIST_BATCH_SIZE', 64)),
+    flush_ms=int(os.environ.get('PERSIST_FLUSH_MS', 25)),
+    on_connect=configure_sqlite_connection
+)
+persistence_queue.start(socketio)
+atexit.register(persistence_queue.close)
+
+# Messages of sessions idle for ARCHIVE_AFTER_DAYS move to compressed
+# segment files and come back the next time the session is opened. Opt-in,
+# since archived messages drop out of message search until then.
+session_archive = SessionArchive(
+    app,
+    directory=os.environ.get('ARCHIVE_DIR', os.path.join(app.instance_path, 'archive')),
+    writer=persistence_queue,
+    max_idle_days=int(os.environ.get('ARCHIVE_AFTER_DAYS', 0)),
+    segment_bytes=int(os.environ.get('ARCHIVE_SEGMENT_MB', 64)) * 1024 * 1024,
+    interval_hours=float(os.environ.get('ARCHIVE_INTERVAL_HOURS', 6))
+)
+session_archive.start(socketio, is_busy=lambda: generation_scheduler.stats()['active'] > 0)
+
+def sql_rows(sql, params):
+    """Run raw SQL on the app's session; the execute() used by user_stats and usage_rollup"""
+    return db.session.execute(db.text(sql), params).fetchall()
+
 def get_system_config(key, default=None):
-    """Get a system configuration value"""
-    config = SystemConfig.query.filter_by(key=key).first()
-    return config.value if config else default
+    """Get a system configuration value from the in-memory cache"""
+    return config_cache.get(key, default)
 
 def set_system_config(key, value, description=None, user_id=None):
-    """Set a system configuration value"""
-    config = SystemConfig.query.filter_by(key=key).first()
-    if config:
-        config.value = value
-        config.updated_at = datetime.utcnow()
-        config.updated_by = user_id
-    else:
-        config = SystemConfig(
-            key=key,
-            value=value,
-            description=description,
-            updated_by=user_id
-        )
-        db.session.add(config)
-    db.session.commit()
-    return config
+    """Set a system configuration value (writes through to the database)"""
+    return config_cache.set(key, value, description, user_id)
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -149,36 +264,60 @@ AVAILABLE_MODELS = [
 ]
 
 def get_available_models():
-    """Get list of available models from Ollama"""
-    try:
-        response = requests.get('http://localhost:11434/api/tags', timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            models = [model['name'] for model in data.get('models', [])]
-            # Always include tinyllama as fallback
-            if models and 'tinyllama' not in models:
-                models.insert(0, 'tinyllama')
-            return models if models else ['tinyllama'] + AVAILABLE_MODELS
-        else:
-            print(f"Failed to get models from Ollama: {response.status_code}")
-            return ['tinyllama'] + AVAILABLE_MODELS
-    except Exception as e:
-        print(f"Error getting models from Ollama: {e}")
-        return ['tinyllama'] + AVAILABLE_MODELS
+    """Get list of available models from the cached Ollama catalogue"""
+    models = model_catalog.names()
+    # Always include tinyllama as fallback
+    if models and 'tinyllama' not in models:
+        models.insert(0, 'tinyllama')
+    return models if models else ['tinyllama'] + AVAILABLE_MODELS
+
+def preload_model(model_name):
+    """Load a model into memory in the background (an empty generate with keep_alive).
+
+    Used while a web search runs so a cold model load overlaps the search
+    instead of adding to time-to-first-token. Skipped while a generation is
+    running, since loading another model could evict the one in use.
+    """
+    if generation_scheduler.stats()['active']:
+        return False
+    
+    def load():
+        try:
+            started = time.time()
+            response = ollama_client.post('/api/generate', json={
+                'model': model_name,
+                'keep_alive': conversation_engine.keep_alive
+            })
+            print(f"Preloaded {model_name} in {time.time() - started:.2f}s (HTTP {response.status_code})")
+        except Exception as e:
+            print(f"Model preload failed for {model_name}: {e}")
+    
+    socketio.start_background_task(load)
+    return True
 
 # Web search functionality
-def should_search_web(message):
-    """Determine if a message should trigger a web search"""
-    search_keywords = [
-        'latest', 'recent', 'current', 'today', 'news', 'search', 'find',
-        'what is happening', 'what happened', 'when did', 'price of',
-        'weather', 'stock', 'current events', 'breaking news',
-        'latest news', 'recent news', 'search for', 'look up', 'now',
-        'currently', 'this year', 'this month', 'update', 'status'
-    ]
-    
-    message_lower = message.lower()
-    triggered_keywords = [keyword for keyword in search_keywords if keyword in message_lower]
+WEB_SEARCH_MODES = ('auto', 'on', 'off')
+
+def should_search_web(message, mode='auto'):
+    """Determine if a message should trigger a web search.
+
+    mode is the session's override: 'on' and 'off' skip the classifier.
+    """
+    if mode == 'on':
+        print("Web search forced on for this session")
+        return True
+    if mode == 'off':
+        return False
+    
+    try:
+        classifier = classifier_for(
+            get_system_config('search_trigger_patterns') or None,
+            get_system_config('search_negative_patterns') or None
+        )
+    except re.error as e:
+        print(f"Invalid search intent patterns, using defaults: {e}")
+        classifier = classifier_for()
+    triggered_keywords = classifier.matches(message)
     
     if triggered_keywords:
         print(f"Web search triggered by keywords: {triggered_keywords}")
@@ -187,113 +326,208 @@ def should_search_web(message):
     print(f"No web search keywords detected in: '{message}'")
     return False
 
-def search_web(query, max_results=3):
-    """Search the web using DuckDuckGo and return relevant results"""
+# One deadline for the whole search (DuckDuckGo + page fetches), and how many
+# result pages are fetched at the same time
+SEARCH_DEADLINE_SECONDS = float(os.environ.get('SEARCH_DEADLINE_SECONDS', 8))
+SEARCH_FETCH_WORKERS = int(os.environ.get('SEARCH_FETCH_WORKERS', 3))
+
+# Query -> result list and URL -> snippet caches, so repeated searches skip
+# DuckDuckGo and unchanged pages are only revalidated
+search_cache = SearchCache(
+    query_ttl=int(os.environ.get('SEARCH_QUERY_TTL', 600)),
+    page_ttl=int(os.environ.get('SEARCH_PAGE_TTL', 3600)),
+    max_queries=int(os.environ.get('SEARCH_CACHE_QUERIES', 256)),
+    max_pages=int(os.environ.get('SEARCH_CACHE_PAGES', 1024)),
+    path=os.environ.get('SEARCH_CACHE_PATH', os.path.join(app.instance_path, 'search_cache.db')) or None,
+    max_disk_bytes=int(os.environ.get('SEARCH_CACHE_MAX_DISK_MB', 16)) * 1024 * 1024
+)
+
+# Stop downloading a result page after this many bytes when extracting its snippet
+SNIPPET_MAX_BYTES = int(os.environ.get('SNIPPET_MAX_KB', 256)) * 1024
+
+# Offline full-text index of fetched pages and admin documents, asked before
+# DuckDuckGo and used as the fallback when the network is down
+local_index = LocalIndex(os.environ.get('LOCAL_INDEX_PATH', os.path.join(app.instance_path, 'local_index.db')))
+LOCAL_INDEX_MAX_AGE = int(os.environ.get('LOCAL_INDEX_MAX_AGE_HOURS', 6)) * 3600
+LOCAL_INDEX_MIN_RESULTS = int(os.environ.get('LOCAL_INDEX_MIN_RESULTS', 2))
+# Fetched pages are always indexed with their snippet text; reading past the
+# snippet for a fuller page text is opt-in
+LOCAL_INDEX_WEB_PAGES = os.environ.get('LOCAL_INDEX_WEB_PAGES', 'false').lower() == 'true'
+LOCAL_INDEX_TEXT_CHARS = int(os.environ.get('LOCAL_INDEX_TEXT_CHARS', 2000))
+
+def search_web(query, max_results=3, on_progress=None, on_results=None):
+    """Search the web using DuckDuckGo and return relevant results.
+
+    Result pages are fetched concurrently; anything still loading when the
+    overall deadline passes is dropped and the rest is returned in rank order.
+    on_results(results) is called once the result list is known, and
+    on_progress(completed, total, result) as each page finishes.
+    """
     try:
         print(f"Starting web search for: '{query}'")
+        deadline_at = time.monotonic() + SEARCH_DEADLINE_SECONDS
         
-        # Use DuckDuckGo search (no API key required)
-        search_url = f"https://html.duckduckgo.com/html/?q={urllib.parse.quote(query)}"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        print(f"Sending request to DuckDuckGo: {search_url}")
-        response = requests.get(search_url, headers=headers, timeout=10)
-        if response.status_code != 200:
-            print(f"Search request failed with status code: {response.status_code}")
-            return None
-        
-        print("Parsing search results...")
-        soup = BeautifulSoup(response.content, 'html.parser')
-        results = []
+        # Fresh local matches for every query term answer without the network
+        local_results = local_index.search(query, limit=max_results, max_age=LOCAL_INDEX_MAX_AGE)
+        if local_results and len(local_results) >= min(LOCAL_INDEX_MIN_RESULTS, max_results):
+            print(f"Using {len(local_results)} results from the local index")
+            return local_results
         
-        # Find search result links
-        result_links = soup.find_all('a', {'class': 'result__a'})
-        print(f"Found {len(result_links)} potential search result links")
-        
-        for i, link in enumerate(result_links[:max_results]):
-            if link.get('href'):
-                url = link.get('href')
-                title = link.get_text(strip=True)
-                
-                print(f"Processing result {i+1}: {title[:50]}...")
-                print(f"  URL: {url}")
-                
-                # Try to get a snippet of content from the page
-                snippet = get_page_snippet(url)
-                print(f"  Content snippet length: {len(snippet)} characters")
-                
-                results.append({
-                    'title': title,
-                    'url': url,
-                    'snippet': snippet
-                })
+        results = search_cache.get_query(query)
+        if results is not None:
+            print(f"Using {len(results)} cached search results")
+        else:
+            try:
+                results = search_duckduckgo(query, max_results)
+            except requests.exceptions.RequestException as e:
+                print(f"Search request failed: {e}")
+                results = None
+            if results is None:
+                return search_local_fallback(query, max_results)
+            if results:
+                search_cache.put_query(query, results)
+        results = [dict(result, snippet=None) for result in results[:max_results]]
+        if on_results and results:
+            on_results(results)
+        
+        # Fetch the result pages in parallel until the deadline
+        snippets = fetch_snippets(results, deadline_at, on_progress)
+        
+        for index, result in enumerate(results):
+            result['snippet'] = snippets.get(index)
+        results = [result for result in results if result['snippet'] is not None]
         
         print(f"Successfully processed {len(results)} search results")
-        return results if results else None
+        return results if results else search_local_fallback(query, max_results)
         
     except Exception as e:
         print(f"Web search error: {e}")
         return None
 
-def get_page_snippet(url, max_length=300):
-    """Get a snippet of text content from a web page"""
+def search_local_fallback(query, max_results=3):
+    """Best local matches of any age when the web is unreachable (None if nothing matches)"""
+    results = local_index.search(query, limit=max_results, match_any=True)
+    if results:
+        print(f"Web search unavailable, using {len(results)} results from the local index")
+    return results or None
+
+def search_duckduckgo(query, max_results=3):
+    """Query DuckDuckGo and return [{'title', 'url'}], or None if the request failed"""
+    # Use DuckDuckGo search (no API key required)
+    search_url = f"https://html.duckduckgo.com/html/?q={urllib.parse.quote(query)}"
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    }
+    
+    print(f"Sending request to DuckDuckGo: {search_url}")
+    response = requests.get(search_url, headers=headers, timeout=min(10, SEARCH_DEADLINE_SECONDS))
+    if response.status_code != 200:
+        print(f"Search request failed with status code: {response.status_code}")
+        return None
+    
+    print("Parsing search results...")
+    soup = BeautifulSoup(response.content, 'html.parser')
+    results = []
+    
+    # Find search result links
+    result_links = soup.find_all('a', {'class': 'result__a'})
+    print(f"Found {len(result_links)} potential search result links")
+    
+    for i, link in enumerate(result_links[:max_results]):
+        if link.get('href'):
+            url = link.get('href')
+            title = link.get_text(strip=True)
+            
+            print(f"Processing result {i+1}: {title[:50]}...")
+            print(f"  URL: {url}")
+            
+            results.append({
+                'title': title,
+                'url': url
+            })
+    return results
+
+def fetch_snippets(results, deadline_at, on_progress=None):
+    """Fetch page snippets with a small pool of background tasks.
+
+    Returns {result index: snippet} for the pages that finished before
+    deadline_at; slower pages keep running in the background but are ignored.
+    """
+    pending = list(enumerate(results))
+    snippets = {}
+    
+    def worker():
+        while pending and time.monotonic() < deadline_at:
+            index, result = pending.pop(0)
+            remaining = max(0.5, deadline_at - time.monotonic())
+            snippets[index] = get_page_snippet(result['url'], timeout=min(5, remaining), title=result['title'])
+    
+    for _ in range(min(SEARCH_FETCH_WORKERS, len(pending))):
+        socketio.start_background_task(worker)
+    
+    # Report pages as they complete, in completion order
+    finished = {}
+    while len(finished) < len(results) and time.monotonic() < deadline_at:
+        socketio.sleep(0.05)
+        for index in [i for i in list(snippets) if i not in finished]:
+            finished[index] = snippets[index]
+            print(f"  Content snippet {index + 1} length: {len(finished[index])} characters")
+            if on_progress:
+                on_progress(len(finished), len(results), results[index])
+    
+    if len(finished) < len(results):
+        print(f"Search deadline reached, dropping {len(results) - len(finished)} slow page(s)")
+    return finished
+
+def get_page_snippet(url, max_length=300, timeout=5, title=None):
+    """Get a snippet of text content from a web page (cached per URL, revalidated when stale).
+
+    The extracted text is added to the local retrieval index. With
+    LOCAL_INDEX_WEB_PAGES, up to LOCAL_INDEX_TEXT_CHARS of page text is read
+    for it; otherwise reading stops at the snippet.
+    """
     try:
+        cached = search_cache.get_page(url)
+        if cached and cached['fresh']:
+            print(f"    Using cached content for: {url[:60]}")
+            return cached['snippet']
+        
         print(f"    Fetching content from: {url[:60]}...")
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        if cached:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+        
+        # Stream the body and stop as soon as enough visible text has been parsed
+        with requests.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304 and cached:
+                print("    Content unchanged, reusing cached snippet")
+                search_cache.revalidated(url)
+                local_index.touch(url)
+                return cached['snippet']
+            if response.status_code != 200:
+                print(f"    Failed to fetch content: HTTP {response.status_code}")
+                return "Content not available"
+            
+            read_full_page = LOCAL_INDEX_WEB_PAGES and local_index.enabled
+            read_length = max(max_length, LOCAL_INDEX_TEXT_CHARS) if read_full_page else max_length
+            text, bytes_read = snippet_from_response(response, read_length, SNIPPET_MAX_BYTES)
         
-        response = requests.get(url, headers=headers, timeout=5)
-        if response.status_code != 200:
-            print(f"    Failed to fetch content: HTTP {response.status_code}")
-            return "Content not available"
-        
-        print(f"    Successfully fetched {len(response.content)} bytes")
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-        
-        # Get text content
-        text = soup.get_text()
-        
-        # Clean up text
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks if chunk)
-        
-        # Return first part of text
+        if local_index.enabled:
+            local_index.add_page(url, title, text[:LOCAL_INDEX_TEXT_CHARS])
         result = text[:max_length] + "..." if len(text) > max_length else text
-        print(f"    Extracted snippet: {len(result)} characters")
+        print(f"    Extracted snippet: {len(result)} characters from {bytes_read} bytes")
+        search_cache.put_page(url, result, response.headers.get('ETag'), response.headers.get('Last-Modified'))
         return result
         
     except Exception as e:
         print(f"    Error fetching content: {e}")
         return "Content not available"
 
-def format_search_results(results):
-    """Format search results for the LLM"""
-    if not results:
-        return "No search results found."
-    
-    formatted = "[WEB_SEARCH_START]=== WEB SEARCH RESULTS ===[WEB_SEARCH_END]\n\n"
-    formatted += f"[WEB_SEARCH_START]Search completed successfully. Found {len(results)} relevant sources:[WEB_SEARCH_END]\n\n"
-    
-    for i, result in enumerate(results, 1):
-        formatted += f"[WEB_SEARCH_START]Source {i} of {len(results)}:[WEB_SEARCH_END]\n"
-        formatted += f"[WEB_SEARCH_START]Title: {result['title']}[WEB_SEARCH_END]\n"
-        formatted += f"[WEB_SEARCH_START]URL: {result['url']}[WEB_SEARCH_END]\n"
-        formatted += f"[WEB_SEARCH_START]Content Summary: {result['snippet']}[WEB_SEARCH_END]\n"
-        formatted += "[WEB_SEARCH_START]" + "-" * 60 + "[WEB_SEARCH_END]\n\n"
-    
-    formatted += "[WEB_SEARCH_START]Please use the above information to provide an accurate, current response.[WEB_SEARCH_END]\n"
-    formatted += "[WEB_SEARCH_START]When referencing these sources, mention them by their source number (e.g., 'According to Source 1...').[WEB_SEARCH_END]\n\n"
-    
-    return formatted
-
 @app.route('/')
 def index():
     # Check if user is already authenticated (including remember me)
@@ -428,32 +662,51 @@ def feedback():
     
     return render_template('feedback.html', form=form)
 
+# Sidebar sessions and chat messages are served newest first, one page at a time
+SESSION_PAGE_SIZE = int(os.environ.get('SESSION_PAGE_SIZE', 30))
+MESSAGE_PAGE_SIZE = int(os.environ.get('MESSAGE_PAGE_SIZE', 50))
+
+def session_summary(session):
+    """Sidebar entry for a chat session, with its parameters"""
+    return {
+        'id': session.id,
+        'title': session.title,
+        'model_name': session.model_name,
+        'created_at': session.created_at,
+        'parameters': {
+            'temperature': session.temperature,
+            'max_tokens': session.max_tokens,
+            'top_p': session.top_p,
+            'top_k': session.top_k,
+            'repeat_penalty': session.repeat_penalty,
+            'web_search': session.web_search or 'auto'
+        }
+    }
+
 @app.route('/chat')
 @login_required
 def chat():
-    sessions = ChatSession.query.filter_by(user_id=current_user.id).order_by(ChatSession.created_at.desc()).all()
+    # Only the newest page is rendered; older sessions are fetched from /api/sessions
+    sessions, sessions_cursor = keyset_page(
+        ChatSession.query.filter_by(user_id=current_user.id),
+        ChatSession.created_at, ChatSession.id,
+        limit=SESSION_PAGE_SIZE
+    )
     
-    # Get the session parameter if provided
+    # Get the session (and message, from a search hit) parameters if provided
     selected_session_id = request.args.get('session', type=int)
+    selected_message_id = request.args.get('message', type=int)
     
-    # Convert sessions to dictionaries with parameters
-    sessions_data = []
-    for session in sessions:
-        sessions_data.append({
-            'id': session.id,
-            'title': session.title,
-            'model_name': session.model_name,
-            'created_at': session.created_at,
-            'parameters': {
-                'temperature': session.temperature,
-                'max_tokens': session.max_tokens,
-                'top_p': session.top_p,
-                'top_k': session.top_k,
-                'repeat_penalty': session.repeat_penalty
-            }
-        })
+    # An older selected session is pinned to the top of the first page
+    if selected_session_id and selected_session_id not in [session.id for session in sessions]:
+        selected = ChatSession.query.filter_by(id=selected_session_id, user_id=current_user.id).first()
+        if selected:
+            sessions.insert(0, selected)
     
-    return render_template('chat.html', sessions=sessions_data, selected_session=selected_session_id)
+    sessions_data = [session_summary(session) for session in sessions]
+    
+    return render_template('chat.html', sessions=sessions_data, sessions_cursor=sessions_cursor,
+                           selected_session=selected_session_id, selected_message=selected_message_id)
 
 @app.route('/admin')
 @login_required
@@ -462,18 +715,17 @@ def admin():
         flash('Access denied. Admin privileges required.')
         return redirect(url_for('chat'))
     
-    # Get statistics
+    # Get statistics (session and message totals come from the hourly rollups)
     total_users = User.query.count()
-    total_sessions = ChatSession.query.count()
-    total_messages = ChatMessage.query.count()
+    usage_totals = usage_rollup.totals(sql_rows)
+    total_sessions = usage_totals['sessions']
+    total_messages = usage_totals['messages']
     
     # Get model usage statistics
-    model_stats = db.session.query(
-        ChatSession.model_name,
-        db.func.count(ChatSession.id).label('usage_count'),
-        db.func.avg(ModelRating.rating).label('avg_rating')
-    ).outerjoin(ModelRating, ChatSession.id == ModelRating.session_id)\
-     .group_by(ChatSession.model_name).all()
+    model_stats = usage_rollup.by_model(sql_rows)
+    
+    # Latency percentiles per model over the last day
+    model_latency = latency_summary(hours=24)['models']
     
     # Get recent activity
     recent_sessions = ChatSession.query.order_by(ChatSession.created_at.desc()).limit(10).all()
@@ -486,10 +738,79 @@ def admin():
                          total_sessions=total_sessions,
                          total_messages=total_messages,
                          model_stats=model_stats,
+                         model_latency=model_latency,
                          recent_sessions=recent_sessions,
                          user_feedback=user_feedback,
+                         response_cache_stats=response_cache.stats(),
+                         search_trigger_patterns=get_system_config('search_trigger_patterns') or DEFAULT_PATTERNS,
+                         search_negative_patterns=get_system_config('search_negative_patterns') or DEFAULT_NEGATIVE_PATTERNS,
                          system_prompt=get_system_config('system_prompt', ''))
 
+@app.route('/api/admin/documents', methods=['GET', 'POST'])
+@login_required
+def admin_documents():
+    """List or add documents in the offline retrieval index"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        title = data.get('title', '').strip()
+        body = data.get('body', '').strip()
+        if not title or not body:
+            return jsonify({'error': 'Title and content are required'}), 400
+        document_id = local_index.add_document(title, body, data.get('url', '').strip())
+        if document_id is None:
+            return jsonify({'error': 'Local index is not available'}), 503
+        return jsonify({'status': 'success', 'id': document_id})
+    
+    return jsonify({'documents': local_index.documents(), 'stats': local_index.stats()})
+
+@app.route('/api/admin/documents/<int:document_id>', methods=['DELETE'])
+@login_required
+def delete_admin_document(document_id):
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    if not local_index.delete_document(document_id):
+        return jsonify({'error': 'Document not found'}), 404
+    return jsonify({'status': 'success'})
+
+@app.route('/api/admin/archive', methods=['GET', 'POST'])
+@login_required
+def admin_archive():
+    """Archive statistics; POST archives idle sessions now instead of waiting for the next run"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    if request.method == 'POST':
+        if not session_archive.enabled:
+            return jsonify({'error': 'Archiving is disabled (ARCHIVE_AFTER_DAYS=0)'}), 400
+        persistence_queue.wait_for(None, socketio.sleep)
+        archived = session_archive.archive_idle(socketio.sleep)
+        return jsonify({'status': 'success', 'archived': archived, 'stats': session_archive.stats()})
+    
+    return jsonify({'stats': session_archive.stats()})
+
+@app.route('/api/admin/latency')
+@login_required
+def admin_latency():
+    """Per-model TTFT and tokens/sec percentiles from the hourly telemetry rollups"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    hours = max(1, min(24 * 90, request.args.get('hours', 24, type=int)))
+    try:
+        return jsonify({
+            'status': 'success',
+            **latency_summary(hours=hours)
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Error reading latency telemetry: {str(e)}'
+        }), 500
+
 @app.route('/admin/system-config', methods=['POST'])
 @login_required
 def update_system_config():
@@ -511,6 +832,33 @@ def update_system_config():
         'message': 'System prompt updated successfully'
     })
 
+@app.route('/admin/search-intent', methods=['POST'])
+@login_required
+def update_search_intent():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    data = request.get_json()
+    patterns = data.get('trigger_patterns', '').strip()
+    negative_patterns = data.get('negative_patterns', '').strip()
+    
+    # Reject patterns that would fail at message time
+    try:
+        compile_patterns(patterns)
+        compile_patterns(negative_patterns)
+    except re.error as e:
+        return jsonify({'error': f'Invalid pattern: {e}'}), 400
+    
+    set_system_config('search_trigger_patterns', patterns,
+                      'Phrases that trigger a web search (empty uses the built-in list)', current_user.id)
+    set_system_config('search_negative_patterns', negative_patterns,
+                      'Phrases that never trigger a web search (empty uses the built-in list)', current_user.id)
+    
+    return jsonify({
+        'status': 'success',
+        'message': 'Web search triggers updated successfully'
+    })
+
 @app.route('/admin/save-default-parameters', methods=['POST'])
 @login_required
 def save_default_parameters():
@@ -560,11 +908,11 @@ def get_default_parameters():
     """Get current default parameters set by admin"""
     try:
         defaults = {
-            'temperature': float(get_system_config('default_temperature', '0.7')),
-            'max_tokens': int(get_system_config('default_max_tokens', '2048')),
-            'top_p': float(get_system_config('default_top_p', '0.9')),
-            'top_k': int(get_system_config('default_top_k', '50')),
-            'repeat_penalty': float(get_system_config('default_repeat_penalty', '1.0'))
+            'temperature': config_cache.get_float('default_temperature', 0.7),
+            'max_tokens': config_cache.get_int('default_max_tokens', 2048),
+            'top_p': config_cache.get_float('default_top_p', 0.9),
+            'top_k': config_cache.get_int('default_top_k', 50),
+            'repeat_penalty': config_cache.get_float('default_repeat_penalty', 1.0)
         }
         
         return jsonify({
@@ -646,7 +994,8 @@ def get_models():
         models = get_available_models()
         return jsonify({
             'status': 'success',
-            'models': models
+            'models': models,
+            'details': model_catalog.all()
         })
     except Exception as e:
         return jsonify({
@@ -695,7 +1044,6 @@ def download_model():
 def download_model_with_progress(model_name, user_id):
     """Download model with real-time progress updates via WebSocket"""
     try:
-        url = f"{OLLAMA_BASE_URL}/api/pull"
         payload = {"name": model_name}
         
         # Emit start event to all clients (simplified)
@@ -707,62 +1055,63 @@ def download_model_with_progress(model_name, user_id):
         })
         
         print(f"Starting download of {model_name}")
-        response = requests.post(url, json=payload, stream=True, timeout=1800)
-        
-        if response.status_code != 200:
-            socketio.emit('download_progress', {
-                'model': model_name,
-                'status': 'error',
-                'message': f'Failed to start download: {response.text}',
-                'progress': 0
-            })
-            return
-        
-        print(f"Download response status: {response.status_code}")
-        
-        # Process streaming response
-        for line in response.iter_lines():
-            if line:
-                try:
-                    progress_data = json.loads(line.decode('utf-8'))
-                    print(f"Progress data: {progress_data}")
-                    
-                    # Extract progress information
-                    status = progress_data.get('status', '')
-                    total = progress_data.get('total', 0)
-                    completed = progress_data.get('completed', 0)
-                    
-                    # Calculate progress percentage
-                    progress = 0
-                    if total > 0:
-                        progress = int((completed / total) * 100)
-                    
-                    # Emit progress update to all clients
-                    socketio.emit('download_progress', {
-                        'model': model_name,
-                        'status': 'downloading',
-                        'message': f'{status}: {progress}%' if status else f'Downloading: {progress}%',
-                        'progress': progress,
-                        'completed': completed,
-                        'total': total
-                    })
-                    
-                    # Check if download is complete
-                    if progress >= 100 or 'success' in status.lower() or status == 'success':
+        with ollama_client.post('/api/pull', json=payload, stream=True) as response:
+            if response.status_code != 200:
+                socketio.emit('download_progress', {
+                    'model': model_name,
+                    'status': 'error',
+                    'message': f'Failed to start download: {response.text}',
+                    'progress': 0
+                })
+                return
+            
+            print(f"Download response status: {response.status_code}")
+            
+            # Process streaming response
+            for line in response.iter_lines():
+                if line:
+                    try:
+                        progress_data = json.loads(line.decode('utf-8'))
+                        print(f"Progress data: {progress_data}")
+                        
+                        # Extract progress information
+                        status = progress_data.get('status', '')
+                        total = progress_data.get('total', 0)
+                        completed = progress_data.get('completed', 0)
+                        
+                        # Calculate progress percentage
+                        progress = 0
+                        if total > 0:
+                            progress = int((completed / total) * 100)
+                        
+                        # Emit progress update to all clients
                         socketio.emit('download_progress', {
                             'model': model_name,
-                            'status': 'completed',
-                            'message': f'Successfully downloaded {model_name}!',
-                            'progress': 100
+                            'status': 'downloading',
+                            'message': f'{status}: {progress}%' if status else f'Downloading: {progress}%',
+                            'progress': progress,
+                            'completed': completed,
+                            'total': total
                         })
-                        print(f"Download completed: {model_name}")
-                        break
                         
-                except json.JSONDecodeError:
-                    continue
-                except Exception as e:
-                    print(f"Error processing progress line: {e}")
-                    continue
+                        # Check if download is complete
+                        if progress >= 100 or 'success' in status.lower() or status == 'success':
+                            socketio.emit('download_progress', {
+                                'model': model_name,
+                                'status': 'completed',
+                                'message': f'Successfully downloaded {model_name}!',
+                                'progress': 100
+                            })
+                            print(f"Download completed: {model_name}")
+                            # Make the new model show up without waiting for the TTL
+                            model_catalog.invalidate()
+                            break
+                            
+                    except json.JSONDecodeError:
+                        continue
+                    except Exception as e:
+                        print(f"Error processing progress line: {e}")
+                        continue
                     
     except Exception as e:
         print(f"Download error: {e}")
@@ -773,6 +1122,27 @@ def download_model_with_progress(model_name, user_id):
             'progress': 0
         })
 
+@app.route('/api/sessions')
+@login_required
+def list_sessions():
+    """A page of the user's sessions, newest first; pass next_cursor back as ?before="""
+    limit = max(1, min(100, request.args.get('limit', SESSION_PAGE_SIZE, type=int)))
+    try:
+        sessions, next_cursor = keyset_page(
+            ChatSession.query.filter_by(user_id=current_user.id),
+            ChatSession.created_at, ChatSession.id,
+            before=request.args.get('before'), limit=limit
+        )
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    
+    sessions_data = []
+    for session in sessions:
+        data = session_summary(session)
+        data['created_at'] = session.created_at.isoformat()
+        sessions_data.append(data)
+    return jsonify({'sessions': sessions_data, 'next_cursor': next_cursor})
+
 @app.route('/api/sessions', methods=['POST'])
 @login_required
 def create_session():
@@ -840,6 +1210,9 @@ def create_session():
         top_p = max(0.1, min(1.0, top_p))
         top_k = max(1, min(100, top_k))
         repeat_penalty = max(0.5, min(2.0, repeat_penalty))
+        web_search = data.get('web_search', 'auto')
+        if web_search not in WEB_SEARCH_MODES:
+            web_search = 'auto'
 
         session = ChatSession(
             user_id=current_user.id,
@@ -849,7 +1222,8 @@ def create_session():
             max_tokens=max_tokens,
             top_p=top_p,
             top_k=top_k,
-            repeat_penalty=repeat_penalty
+            repeat_penalty=repeat_penalty,
+            web_search=web_search
         )
         db.session.add(session)
         db.session.commit()
@@ -872,7 +1246,8 @@ def create_session():
                 'max_tokens': session.max_tokens,
                 'top_p': session.top_p,
                 'top_k': session.top_k,
-                'repeat_penalty': session.repeat_penalty
+                'repeat_penalty': session.repeat_penalty,
+                'web_search': session.web_search or 'auto'
             },
             'status': 'success'
         })
@@ -891,13 +1266,25 @@ def delete_session(session_id):
     if not session:
         return jsonify({'error': 'Session not found or access denied'}), 404
     
+    # Let queued messages land first so none are written after the delete
+    persistence_queue.wait_for(session_id, socketio.sleep)
+    # Bring archived messages back so deleting them also takes them out of the usage rollups
+    if session.archived_at:
+        session_archive.restore(session_id, socketio.sleep)
+    
     # Delete associated messages and ratings first (cascade delete)
+    message_ids = db.session.query(ChatMessage.id).filter_by(session_id=session_id)
+    MessageMetrics.query.filter(MessageMetrics.message_id.in_(message_ids)).delete(synchronize_session=False)
     ChatMessage.query.filter_by(session_id=session_id).delete()
     ModelRating.query.filter_by(session_id=session_id).delete()
+    # Still set if the archived messages could not be read back
+    ArchivedSession.query.filter_by(session_id=session_id).delete()
+    ArchivedMessageDay.query.filter_by(session_id=session_id).delete()
     
     # Delete the session
     db.session.delete(session)
     db.session.commit()
+    conversation_engine.invalidate(session_id)
     
     return jsonify({'status': 'success', 'message': 'Session deleted successfully'})
 
@@ -922,6 +1309,8 @@ def update_session_parameters(session_id):
         session.top_k = max(1, min(100, int(data['top_k'])))
     if 'repeat_penalty' in data:
         session.repeat_penalty = max(0.5, min(2.0, float(data['repeat_penalty'])))
+    if data.get('web_search') in WEB_SEARCH_MODES:
+        session.web_search = data['web_search']
     
     session.updated_at = datetime.utcnow()
     db.session.commit()
@@ -933,22 +1322,56 @@ def update_session_parameters(session_id):
             'max_tokens': session.max_tokens,
             'top_p': session.top_p,
             'top_k': session.top_k,
-            'repeat_penalty': session.repeat_penalty
+            'repeat_penalty': session.repeat_penalty,
+            'web_search': session.web_search or 'auto'
         }
     })
 
 @app.route('/api/sessions/<int:session_id>/messages')
 @login_required
 def get_messages(session_id):
+    """A page of messages, newest page first but oldest first within the page.
+
+    Pass next_cursor back as ?before= to get the page of older messages.
+    """
     session = ChatSession.query.filter_by(id=session_id, user_id=current_user.id).first_or_404()
-    messages = ChatMessage.query.filter_by(session_id=session_id).order_by(ChatMessage.timestamp).all()
+    persistence_queue.wait_for(session_id, socketio.sleep)
+    if session.archived_at:
+        session_archive.restore(session_id, socketio.sleep)
+        conversation_engine.invalidate(session_id)
+    limit = max(1, min(200, request.args.get('limit', MESSAGE_PAGE_SIZE, type=int)))
+    try:
+        messages, next_cursor = keyset_page(
+            ChatMessage.query.filter_by(session_id=session_id),
+            ChatMessage.timestamp, ChatMessage.id,
+            before=request.args.get('before'), limit=limit
+        )
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify([{
-        'id': msg.id,
-        'role': msg.role,
-        'content': msg.content,
-        'timestamp': msg.timestamp.isoformat()
-    } for msg in messages])
+    return jsonify({
+        'messages': [{
+            'id': msg.id,
+            'role': msg.role,
+            'content': msg.content,
+            'timestamp': msg.timestamp.isoformat()
+        } for msg in reversed(messages)],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/search/messages')
+@login_required
+def search_messages():
+    """Ranked full-text search over the current user's chat history"""
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(50, request.args.get('limit', 20, type=int)))
+    if not query:
+        return jsonify({'query': query, 'results': [], 'took_ms': 0.0})
+    if not message_search.available():
+        return jsonify({'error': 'Message search is not available on this database'}), 501
+    
+    results, took_ms = message_search.search_messages(current_user.id, query, limit)
+    return jsonify({'query': query, 'results': results, 'took_ms': took_ms})
 
 @app.route('/api/rate', methods=['POST'])
 @login_required
@@ -956,30 +1379,36 @@ def rate_response():
     data = request.get_json()
     session_id = data.get('session_id')
     rating = data.get('rating')
+    # The write is queued, so a bad rating has to be rejected here
+    if not isinstance(rating, int) or isinstance(rating, bool) or not 1 <= rating <= 5:
+        return jsonify({'error': 'rating must be an integer from 1 to 5'}), 400
     
     session = ChatSession.query.filter_by(id=session_id, user_id=current_user.id).first_or_404()
+    user_id = current_user.id
+    model_name = session.model_name
     
-    # Check if rating already exists
-    existing_rating = ModelRating.query.filter_by(session_id=session_id, user_id=current_user.id).first()
-    if existing_rating:
-        existing_rating.rating = rating
-    else:
-        model_rating = ModelRating(
-            session_id=session_id,
-            user_id=current_user.id,
-            model_name=session.model_name,
-            rating=rating
-        )
-        db.session.add(model_rating)
+    def write():
+        # Check if rating already exists
+        existing_rating = ModelRating.query.filter_by(session_id=session_id, user_id=user_id).first()
+        if existing_rating:
+            existing_rating.rating = rating
+        else:
+            model_rating = ModelRating(
+                session_id=session_id,
+                user_id=user_id,
+                model_name=model_name,
+                rating=rating
+            )
+            db.session.add(model_rating)
     
-    db.session.commit()
+    persistence_queue.submit(session_id, write)
     return jsonify({'status': 'success'})
 
 @app.route('/api/ollama/status')
 @login_required
 def ollama_status():
     try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
+        response = ollama_client.get('/api/tags')
         if response.status_code == 200:
             return jsonify({'status': 'online', 'models': response.json()})
         else:
@@ -990,57 +1419,69 @@ def ollama_status():
 @app.route('/api/export/chat-data')
 @login_required
 def export_chat_data():
+    """Stream all chat sessions as NDJSON (or ?format=json), gzipped with ?compress=gzip.
+
+    ?since=<ISO time> exports only sessions created or messaged since then;
+    the X-Export-Until header of one export is the since= of the next.
+    """
     if not current_user.is_admin:
         return jsonify({'error': 'Access denied'}), 403
     
-    # Export all chat data as JSON
-    sessions = ChatSession.query.all()
-    data = []
-    
-    for session in sessions:
-        session_data = {
-            'id': session.id,
-            'user': session.user.username,
-            'model': session.model_name,
-            'title': session.title,
-            'created_at': session.created_at.isoformat(),
-            'messages': []
+    since = request.args.get('since')
+    if since:
+        try:
+            since = datetime.fromisoformat(since.replace('Z', '+00:00'))
+        except ValueError:
+            return jsonify({'error': 'since must be an ISO 8601 time'}), 400
+        if since.tzinfo:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    fmt = 'json' if request.args.get('format') == 'json' else 'ndjson'
+    compress = request.args.get('compress') == 'gzip'
+    
+    # Messages stamped before `until` are exported now, later ones next time;
+    # write out anything still queued so none of them is missed
+    until = datetime.utcnow()
+    persistence_queue.wait_for(None, socketio.sleep)
+    
+    filename = f"chat-data-{until.strftime('%Y%m%dT%H%M%S')}.{fmt}" + ('.gz' if compress else '')
+    return Response(
+        stream_with_context(export_stream(since, until, fmt, compress, archived_messages=session_archive.messages)),
+        mimetype='application/gzip' if compress else ('application/json' if fmt == 'json' else 'application/x-ndjson'),
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            'X-Export-Until': until.isoformat() + 'Z',
         }
-        
-        for message in session.messages:
-            session_data['messages'].append({
-                'role': message.role,
-                'content': message.content,
-                'timestamp': message.timestamp.isoformat()
-            })
-        
-        data.append(session_data)
-    
-    return jsonify(data)
+    )
 
 @app.route('/api/export/user-stats')
 @login_required
 def export_user_stats():
+    """Per-user statistics as JSON or ?format=csv.
+
+    ?breakdown=model gives one row per user and model, ?breakdown=day one
+    row per user and day over the last ?days= (default 30).
+    """
     if not current_user.is_admin:
         return jsonify({'error': 'Access denied'}), 403
     
-    # Export user statistics
-    users = User.query.all()
-    stats = []
-    
-    for user in users:
-        user_stats = {
-            'username': user.username,
-            'email': user.email,
-            'created_at': user.created_at.isoformat(),
-            'total_sessions': len(user.chat_sessions),
-            'total_messages': sum(len(session.messages) for session in user.chat_sessions),
-            'ratings_given': len(user.ratings),
-            'avg_rating_given': sum(rating.rating for rating in user.ratings) / len(user.ratings) if user.ratings else 0
-        }
-        stats.append(user_stats)
-    
-    return jsonify(stats)
+    execute = sql_rows
+    breakdown = request.args.get('breakdown')
+    if breakdown == 'model':
+        rows, fields = user_stats.by_model(execute), user_stats.MODEL_FIELDS
+    elif breakdown == 'day':
+        days = max(1, min(366, request.args.get('days', 30, type=int)))
+        rows, fields = user_stats.by_day(execute, days), user_stats.DAY_FIELDS
+    else:
+        rows, fields = user_stats.user_totals(execute), user_stats.TOTAL_FIELDS
+    
+    if request.args.get('format') == 'csv':
+        filename = f"user-stats{'-by-' + breakdown if breakdown in ('model', 'day') else ''}.csv"
+        return Response(
+            user_stats.to_csv(rows, fields),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+    return jsonify(rows)
 
 @socketio.on('connect')
 @login_required
@@ -1093,64 +1534,52 @@ def handle_message(data):
         emit('error', {'message': 'Invalid session'})
         return
     
-    # Save user message
+    # Newest stored message before this turn, used to validate cached history;
+    # the previous turn's queued writes have to land first
+    persistence_queue.wait_for(session_id, socketio.sleep)
+    if session.archived_at:
+        session_archive.restore(session_id, socketio.sleep)
+        conversation_engine.invalidate(session_id)
+    last_message_id = conversation_engine.latest_message_id(session_id)
+    
+    # Save user message (write-behind, so the search and generation start immediately)
     user_message = ChatMessage(
         session_id=session_id,
         role='user',
-        content=message
+        content=message,
+        timestamp=datetime.utcnow()
     )
-    db.session.add(user_message)
-    db.session.commit()
+    persistence_queue.submit(session_id, lambda: db.session.add(user_message))
     
     # Check if we should search the web
     search_results = None
-    enhanced_prompt = message
+    search_requested = should_search_web(message, session.web_search or 'auto')
     
-    if should_search_web(message):
+    if search_requested:
         print(f"Web search triggered for query: {message}")
         emit('web_search_start', {'message': 'Initiating web search for current information...'})
         
-        # Add a small delay to show the initial message
-        socketio.sleep(0.5)
+        # Load the model while the search runs so a cold start overlaps it
+        preload_model(session.model_name)
         emit('web_search_progress', {'message': 'Connecting to search engine...'})
         
-        search_results = search_web(message)
+        # Report real progress: the result list, then each source as its page finishes loading
+        search_results = search_web(
+            message,
+            on_results=lambda results: emit('web_search_progress', {
+                'message': f'Found {len(results)} sources, reading pages...',
+                'completed': 0,
+                'total': len(results)
+            }),
+            on_progress=lambda completed, total, result: emit('web_search_progress', {
+                'message': f'Processed source {completed}/{total}: {result["title"][:40]}...',
+                'completed': completed,
+                'total': total
+            })
+        )
         
         if search_results:
             print(f"Found {len(search_results)} search results")
-            emit('web_search_progress', {'message': f'Found {len(search_results)} relevant sources. Extracting content...'})
-            
-            # Show progress for each result being processed
-            for i, result in enumerate(search_results, 1):
-                emit('web_search_progress', {
-                    'message': f'Processing source {i}/{len(search_results)}: {result["title"][:40]}...'
-                })
-                socketio.sleep(0.3)  # Small delay to show progress
-            
-            search_context = format_search_results(search_results)
-            
-            # Get system prompt
-            system_prompt = get_system_config('system_prompt', '')
-            base_prompt = system_prompt + '\n\n' if system_prompt else ''
-            
-            enhanced_prompt = f"""{base_prompt}You are a helpful AI assistant. A user has asked: "{message}"
-
-{search_context}
-
-Please provide a well-structured, comprehensive answer following these formatting guidelines:
-
-1. Start with a clear, direct answer to the question
-2. Use bullet points or numbered lists when appropriate
-3. Add line breaks between different topics or sections
-4. When referencing web sources, mention them clearly
-5. Use clear headings or separators for different sections
-6. Keep paragraphs concise and readable
-7. End with a brief summary if the answer is long
-
-User's question: {message}
-
-Please format your response clearly with proper spacing and structure."""
-            
             emit('web_search_complete', {
                 'message': f'Successfully gathered information from {len(search_results)} sources. Analyzing and generating response...',
                 'results_count': len(search_results)
@@ -1158,31 +1587,15 @@ Please format your response clearly with proper spacing and structure."""
         else:
             print("No search results found")
             emit('web_search_progress', {'message': 'No current web results found for this query.'})
-            socketio.sleep(0.5)
             emit('web_search_complete', {
                 'message': 'Web search completed. Using available knowledge to answer your question...',
                 'results_count': 0
             })
     else:
         print(f"No web search needed for: {message}")
-        # Get system prompt
-        system_prompt = get_system_config('system_prompt', '')
-        base_prompt = system_prompt + '\n\n' if system_prompt else ''
-        
-        # Enhance regular prompts for better formatting
-        enhanced_prompt = f"""{base_prompt}You are a helpful AI assistant. Please provide a well-structured response to the following question.
-
-Use clear formatting with:
-- Bullet points or numbered lists when appropriate
-- Line breaks between different topics
-- Clear, concise paragraphs
-- Proper spacing for readability
-
-User's question: {message}
-
-Please provide a comprehensive, well-formatted answer:"""
 
     # Send message to Ollama and stream response
+    ticket = None
     try:
         user_id = current_user.id
         
@@ -1193,169 +1606,241 @@ Please provide a comprehensive, well-formatted answer:"""
             'start_time': time.time()
         }
         
-        ollama_url = f"{OLLAMA_BASE_URL}/api/generate"
-        payload = {
-            'model': session.model_name,
-            'prompt': enhanced_prompt,
-            'stream': True,
-            'options': {
-                'temperature': session.temperature,
-                'num_predict': session.max_tokens,
-                'top_p': session.top_p,
-                'top_k': session.top_k,
-                'repeat_penalty': session.repeat_penalty
-            }
-        }
+        # Fit the turn into the model's token budget: the system prompt and
+        # question first, then as many ranked search snippets as fit, then
+        # history. Earlier turns come from the conversation engine so Ollama
+        # can reuse their cached prefix.
+        model = session.model_name
+        system_prompt = prompt_builder.system_prompt(get_system_config('system_prompt', ''))
+        prompt_budget = prompt_builder.budget_for(model)
+        available = prompt_budget - prompt_builder.tokens(model, system_prompt)
+        user_content, snippets_kept, snippets_dropped = prompt_builder.user_content(model, message, search_results, available)
+        history_budget = max(0, available - prompt_builder.tokens(model, user_content))
+        payload = conversation_engine.build_payload(
+            session, system_prompt, user_content, last_message_id,
+            trim_history=lambda messages: prompt_builder.trim_history(model, messages, history_budget)
+        )
+        prompt_estimate = prompt_builder.count(model, payload['messages'])
+        prompt_chars = sum(len(m['content']) for m in payload['messages'])
+        print(f"Prompt for {model}: budget {prompt_budget} tokens, estimated {prompt_estimate} "
+              f"({len(payload['messages'])} messages, {snippets_kept} snippets kept, {snippets_dropped} dropped)")
+        
+        # Opening prompts without web results can be answered from the cache;
+        # later turns depend on the conversation so they are never cached
+        cache_key = None
+        first_turn = last_message_id is None
+        if first_turn and not search_requested and response_cache.eligible(session):
+            cache_key = response_cache.make_key(session, message, system_prompt)
+            cached = response_cache.get(cache_key)
+            if cached:
+                _replay_cached_response(session, user_id, user_content, cached)
+                return
+        
+        # Wait for a generation slot, telling the client where it stands
+        ticket = generation_scheduler.submit(user_id)
+        admitted = generation_scheduler.wait(
+            ticket,
+            socketio.sleep,
+            on_position=lambda position, depth: emit('queue_position', {
+                'session_id': session_id,
+                'position': position,
+                'queue_depth': depth
+            }),
+            is_cancelled=lambda: streaming_sessions.get(user_id, {}).get('stopped', False)
+        )
+        if not admitted:
+            # Stopped while queued; handle_stop_generation already notified the client
+            streaming_sessions.pop(user_id, None)
+            return
+        emit('queue_wait_ms', {'session_id': session_id, 'queue_wait_ms': ticket.wait_ms})
         
-        # Start timing
+        # Start timing (service time only, queue wait is reported separately)
         start_time = time.time()
         first_token_time = None
         token_count = 0
         
-        response = requests.post(ollama_url, json=payload, stream=True, timeout=120)
-        response.raw.decode_content = True  # Ensure proper streaming
-        
-        if response.status_code == 200:
-            full_response = ""
-            
-            # Emit streaming start event
-            emit('streaming_start', {
-                'model': session.model_name,
-                'timestamp': start_time,
-                'session_id': session_id
-            })
+        with ollama_client.post('/api/chat', json=payload, stream=True) as response:
+            response.raw.decode_content = True  # Ensure proper streaming
             
-            for line in response.iter_lines():
-                # Check if user requested to stop
-                if user_id in streaming_sessions and streaming_sessions[user_id].get('stopped', False):
-                    print(f"Stopping generation for user {user_id} as requested")
-                    
-                    # Save partial response if we have any
-                    if full_response.strip():
-                        assistant_message = ChatMessage(
-                            session_id=session_id,
-                            role='assistant',
-                            content=full_response + "\n\n[Generation stopped by user]"
-                        )
-                        db.session.add(assistant_message)
-                        db.session.commit()
+            if response.status_code == 200:
+                full_response = ""
+                
+                # Coalesce tokens into batched frames sent only to this user's room
+                batcher = ChunkBatcher(
+                    socketio,
+                    f'user_{user_id}',
+                    session_id=session_id,
+                    window_ms=STREAM_FLUSH_MS,
+                    max_bytes=STREAM_FLUSH_BYTES,
+                    debug=STREAM_DEBUG
+                )
+                
+                # Emit streaming start event
+                emit('streaming_start', {
+                    'model': session.model_name,
+                    'timestamp': start_time,
+                    'session_id': session_id
+                })
+                
+                for line in response.iter_lines():
+                    # Check if user requested to stop
+                    if user_id in streaming_sessions and streaming_sessions[user_id].get('stopped', False):
+                        print(f"Stopping generation for user {user_id} as requested")
+                        
+                        # Save partial response if we have any
+                        if full_response.strip():
+                            # No final counters from Ollama when we stop early, so store the estimate
+                            elapsed_ms = (time.time() - start_time) * 1000
+                            queue_reply(session_id, user_content, full_response + "\n\n[Generation stopped by user]", dict(
+                                model_name=session.model_name,
+                                completion_tokens=token_count,
+                                wall_time_ms=round(elapsed_ms, 1),
+                                time_to_first_token_ms=round((first_token_time - start_time) * 1000, 1) if first_token_time else 0,
+                                queue_wait_ms=ticket.wait_ms,
+                                estimated=True,
+                                prompt_budget=prompt_budget,
+                                prompt_estimate=prompt_estimate
+                            ))
+                            
+                            # Emit the final partial content
+                            batcher.add("\n\n[Generation stopped by user]", token_count=token_count)
+                            batcher.flush(stopped=True)
                         
-                        # Emit the final partial content
-                        emit('message_chunk', {
-                            'chunk': "\n\n[Generation stopped by user]",
-                            'token_count': token_count,
-                            'stopped': True
+                        # Clean up streaming session
+                        if user_id in streaming_sessions:
+                            del streaming_sessions[user_id]
+                        
+                        # Emit stop completion
+                        emit('message_complete', {
+                            'session_id': session_id,
+                            'stopped': True,
+                            'total_tokens': token_count,
+                            'total_time': round(time.time() - start_time, 3),
+                            'model': session.model_name,
+                            'message': 'Generation stopped by user'
                         })
+                        break
                     
-                    # Clean up streaming session
-                    if user_id in streaming_sessions:
-                        del streaming_sessions[user_id]
-                    
-                    # Emit stop completion
-                    emit('message_complete', {
-                        'stopped': True,
-                        'total_tokens': token_count,
-                        'total_time': round(time.time() - start_time, 3),
-                        'model': session.model_name,
-                        'message': 'Generation stopped by user'
-                    })
-                    break
-                
-                if line:
-                    try:
-                        json_response = json.loads(line.decode('utf-8'))
-                        
-                        if 'response' in json_response:
-                            chunk = json_response['response']
-                            full_response += chunk
+                    if line:
+                        try:
+                            json_response = json.loads(line.decode('utf-8'))
                             
-                            # Better token counting - split by words and special characters
-                            if chunk.strip():
-                                # Count actual tokens more accurately
-                                words = len(chunk.split())
-                                chars = len(chunk.strip())
-                                chunk_tokens = max(words, chars // 4)  # Estimate tokens as words or chars/4
-                                token_count += chunk_tokens
+                            if json_response.get('message', {}).get('content'):
+                                chunk = json_response['message']['content']
+                                full_response += chunk
+                                
+                                # Live estimate only; the final count comes from Ollama's eval_count
+                                token_count = token_estimator.estimate(session.model_name, len(full_response))
                                 
                                 # Record first token time
                                 if first_token_time is None:
                                     first_token_time = time.time()
                                     time_to_first_token = first_token_time - start_time
                                     emit('first_token', {
+                                        'session_id': session_id,
                                         'time_to_first_token': round(time_to_first_token, 3)
                                     })
                                 
-                                # Calculate current tokens per second with smoothing
-                                current_time = time.time()
-                                elapsed_time = current_time - (first_token_time or start_time)
+                                # Calculate current tokens per second
+                                elapsed_time = time.time() - (first_token_time or start_time)
                                 tokens_per_second = token_count / elapsed_time if elapsed_time > 0 else 0
                                 
-                                # Emit chunk immediately for better responsiveness
-                                socketio.emit('message_chunk', {
-                                    'chunk': chunk,
-                                    'token_count': token_count,
-                                    'tokens_per_second': round(tokens_per_second, 2),
-                                    'elapsed_time': round(elapsed_time, 3),
-                                    'chunk_size': len(chunk),
-                                    'words_in_chunk': len(chunk.split()) if chunk.split() else 0
-                                })
-                                
-                                # Force immediate transmission
-                                socketio.sleep(0)
-                        
-                        if json_response.get('done', False):
-                            # Calculate final metrics
-                            end_time = time.time()
-                            total_time = end_time - start_time
-                            final_tokens_per_second = token_count / total_time if total_time > 0 else 0
-                            
-                            # Get additional metrics from Ollama response
-                            eval_count = json_response.get('eval_count', 0)
-                            eval_duration = json_response.get('eval_duration', 0)
-                            prompt_eval_count = json_response.get('prompt_eval_count', 0)
-                            prompt_eval_duration = json_response.get('prompt_eval_duration', 0)
-                            
-                            # Save assistant message
-                            assistant_message = ChatMessage(
-                                session_id=session_id,
-                                role='assistant',
-                                content=full_response
-                            )
-                            db.session.add(assistant_message)
-                            db.session.commit()
+                                # Whitespace-only tokens (newlines) are forwarded too
+                                batcher.add(
+                                    chunk,
+                                    token_count=token_count,
+                                    tokens_per_second=round(tokens_per_second, 2),
+                                    elapsed_time=round(elapsed_time, 3)
+                                )
                             
-                            # Clean up streaming session
-                            if user_id in streaming_sessions:
-                                del streaming_sessions[user_id]
-                            
-                            # Emit completion with full metrics
-                            emit('message_complete', {
-                                'total_tokens': token_count,
-                                'total_time': round(total_time, 3),
-                                'tokens_per_second': round(final_tokens_per_second, 2),
-                                'time_to_first_token': round((first_token_time - start_time) if first_token_time else 0, 3),
-                                'ollama_eval_count': eval_count,
-                                'ollama_eval_duration_ms': round(eval_duration / 1_000_000, 2) if eval_duration else 0,
-                                'ollama_prompt_eval_count': prompt_eval_count,
-                                'ollama_prompt_eval_duration_ms': round(prompt_eval_duration / 1_000_000, 2) if prompt_eval_duration else 0,
-                                'model': session.model_name
-                            })
-                            break
-                    except json.JSONDecodeError:
-                        continue
-        else:
-            # Clean up streaming session on error
-            if user_id in streaming_sessions:
-                del streaming_sessions[user_id]
-            
-            # Provide more specific error messages
-            if response.status_code == 404:
-                emit('error', {'message': f'Model "{session.model_name}" not found in Ollama. Please check available models.'})
-            elif response.status_code == 400:
-                emit('error', {'message': f'Invalid request to Ollama. Check model parameters.'})
+                            if json_response.get('done', False):
+                                # Send whatever is still buffered before completing
+                                batcher.flush()
+                                
+                                # Calculate final metrics from Ollama's own counters
+                                end_time = time.time()
+                                total_time = end_time - start_time
+                                timings = ollama_timings(json_response)
+                                eval_count = timings['completion_tokens']
+                                time_to_first_token = (first_token_time - start_time) if first_token_time else 0
+                                
+                                # Improve the live estimate for this model's next response
+                                token_estimator.calibrate(session.model_name, len(full_response), eval_count)
+                                # prompt_eval_count leaves out any prefix reused from the KV cache, so
+                                # only calibrate when the whole prompt was evaluated: a first turn on a
+                                # freshly loaded model, or one that counted at least the estimate
+                                full_prompt_evaluated = timings['load_ms'] >= COLD_LOAD_MS or \
+                                    timings['prompt_tokens'] >= prompt_estimate
+                                if first_turn and timings['prompt_tokens'] and full_prompt_evaluated:
+                                    prompt_token_estimator.calibrate(
+                                        model, prompt_chars,
+                                        timings['prompt_tokens'] - MESSAGE_OVERHEAD_TOKENS * len(payload['messages'])
+                                    )
+                                print(f"Prompt for {model}: budget {prompt_budget}, estimated {prompt_estimate}, "
+                                      f"Ollama prompt_eval_count {timings['prompt_tokens']}")
+                                
+                                # Queue the assistant message with its metrics and telemetry sample
+                                queue_reply(session_id, user_content, full_response, dict(
+                                    model_name=session.model_name,
+                                    wall_time_ms=round(total_time * 1000, 1),
+                                    time_to_first_token_ms=round(time_to_first_token * 1000, 1),
+                                    queue_wait_ms=ticket.wait_ms,
+                                    prompt_budget=prompt_budget,
+                                    prompt_estimate=prompt_estimate,
+                                    **timings
+                                ), telemetry=dict(
+                                    model_name=session.model_name,
+                                    ttft_ms=time_to_first_token * 1000,
+                                    tokens_per_second=timings['tokens_per_second'],
+                                    prompt_tokens=timings['prompt_tokens'],
+                                    prompt_eval_ms=timings['prompt_eval_ms'],
+                                    eval_ms=timings['eval_ms'],
+                                    when=datetime.utcnow()
+                                ))
+                                if cache_key and full_response.strip():
+                                    response_cache.put(cache_key, full_response, eval_count)
+                                
+                                # Clean up streaming session
+                                if user_id in streaming_sessions:
+                                    del streaming_sessions[user_id]
+                                
+                                # Emit completion with full metrics
+                                emit('message_complete', {
+                                    'session_id': session_id,
+                                    'total_tokens': eval_count,
+                                    'total_time': round(total_time, 3),
+                                    'tokens_per_second': timings['tokens_per_second'],
+                                    'time_to_first_token': round(time_to_first_token, 3),
+                                    'ollama_eval_count': eval_count,
+                                    'ollama_eval_duration_ms': timings['eval_ms'],
+                                    'ollama_prompt_eval_count': timings['prompt_tokens'],
+                                    'ollama_prompt_eval_duration_ms': timings['prompt_eval_ms'],
+                                    'ollama_load_duration_ms': timings['load_ms'],
+                                    'queue_wait_ms': ticket.wait_ms,
+                                    'prompt_budget': prompt_budget,
+                                    'prompt_estimate': prompt_estimate,
+                                    'model': session.model_name
+                                })
+                                break
+                        except json.JSONDecodeError:
+                            continue
             else:
-                emit('error', {'message': f'Failed to get response from Ollama. Status: {response.status_code}'})
+                # Clean up streaming session on error
+                if user_id in streaming_sessions:
+                    del streaming_sessions[user_id]
+                
+                # Provide more specific error messages
+                if response.status_code == 404:
+                    emit('error', {'message': f'Model "{session.model_name}" not found in Ollama. Please check available models.'})
+                elif response.status_code == 400:
+                    emit('error', {'message': f'Invalid request to Ollama. Check model parameters.'})
+                else:
+                    emit('error', {'message': f'Failed to get response from Ollama. Status: {response.status_code}'})
             
+    except QueueFull:
+        if current_user.id in streaming_sessions:
+            del streaming_sessions[current_user.id]
+        emit('error', {'message': 'PiBot is busy with other conversations right now. Please try again in a moment.'})
     except requests.exceptions.ConnectionError:
         # Clean up streaming session on error
         if current_user.id in streaming_sessions:
@@ -1371,6 +1856,77 @@ Please provide a comprehensive, well-formatted answer:"""
         if current_user.id in streaming_sessions:
             del streaming_sessions[current_user.id]
         emit('error', {'message': f'Error: {str(e)}'})
+    finally:
+        # Free the generation slot (or leave the queue) however we exit
+        if ticket:
+            generation_scheduler.release(ticket)
+
+def queue_reply(session_id, user_content, reply, metrics, telemetry=None):
+    """Queue an assistant message, its MessageMetrics and optional telemetry sample.
+
+    The conversation state advances once the row is committed, so the next
+    turn's history check sees the reply's id.
+    """
+    timestamp = datetime.utcnow()
+    
+    def write():
+        assistant_message = ChatMessage(
+            session_id=session_id,
+            role='assistant',
+            content=reply,
+            timestamp=timestamp
+        )
+        db.session.add(assistant_message)
+        db.session.flush()
+        db.session.add(MessageMetrics(message_id=assistant_message.id, **metrics))
+        if telemetry:
+            record_generation(**telemetry)
+        return assistant_message.id
+    
+    persistence_queue.submit(
+        session_id,
+        write,
+        on_commit=lambda message_id: conversation_engine.record_turn(session_id, user_content, reply, message_id)
+    )
+
+def _replay_cached_response(session, user_id, content, cached):
+    """Stream a cached answer through the normal message_chunk path"""
+    start_time = time.time()
+    emit('streaming_start', {
+        'model': session.model_name,
+        'timestamp': start_time,
+        'session_id': session.id,
+        'cached': True
+    })
+    emit('first_token', {'session_id': session.id, 'time_to_first_token': round(time.time() - start_time, 3)})
+    
+    # A zero window sends each slice as its own frame
+    batcher = ChunkBatcher(socketio, f'user_{user_id}', session_id=session.id, window_ms=0, max_bytes=STREAM_FLUSH_BYTES, debug=STREAM_DEBUG)
+    response_text = cached['response']
+    for offset in range(0, len(response_text), STREAM_FLUSH_BYTES):
+        batcher.add(response_text[offset:offset + STREAM_FLUSH_BYTES], cached=True)
+    batcher.flush()
+    
+    total_time = time.time() - start_time
+    queue_reply(session.id, content, response_text, dict(
+        model_name=session.model_name,
+        completion_tokens=cached.get('eval_count', 0),
+        wall_time_ms=round(total_time * 1000, 1),
+        cached=True
+    ))
+    
+    if user_id in streaming_sessions:
+        del streaming_sessions[user_id]
+    
+    emit('message_complete', {
+        'session_id': session.id,
+        'cached': True,
+        'total_tokens': cached.get('eval_count', 0),
+        'total_time': round(total_time, 3),
+        'tokens_per_second': 0,
+        'time_to_first_token': 0,
+        'model': session.model_name
+    })
 
 # Status page and API endpoints
 @app.route('/status')
@@ -1481,8 +2037,7 @@ def _get_status_data():
     
     # Get Ollama status (with timeout)
     try:
-        import requests
-        response = requests.get('http://localhost:11434/api/tags', timeout=2)
+        response = ollama_client.get('/api/tags', timeout=(1, 2))
         if response.status_code == 200:
             models = response.json().get('models', [])
             status_data['ollama'] = {
@@ -1494,6 +2049,15 @@ def _get_status_data():
             status_data['ollama']['status'] = 'error'
     except:
         status_data['ollama']['status'] = 'offline'
+    status_data['ollama']['client'] = ollama_client.stats()
+    status_data['ollama']['catalog'] = model_catalog.status()
+    status_data['ollama']['conversations'] = conversation_engine.stats()
+    status_data['ollama']['scheduler'] = generation_scheduler.stats()
+    status_data['ollama']['chars_per_token'] = token_estimator.ratios()
+    status_data['search_cache'] = search_cache.stats()
+    status_data['local_index'] = local_index.stats()
+    status_data['persistence'] = persistence_queue.stats()
+    status_data['archive'] = session_archive.stats()
     
     # Get system info (with error handling)
     try:
@@ -1529,17 +2093,20 @@ def _get_status_data():
     
     # Get database stats (with error handling)
     try:
-        import datetime as dt
-        
         status_data['database']['total_users'] = User.query.count()
-        status_data['database']['total_sessions'] = ChatSession.query.count()
-        status_data['database']['total_messages'] = ChatMessage.query.count()
-        status_data['database']['total_ratings'] = ModelRating.query.count()
         
-        # Recent activity
-        yesterday = dt.datetime.now() - dt.timedelta(days=1)
-        status_data['database']['recent_sessions_24h'] = ChatSession.query.filter(ChatSession.created_at >= yesterday).count()
-        status_data['database']['recent_messages_24h'] = ChatMessage.query.filter(ChatMessage.timestamp >= yesterday).count()
+        # Totals and recent activity from the hourly rollups (timestamps are UTC)
+        usage_totals = usage_rollup.totals(sql_rows)
+        status_data['database']['total_sessions'] = usage_totals['sessions']
+        status_data['database']['total_messages'] = usage_totals['messages']
+        status_data['database']['total_ratings'] = usage_totals['ratings']
+        status_data['database']['total_prompt_tokens'] = usage_totals['prompt_tokens']
+        status_data['database']['total_completion_tokens'] = usage_totals['completion_tokens']
+        
+        recent = usage_rollup.recent(sql_rows, hours=24)
+        status_data['database']['recent_sessions_24h'] = recent['sessions']
+        status_data['database']['recent_messages_24h'] = recent['messages']
+        status_data['database']['recent_ratings_24h'] = recent['ratings']
         
     except Exception as e:
         # Keep default values if database fails
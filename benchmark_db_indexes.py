@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Time the hot database queries on a synthetic chat database before and after
+the migrations in migrate_db.py, and print each query plan.
+
+Usage:
+    python3 benchmark_db_indexes.py [--users N] [--sessions N] [--messages N] [--runs N] [--keep PATH]
+
+The database is built in a temporary file with the pre-migration schema (the
+tables as create_all() made them, without indexes), so the "before" numbers
+match an existing deployment.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import migrate_db
+
+# Tables as created by db.create_all() from the original models.py, before
+# any migration (message_metrics and later tables come from the migrations)
+BASE_SCHEMA = [
+    'CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, '
+    'email VARCHAR(120) NOT NULL UNIQUE, password_hash VARCHAR(128) NOT NULL, '
+    'is_admin BOOLEAN, created_at DATETIME)',
+    'CREATE TABLE chat_session (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id), '
+    'model_name VARCHAR(50) NOT NULL, title VARCHAR(200) NOT NULL, created_at DATETIME, updated_at DATETIME, '
+    'temperature FLOAT, max_tokens INTEGER, top_p FLOAT, top_k INTEGER, repeat_penalty FLOAT)',
+    'CREATE TABLE chat_message (id INTEGER PRIMARY KEY, session_id INTEGER NOT NULL REFERENCES chat_session (id), '
+    'role VARCHAR(20) NOT NULL, content TEXT NOT NULL, timestamp DATETIME)',
+    'CREATE TABLE model_rating (id INTEGER PRIMARY KEY, session_id INTEGER NOT NULL REFERENCES chat_session (id), '
+    'user_id INTEGER NOT NULL REFERENCES user (id), model_name VARCHAR(50) NOT NULL, '
+    'rating INTEGER NOT NULL, created_at DATETIME)',
+    'CREATE TABLE system_config (id INTEGER PRIMARY KEY, "key" VARCHAR(50) NOT NULL UNIQUE, value TEXT, '
+    'description VARCHAR(200), updated_at DATETIME, updated_by INTEGER REFERENCES user (id))',
+    'CREATE TABLE user_feedback (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id), '
+    'feedback_type VARCHAR(50) NOT NULL, title VARCHAR(200) NOT NULL, description TEXT NOT NULL, '
+    'priority VARCHAR(20), status VARCHAR(20), created_at DATETIME, updated_at DATETIME)',
+]
+
+# The queries app.py runs on every page load, history fetch, rating and status poll
+QUERIES = [
+    ('session history', 'SELECT * FROM chat_message WHERE session_id = :session_id ORDER BY timestamp'),
+    ('user sessions', 'SELECT * FROM chat_session WHERE user_id = :user_id ORDER BY created_at DESC'),
+    ('existing rating', 'SELECT * FROM model_rating WHERE session_id = :session_id AND user_id = :user_id LIMIT 1'),
+    ('sessions 24h', 'SELECT COUNT(*) FROM chat_session WHERE created_at >= :since'),
+    ('messages 24h', 'SELECT COUNT(*) FROM chat_message WHERE timestamp >= :since'),
+]
+
+MODELS = ['tinyllama', 'llama3.2:1b', 'gemma2:2b', 'qwen2.5:0.5b']
+
+
+def _timestamp(value):
+    # Same text format SQLAlchemy stores DateTime columns in
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def build_database(path, users, sessions, messages, seed=1):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    conn = sqlite3.connect(path, isolation_level=None)
+    for statement in BASE_SCHEMA:
+        conn.execute(statement)
+
+    conn.execute('BEGIN')
+    conn.executemany(
+        'INSERT INTO user (id, username, email, password_hash, is_admin, created_at) VALUES (?, ?, ?, ?, 0, ?)',
+        ((i, f'user{i}', f'user{i}@example.com', 'x', _timestamp(now)) for i in range(1, users + 1))
+    )
+
+    session_started = {}
+    session_rows = []
+    for session_id in range(1, sessions + 1):
+        started = now - timedelta(days=rng.uniform(0, 365))
+        session_started[session_id] = started
+        session_rows.append((session_id, rng.randint(1, users), rng.choice(MODELS), f'Chat {session_id}',
+                             _timestamp(started), _timestamp(started)))
+    conn.executemany(
+        'INSERT INTO chat_session (id, user_id, model_name, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+        session_rows
+    )
+
+    # Messages are written as they arrive, so ids interleave across sessions
+    def message_rows():
+        for message_id in range(1, messages + 1):
+            session_id = rng.randint(1, sessions)
+            sent = session_started[session_id] + timedelta(minutes=rng.uniform(0, 120))
+            role = 'user' if message_id % 2 else 'assistant'
+            yield message_id, session_id, role, f'message {message_id} ' + 'lorem ipsum ' * rng.randint(2, 40), _timestamp(sent)
+    conn.executemany('INSERT INTO chat_message (id, session_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)',
+                     message_rows())
+
+    conn.executemany(
+        'INSERT INTO model_rating (session_id, user_id, model_name, rating, created_at) VALUES (?, ?, ?, ?, ?)',
+        ((row[0], row[1], row[2], rng.randint(1, 5), row[4]) for row in session_rows if rng.random() < 0.3)
+    )
+    conn.execute('COMMIT')
+    conn.execute('ANALYZE')
+    return conn
+
+
+def run_queries(conn, params, runs):
+    results = {}
+    for name, sql in QUERIES:
+        plan = '; '.join(row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params))
+        start = time.perf_counter()
+        for _ in range(runs):
+            conn.execute(sql, params).fetchall()
+        results[name] = ((time.perf_counter() - start) / runs * 1000, plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--sessions', type=int, default=20000)
+    parser.add_argument('--messages', type=int, default=500000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--keep', help='write the synthetic database here instead of a temporary file')
+    args = parser.parse_args()
+
+    directory = None
+    path = args.keep
+    if not path:
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, 'chatbot.db')
+
+    start = time.perf_counter()
+    conn = build_database(path, args.users, args.sessions, args.messages)
+    print(f"Built {args.users} users, {args.sessions} sessions, {args.messages} messages "
+          f"in {time.perf_counter() - start:.1f}s ({os.path.getsize(path) / 1024 / 1024:.1f} MB)\n")
+
+    params = {
+        'session_id': args.sessions // 2,
+        'user_id': args.users // 2,
+        'since': _timestamp(datetime.utcnow() - timedelta(hours=24)),
+    }
+    before = run_queries(conn, params, args.runs)
+
+    start = time.perf_counter()
+    migrate_db.configure_connection(conn)
+    migrate_db.migrate(conn)
+    conn.execute('ANALYZE')
+    print(f"Migrated in {time.perf_counter() - start:.1f}s\n")
+    after = run_queries(conn, params, args.runs)
+    conn.close()
+
+    print(f"{'query':<16} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    print("-" * 47)
+    for name, _ in QUERIES:
+        speedup = before[name][0] / after[name][0] if after[name][0] else 0
+        print(f"{name:<16} {before[name][0]:>10.3f} {after[name][0]:>10.3f} {speedup:>7.0f}x")
+
+    print("\nQuery plans:")
+    for name, _ in QUERIES:
+        print(f"  {name}\n    before: {before[name][1]}\n    after:  {after[name][1]}")
+
+    if directory:
+        directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Compare the streaming snippet extractor (page_text.py) with the original
+BeautifulSoup implementation of get_page_snippet on saved HTML pages.
+
+Usage:
+    python3 benchmark_page_text.py [--runs N] [--max-kb KB] [file.html ...]
+
+Without file arguments every page in benchmark_fixtures/html/ is used. Save
+more fixtures with e.g. `curl -sL https://example.com > benchmark_fixtures/html/example.html`.
+"""
+import argparse
+import glob
+import os
+import time
+import tracemalloc
+
+from page_text import CHUNK_SIZE, extract_snippet
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_fixtures', 'html')
+
+
+def beautifulsoup_snippet(content, max_length=300):
+    """The pre-streaming get_page_snippet extraction, kept for comparison"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, 'html.parser')
+    for script in soup(["script", "style"]):
+        script.decompose()
+    text = soup.get_text()
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    text = ' '.join(chunk for chunk in chunks if chunk)
+    return text[:max_length] + "..." if len(text) > max_length else text
+
+
+def streaming_snippet(content, max_bytes):
+    chunks = (content[i:i + CHUNK_SIZE] for i in range(0, len(content), CHUNK_SIZE))
+    snippet, _ = extract_snippet(chunks, max_bytes=max_bytes)
+    return snippet
+
+
+def measure(func, runs):
+    """Return (median ms, peak KB, result) over several runs"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    return timings[len(timings) // 2], peak / 1024, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--max-kb', type=int, default=256, help='byte cap for the streaming extractor')
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(FIXTURE_DIR, '*.html')))
+    if not files:
+        print(f"No HTML fixtures found in {FIXTURE_DIR}")
+        return
+
+    try:
+        import bs4  # noqa: F401
+        have_bs4 = True
+    except ImportError:
+        have_bs4 = False
+        print("beautifulsoup4 is not installed; only the streaming extractor is measured\n")
+
+    print(f"{'page':<24} {'size KB':>8} {'bs4 ms':>8} {'bs4 KB':>8} {'stream ms':>10} {'stream KB':>10} {'read KB':>8}")
+    print("-" * 82)
+    for path in files:
+        with open(path, 'rb') as f:
+            content = f.read()
+        name = os.path.basename(path)[:24]
+
+        max_bytes = args.max_kb * 1024
+        stream_ms, stream_peak, stream_text = measure(lambda: streaming_snippet(content, max_bytes), args.runs)
+        chunks = (content[i:i + CHUNK_SIZE] for i in range(0, len(content), CHUNK_SIZE))
+        _, bytes_read = extract_snippet(chunks, max_bytes=max_bytes)
+
+        if have_bs4:
+            bs4_ms, bs4_peak, bs4_text = measure(lambda: beautifulsoup_snippet(content), args.runs)
+            bs4_cols = f"{bs4_ms:>8.2f} {bs4_peak:>8.0f}"
+        else:
+            bs4_text = None
+            bs4_cols = f"{'-':>8} {'-':>8}"
+
+        print(f"{name:<24} {len(content) / 1024:>8.0f} {bs4_cols} {stream_ms:>10.2f} {stream_peak:>10.0f} {bytes_read / 1024:>8.0f}")
+        print(f"    stream: {stream_text[:90]!r}")
+        if bs4_text is not None:
+            print(f"    bs4:    {bs4_text[:90]!r}")
+
+
+if __name__ == '__main__':
+    main()
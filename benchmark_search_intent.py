@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Compare the compiled search-intent classifier (search_intent.py) with the
+original substring keyword check on a labelled corpus.
+
+Usage:
+    python3 benchmark_search_intent.py [--iterations N] [corpus.tsv]
+
+The corpus is one "label<TAB>message" per line (1 = should search, 0 = not);
+the default is benchmark_fixtures/search_intent_corpus.tsv.
+"""
+import argparse
+import os
+import time
+
+from search_intent import SearchIntentClassifier
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'benchmark_fixtures', 'search_intent_corpus.tsv')
+
+LEGACY_KEYWORDS = [
+    'latest', 'recent', 'current', 'today', 'news', 'search', 'find',
+    'what is happening', 'what happened', 'when did', 'price of',
+    'weather', 'stock', 'current events', 'breaking news',
+    'latest news', 'recent news', 'search for', 'look up', 'now',
+    'currently', 'this year', 'this month', 'update', 'status'
+]
+
+
+def legacy_should_search(message):
+    """The pre-classifier substring check from should_search_web"""
+    message_lower = message.lower()
+    return any(keyword in message_lower for keyword in LEGACY_KEYWORDS)
+
+
+def load_corpus(path):
+    corpus = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            label, message = line.split('\t', 1)
+            corpus.append((label == '1', message))
+    return corpus
+
+
+def evaluate(name, predict, corpus, iterations):
+    predictions = [predict(message) for _, message in corpus]
+    tp = sum(1 for (label, _), p in zip(corpus, predictions) if label and p)
+    fp = sum(1 for (label, _), p in zip(corpus, predictions) if not label and p)
+    fn = sum(1 for (label, _), p in zip(corpus, predictions) if label and not p)
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for _, message in corpus:
+            predict(message)
+    per_message_us = (time.perf_counter() - start) / (iterations * len(corpus)) * 1e6
+
+    print(f"{name:<12} {precision:>9.2f} {recall:>7.2f} {fp:>5} {fn:>5} {per_message_us:>10.2f}")
+    return predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('corpus', nargs='?', default=DEFAULT_CORPUS)
+    parser.add_argument('--iterations', type=int, default=1000)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    classifier = SearchIntentClassifier()
+    print(f"{len(corpus)} labelled messages, {args.iterations} timing iterations\n")
+    print(f"{'classifier':<12} {'precision':>9} {'recall':>7} {'FP':>5} {'FN':>5} {'us/msg':>10}")
+    print("-" * 53)
+    evaluate('substring', legacy_should_search, corpus, args.iterations)
+    predictions = evaluate('compiled', classifier.should_search, corpus, args.iterations)
+
+    mistakes = [(label, message) for (label, message), p in zip(corpus, predictions) if label != p]
+    if mistakes:
+        print("\nCompiled classifier mistakes:")
+        for label, message in mistakes:
+            kind = 'missed' if label else 'false positive'
+            print(f"  {kind:<15} {message}  {classifier.matches(message)}")
+
+
+if __name__ == '__main__':
+    main()
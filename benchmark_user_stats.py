@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Compare the grouped-SQL user statistics (user_stats.py) with the original
+relationship-walking export_user_stats on a synthetic chat database.
+
+Usage:
+    python3 benchmark_user_stats.py [--users N] [--sessions N] [--messages N] [--keep PATH]
+
+The database is built with benchmark_db_indexes.build_database and migrated
+with migrate_db, so it has the same tables and indexes as a deployment.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import migrate_db
+import user_stats
+from benchmark_db_indexes import build_database
+
+
+def legacy_user_stats(conn):
+    """The pre-SQL export_user_stats, issuing the queries its lazy relationships did"""
+    loaded = []  # The ORM identity map keeps every loaded row until the request ends
+    stats = []
+    for user_id, username, email, created_at in conn.execute('SELECT id, username, email, created_at FROM user'):
+        sessions = conn.execute('SELECT * FROM chat_session WHERE user_id = ?', (user_id,)).fetchall()
+        total_messages = 0
+        for session in sessions:
+            messages = conn.execute('SELECT * FROM chat_message WHERE session_id = ?', (session[0],)).fetchall()
+            loaded.append(messages)
+            total_messages += len(messages)
+        ratings = conn.execute('SELECT * FROM model_rating WHERE user_id = ?', (user_id,)).fetchall()
+        loaded.extend((sessions, ratings))
+        stats.append({
+            'username': username,
+            'email': email,
+            'created_at': created_at,
+            'total_sessions': len(sessions),
+            'total_messages': total_messages,
+            'ratings_given': len(ratings),
+            'avg_rating_given': sum(rating[4] for rating in ratings) / len(ratings) if ratings else 0
+        })
+    return stats
+
+
+def measure(name, function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<20} {elapsed_ms:>10.1f} {peak / 1024 / 1024:>12.1f} {len(result):>7}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--sessions', type=int, default=100000)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--keep', help='write the synthetic database here instead of a temporary file')
+    args = parser.parse_args()
+
+    directory = None
+    path = args.keep
+    if not path:
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, 'chatbot.db')
+
+    start = time.perf_counter()
+    conn = build_database(path, args.users, args.sessions, args.messages)
+    migrate_db.migrate(conn)
+    conn.execute('ANALYZE')
+    print(f"Built {args.users} users, {args.sessions} sessions, {args.messages} messages "
+          f"in {time.perf_counter() - start:.1f}s ({os.path.getsize(path) / 1024 / 1024:.1f} MB)\n")
+
+    def execute(sql, params):
+        return conn.execute(sql, params).fetchall()
+
+    print(f"{'method':<20} {'time ms':>10} {'peak MB':>12} {'rows':>7}")
+    print("-" * 52)
+    legacy = measure('relationship walk', lambda: legacy_user_stats(conn))
+    totals = measure('grouped SQL', lambda: user_stats.user_totals(execute))
+    measure('grouped SQL by model', lambda: user_stats.by_model(execute))
+    measure('grouped SQL by day', lambda: user_stats.by_day(execute, 30))
+
+    # Both methods must agree on every count
+    legacy_by_user = {row['username']: row for row in legacy}
+    mismatches = [row['username'] for row in totals
+                  if any(row[field] != legacy_by_user[row['username']][field]
+                         for field in ('total_sessions', 'total_messages', 'ratings_given'))
+                  or abs(row['avg_rating_given'] - legacy_by_user[row['username']]['avg_rating_given']) > 0.01]
+    print(f"\n{'All counts match' if not mismatches else f'Mismatched users: {mismatches[:10]}'}")
+
+    conn.close()
+    if directory:
+        directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Streaming export of chat sessions and their messages.
+
+Sessions are walked in id order a batch at a time, each batch with one
+query for the sessions (joined to their user) and one for their messages,
+read as plain rows rather than ORM objects so nothing accumulates in the
+session's identity map. Each session becomes one JSON line as soon as its
+messages have been read, and lines are yielded in chunks, optionally
+through a streaming gzip compressor, so memory use does not grow with the
+size of the database.
+
+With ``since``, only sessions created or messaged at or after that time are
+exported, each with just its newer messages.
+
+Sessions moved to the session archive have no rows in chat_message; their
+messages are read back through ``archived_messages(session_id)`` instead.
+"""
+import json
+import zlib
+from datetime import datetime
+from itertools import groupby
+
+from models import db, User, ChatSession, ChatMessage, ArchivedSession
+
+# Yield output in chunks of about this many bytes
+CHUNK_BYTES = 64 * 1024
+
+
+def _session_batches(since, until, batch_size):
+    last_id = 0
+    while True:
+        query = db.session.query(
+            ChatSession.id, User.username, ChatSession.model_name, ChatSession.title, ChatSession.created_at,
+            ChatSession.archived_at
+        ).join(User, User.id == ChatSession.user_id).filter(ChatSession.id > last_id)
+        if since:
+            has_new_messages = db.session.query(ChatMessage.id).filter(
+                ChatMessage.session_id == ChatSession.id,
+                ChatMessage.timestamp >= since,
+                ChatMessage.timestamp < until
+            ).exists()
+            # Sessions archived before their time range was recorded are always checked
+            has_new_archived_messages = db.session.query(ArchivedSession.session_id).filter(
+                ArchivedSession.session_id == ChatSession.id,
+                db.or_(
+                    ArchivedSession.last_message_at.is_(None),
+                    db.and_(ArchivedSession.last_message_at >= since, ArchivedSession.first_message_at < until)
+                )
+            ).exists()
+            query = query.filter(db.or_(
+                db.and_(ChatSession.created_at >= since, ChatSession.created_at < until),
+                has_new_messages,
+                has_new_archived_messages
+            ))
+        batch = query.order_by(ChatSession.id).limit(batch_size).all()
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1][0]
+
+
+def _message_groups(session_ids, since, until):
+    """(session_id, rows) for each session with messages, in session id order"""
+    query = db.session.query(
+        ChatMessage.session_id, ChatMessage.role, ChatMessage.content, ChatMessage.timestamp
+    ).filter(ChatMessage.session_id.in_(session_ids), ChatMessage.timestamp < until)
+    if since:
+        query = query.filter(ChatMessage.timestamp >= since)
+    rows = query.order_by(ChatMessage.session_id, ChatMessage.timestamp, ChatMessage.id).yield_per(500)
+    return groupby(rows, key=lambda row: row[0])
+
+
+def _archived(messages, since, until):
+    """Archived messages inside the export window; their timestamps are raw SQLite text"""
+    low = since.strftime('%Y-%m-%d %H:%M:%S.%f') if since else ''
+    high = until.strftime('%Y-%m-%d %H:%M:%S.%f')
+    return [{
+        'role': message['role'],
+        'content': message['content'],
+        'timestamp': message['timestamp'].replace(' ', 'T')
+    } for message in messages if low <= message['timestamp'] < high]
+
+
+def iter_sessions(since=None, until=None, batch_size=100, archived_messages=None):
+    """Export records, one dict per session with its messages in order.
+
+    Messages at or after ``until`` are left for the next incremental export.
+    """
+    until = until or datetime.utcnow()
+    for batch in _session_batches(since, until, batch_size):
+        groups = _message_groups([row[0] for row in batch], since, until)
+        group_id, group_rows = next(groups, (None, None))
+        for session_id, username, model_name, title, created_at, archived_at in batch:
+            messages = []
+            # Archiving moves every row out, so archived messages come before any live ones
+            if archived_at and archived_messages:
+                messages = _archived(archived_messages(session_id), since, until)
+            # Both sides are ordered by session id, so merge them as we go
+            if group_id == session_id:
+                messages += [{
+                    'role': role,
+                    'content': content,
+                    'timestamp': timestamp.isoformat()
+                } for _, role, content, timestamp in group_rows]
+                group_id, group_rows = next(groups, (None, None))
+            yield {
+                'id': session_id,
+                'user': username,
+                'model': model_name,
+                'title': title,
+                'created_at': created_at.isoformat(),
+                'messages': messages,
+            }
+
+
+def _chunked(pieces):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_BYTES:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(since=None, until=None, fmt='ndjson', compress=False, batch_size=100, archived_messages=None):
+    """Byte chunks of the export as NDJSON (one session per line) or a JSON array"""
+    records = iter_sessions(since, until, batch_size, archived_messages)
+    if fmt == 'json':
+        def pieces():
+            yield '['
+            for index, record in enumerate(records):
+                yield (',\n' if index else '\n') + json.dumps(record)
+            yield '\n]\n'
+    else:
+        def pieces():
+            for record in records:
+                yield json.dumps(record) + '\n'
+
+    chunks = _chunked(pieces())
+    return _gzipped(chunks) if compress else chunks
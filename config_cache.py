@@ -0,0 +1,125 @@
+"""Process-wide write-through cache of SystemConfig rows.
+
+All rows are loaded with a single query and kept in memory, so reading the
+system prompt or default parameters on the chat hot path no longer touches
+SQLite. Writes go through ConfigCache.set(), which updates the database and
+the cache together and bumps a version row. Other worker processes compare
+that version at most every ``check_interval`` seconds and reload on change.
+"""
+import threading
+import time
+from datetime import datetime
+
+from models import db, SystemConfig
+
+VERSION_KEY = 'config_version'
+
+
+class ConfigCache:
+    """In-memory SystemConfig values with typed accessors and a version counter"""
+
+    def __init__(self, check_interval=5):
+        self.check_interval = check_interval
+        self.version = 0
+        self._lock = threading.Lock()
+        self._values = {}
+        self._typed = {}
+        self._loaded = False
+        self._checked_at = 0.0
+
+    def load(self):
+        """Load every SystemConfig row in one query (requires an app context)"""
+        values = {row.key: row.value for row in SystemConfig.query.all()}
+        version = _parse_version(values.pop(VERSION_KEY, None))
+        with self._lock:
+            self._values = values
+            self._typed = {}
+            self.version = version
+            self._loaded = True
+            self._checked_at = time.monotonic()
+
+    def _sync(self):
+        if not self._loaded:
+            self.load()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        stored = db.session.query(SystemConfig.value).filter_by(key=VERSION_KEY).scalar()
+        if _parse_version(stored) != self.version:
+            print(f"System config changed elsewhere (version {stored}), reloading")
+            self.load()
+
+    def get(self, key, default=None):
+        """Get the raw string value, or default if the key was never set"""
+        self._sync()
+        with self._lock:
+            return self._values[key] if key in self._values else default
+
+    get_str = get
+
+    def _get_typed(self, key, default, cast):
+        self._sync()
+        with self._lock:
+            if key not in self._values:
+                return cast(default)
+            cache_key = (key, cast)
+            if cache_key not in self._typed:
+                try:
+                    self._typed[cache_key] = cast(self._values[key])
+                except (TypeError, ValueError):
+                    print(f"Invalid {cast.__name__} value for config '{key}': {self._values[key]!r}")
+                    self._typed[cache_key] = cast(default)
+            return self._typed[cache_key]
+
+    def get_float(self, key, default=0.0):
+        return self._get_typed(key, default, float)
+
+    def get_int(self, key, default=0):
+        return self._get_typed(key, default, int)
+
+    def set(self, key, value, description=None, user_id=None):
+        """Write a value to the database and the cache in one step"""
+        config = SystemConfig.query.filter_by(key=key).first()
+        if config:
+            config.value = value
+            config.updated_at = datetime.utcnow()
+            config.updated_by = user_id
+        else:
+            config = SystemConfig(
+                key=key,
+                value=value,
+                description=description,
+                updated_by=user_id
+            )
+            db.session.add(config)
+
+        version_row = SystemConfig.query.filter_by(key=VERSION_KEY).first()
+        if not version_row:
+            version_row = SystemConfig(
+                key=VERSION_KEY,
+                value='0',
+                description='Incremented on every config change so workers can reload'
+            )
+            db.session.add(version_row)
+        stored_version = _parse_version(version_row.value)
+        version_row.value = str(stored_version + 1)
+        db.session.commit()
+
+        if stored_version != self.version:
+            # Another worker changed something we have not seen yet
+            self.load()
+            return config
+        with self._lock:
+            self._values[key] = value
+            self._typed = {k: v for k, v in self._typed.items() if k[0] != key}
+            self.version = stored_version + 1
+        return config
+
+
+def _parse_version(value):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
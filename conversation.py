@@ -0,0 +1,136 @@
+"""Multi-turn conversation state for Ollama's /api/chat endpoint.
+
+Each ChatSession keeps an in-memory copy of the exact messages already sent
+to the model. A new turn only appends to that list, so the prompt prefix is
+byte-identical to the previous request and Ollama can reuse the KV cache it
+already holds for the loaded model instead of re-evaluating the whole
+history. The state is rebuilt from the ChatMessage table when it is missing
+or stale (model, parameters or system prompt changed, or messages were
+added outside this process).
+"""
+import threading
+from collections import OrderedDict
+
+from models import db, ChatMessage
+
+
+class ConversationState:
+    def __init__(self, fingerprint, messages, last_message_id):
+        self.fingerprint = fingerprint
+        self.messages = messages
+        self.last_message_id = last_message_id
+
+
+class ConversationEngine:
+    """Builds /api/chat payloads from incrementally maintained session history"""
+
+    def __init__(self, max_sessions=256, max_messages=40, keep_alive='30m'):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.keep_alive = keep_alive
+        self._lock = threading.Lock()
+        self._states = OrderedDict()
+        self.rebuilds = 0
+        self.reuses = 0
+
+    @staticmethod
+    def fingerprint(session, system_prompt):
+        return (
+            session.model_name,
+            session.temperature,
+            session.max_tokens,
+            session.top_p,
+            session.top_k,
+            session.repeat_penalty,
+            system_prompt or '',
+        )
+
+    @staticmethod
+    def latest_message_id(session_id):
+        """Id of the newest stored message in a session (None if empty)"""
+        return db.session.query(db.func.max(ChatMessage.id)).filter_by(session_id=session_id).scalar()
+
+    def _load_history(self, session_id, up_to_id):
+        if up_to_id is None:
+            return []
+        rows = ChatMessage.query.filter(
+            ChatMessage.session_id == session_id,
+            ChatMessage.id <= up_to_id
+        ).order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(self.max_messages).all()
+        return [{'role': row.role, 'content': row.content} for row in reversed(rows)]
+
+    def _state_for(self, session, system_prompt, last_message_id):
+        fingerprint = self.fingerprint(session, system_prompt)
+        with self._lock:
+            state = self._states.get(session.id)
+            if state and state.fingerprint == fingerprint and state.last_message_id == last_message_id:
+                self._states.move_to_end(session.id)
+                self.reuses += 1
+                return state
+
+        # Missing or stale: rebuild from the database
+        state = ConversationState(fingerprint, self._load_history(session.id, last_message_id), last_message_id)
+        with self._lock:
+            self._states[session.id] = state
+            self._states.move_to_end(session.id)
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+            self.rebuilds += 1
+        return state
+
+    def build_payload(self, session, system_prompt, content, last_message_id, trim_history=None):
+        """Return the /api/chat payload for a new user turn.
+
+        ``last_message_id`` is the newest message id stored *before* this
+        turn's user message, used to detect history written elsewhere.
+        ``trim_history(messages)`` may shorten the kept history; the result
+        is stored so later turns share the same prefix.
+        """
+        state = self._state_for(session, system_prompt, last_message_id)
+        if trim_history:
+            with self._lock:
+                state.messages = trim_history(state.messages)
+        messages = []
+        if system_prompt:
+            messages.append({'role': 'system', 'content': system_prompt})
+        messages.extend(state.messages)
+        messages.append({'role': 'user', 'content': content})
+
+        return {
+            'model': session.model_name,
+            'messages': messages,
+            'stream': True,
+            'keep_alive': self.keep_alive,
+            'options': {
+                'temperature': session.temperature,
+                'num_predict': session.max_tokens,
+                'top_p': session.top_p,
+                'top_k': session.top_k,
+                'repeat_penalty': session.repeat_penalty
+            }
+        }
+
+    def record_turn(self, session_id, content, reply, assistant_message_id):
+        """Append a finished turn exactly as it was sent so the next prefix matches"""
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None:
+                return
+            state.messages.append({'role': 'user', 'content': content})
+            state.messages.append({'role': 'assistant', 'content': reply})
+            # Trim in large steps so the cached prefix only breaks occasionally
+            if len(state.messages) > self.max_messages:
+                state.messages = state.messages[-(self.max_messages // 2):]
+            state.last_message_id = assistant_message_id
+
+    def invalidate(self, session_id):
+        with self._lock:
+            self._states.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._states),
+                'rebuilds': self.rebuilds,
+                'reuses': self.reuses,
+            }
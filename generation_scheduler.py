@@ -0,0 +1,166 @@
+"""Admission control for model generations.
+
+A Raspberry Pi 5 can only run about one generation at a time; sending every
+chat turn to Ollama concurrently just makes all of them slow down together
+until they time out. GenerationScheduler admits at most ``max_concurrent``
+generations, queues the rest round-robin across users so one busy user
+cannot starve the others, and sheds load once the queue is full.
+
+Waiting is done by polling with the caller's sleep function (socketio.sleep),
+so it cooperates with eventlet without relying on monkey-patched primitives.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class QueueFull(Exception):
+    """Raised when the generation queue is at its maximum depth"""
+
+
+class GenerationTicket:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+        self.released_at = None
+        self.cancelled = False
+
+    @property
+    def admitted(self):
+        return self.admitted_at is not None
+
+    @property
+    def wait_ms(self):
+        end = self.admitted_at or time.monotonic()
+        return round((end - self.enqueued_at) * 1000, 1)
+
+    @property
+    def service_ms(self):
+        if self.admitted_at is None:
+            return 0.0
+        end = self.released_at or time.monotonic()
+        return round((end - self.admitted_at) * 1000, 1)
+
+
+class GenerationScheduler:
+    """Concurrency-limited, per-user round-robin queue in front of Ollama"""
+
+    def __init__(self, max_concurrent=1, max_queue_depth=16):
+        self.max_concurrent = max_concurrent
+        self.max_queue_depth = max_queue_depth
+        self._lock = threading.Lock()
+        # user_id -> deque of waiting tickets; dict order is the round-robin ring
+        self._queues = OrderedDict()
+        self._waiting = 0
+        self._active = 0
+        self._stats = {
+            'admitted': 0,
+            'shed': 0,
+            'cancelled': 0,
+            'completed': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+            'service_ms_total': 0.0,
+            'service_ms_max': 0.0,
+        }
+
+    def submit(self, user_id):
+        """Queue a generation for user_id; raises QueueFull when shedding load"""
+        ticket = GenerationTicket(user_id)
+        with self._lock:
+            if self._waiting >= self.max_queue_depth:
+                self._stats['shed'] += 1
+                raise QueueFull(f'{self._waiting} generations already waiting')
+            self._queues.setdefault(user_id, deque()).append(ticket)
+            self._waiting += 1
+            self._dispatch()
+        return ticket
+
+    def _dispatch(self):
+        # Caller holds the lock
+        while self._active < self.max_concurrent and self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            self._waiting -= 1
+            self._active += 1
+            ticket.admitted_at = time.monotonic()
+            self._stats['admitted'] += 1
+            self._stats['wait_ms_total'] += ticket.wait_ms
+            self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], ticket.wait_ms)
+
+    def position(self, ticket):
+        """1-based place of a waiting ticket in round-robin admission order (0 once admitted)"""
+        with self._lock:
+            if ticket.admitted or ticket.cancelled:
+                return 0
+            queue = self._queues.get(ticket.user_id)
+            if not queue or ticket not in queue:
+                return 0
+            index = queue.index(ticket)
+            owner_index = list(self._queues).index(ticket.user_id)
+            ahead = 0
+            for ring_index, other in enumerate(self._queues.values()):
+                # Users earlier in the ring get one extra turn before ours
+                rounds = index + (1 if ring_index < owner_index else 0)
+                ahead += min(len(other), rounds)
+            return ahead + 1
+
+    def wait(self, ticket, sleep, on_position=None, is_cancelled=None, poll_interval=0.25):
+        """Block (cooperatively) until admitted; returns False if cancelled while waiting"""
+        last_position = None
+        while not ticket.admitted:
+            if is_cancelled and is_cancelled():
+                self.release(ticket)
+                return False
+            position = self.position(ticket)
+            if on_position and position and position != last_position:
+                on_position(position, self.queued())
+                last_position = position
+            sleep(poll_interval)
+        return True
+
+    def release(self, ticket):
+        """Finish an admitted generation, or drop a ticket that is still waiting"""
+        with self._lock:
+            if ticket.released_at is not None or ticket.cancelled:
+                return
+            if not ticket.admitted:
+                queue = self._queues.get(ticket.user_id)
+                if queue and ticket in queue:
+                    queue.remove(ticket)
+                    self._waiting -= 1
+                    if not queue:
+                        del self._queues[ticket.user_id]
+                ticket.cancelled = True
+                self._stats['cancelled'] += 1
+                return
+            ticket.released_at = time.monotonic()
+            self._active -= 1
+            self._stats['completed'] += 1
+            self._stats['service_ms_total'] += ticket.service_ms
+            self._stats['service_ms_max'] = max(self._stats['service_ms_max'], ticket.service_ms)
+            self._dispatch()
+
+    def queued(self):
+        with self._lock:
+            return self._waiting
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            admitted = stats['admitted'] or 1
+            completed = stats['completed'] or 1
+            stats.update({
+                'active': self._active,
+                'queued': self._waiting,
+                'max_concurrent': self.max_concurrent,
+                'max_queue_depth': self.max_queue_depth,
+                'avg_wait_ms': round(stats['wait_ms_total'] / admitted, 1),
+                'avg_service_ms': round(stats['service_ms_total'] / completed, 1),
+            })
+            return stats
@@ -0,0 +1,197 @@
+"""Offline full-text retrieval over fetched pages and curated documents.
+
+Documents an admin adds, plus the text of pages fetched for web searches
+(the snippet, or a longer extract when LOCAL_INDEX_WEB_PAGES is on), are stored in a small SQLite file with an
+FTS5 index kept in sync by triggers. search_web asks this index first and
+only goes to DuckDuckGo when it has no fresh match, so common lookups take
+milliseconds and still work when the Pi has no network.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+_WORDS = re.compile(r'\w+', re.UNICODE)
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'about', 'at', 'be', 'by', 'can', 'could', 'do', 'does', 'for',
+    'from', 'how', 'i', 'in', 'is', 'it', 'me', 'my', 'of', 'on', 'or', 'please', 'tell',
+    'that', 'the', 'this', 'to', 'was', 'what', 'whats', 'when', 'where', 'which', 'who',
+    'why', 'will', 'with', 'you', 'your',
+}
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS documents ('
+    'id INTEGER PRIMARY KEY, url TEXT UNIQUE, title TEXT NOT NULL, body TEXT NOT NULL, '
+    "source TEXT NOT NULL DEFAULT 'web', fetched_at REAL NOT NULL)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5("
+    "title, body, content='documents', content_rowid='id', tokenize='porter unicode61')",
+    # External-content triggers keep the index incremental
+    'CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN '
+    'INSERT INTO documents_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END',
+    'CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN '
+    "INSERT INTO documents_fts(documents_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END",
+    'CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN '
+    "INSERT INTO documents_fts(documents_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+    'INSERT INTO documents_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END',
+]
+
+
+def match_query(text, match_any=False):
+    """FTS5 MATCH expression for free text (None if it has no searchable words)"""
+    terms = []
+    for word in _WORDS.findall(text.lower()):
+        if word not in STOPWORDS and word not in terms:
+            terms.append(word)
+    if not terms:
+        return None
+    return (' OR ' if match_any else ' AND ').join(f'"{term}"' for term in terms)
+
+
+class LocalIndex:
+    """SQLite FTS5 index of page texts and admin documents, ranked with BM25"""
+
+    def __init__(self, path, snippet_length=300):
+        self.path = path
+        self.snippet_length = snippet_length
+        self._lock = threading.Lock()
+        self._stats = {'lookups': 0, 'hits': 0, 'indexed': 0, 'lookup_ms_total': 0.0}
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _init_db(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connect() as conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+        except sqlite3.Error as e:
+            print(f"Local retrieval index disabled: {e}")
+            self.path = None
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def add_page(self, url, title, text, source='web'):
+        """Insert or refresh the text of a page (keyed on URL)"""
+        if not self.enabled or not text:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT INTO documents (url, title, body, source, fetched_at) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT(url) DO UPDATE SET title = excluded.title, body = excluded.body, '
+                    'fetched_at = excluded.fetched_at',
+                    (url, title or url, text, source, time.time())
+                )
+            with self._lock:
+                self._stats['indexed'] += 1
+        except sqlite3.Error as e:
+            print(f"Local index write error: {e}")
+
+    def touch(self, url):
+        """Mark a page as fresh again (its server answered 304 Not Modified)"""
+        if not self.enabled:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute('UPDATE documents SET fetched_at = ? WHERE url = ?', (time.time(), url))
+        except sqlite3.Error as e:
+            print(f"Local index write error: {e}")
+
+    def add_document(self, title, body, url=None):
+        """Add an admin-curated document; returns its id"""
+        if not self.enabled:
+            return None
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO documents (url, title, body, source, fetched_at) VALUES (?, ?, ?, ?, ?)',
+                (url or None, title, body, 'admin', time.time())
+            )
+            return cursor.lastrowid
+
+    def delete_document(self, document_id):
+        if not self.enabled:
+            return False
+        with self._connect() as conn:
+            return conn.execute('DELETE FROM documents WHERE id = ?', (document_id,)).rowcount > 0
+
+    def documents(self, source='admin'):
+        if not self.enabled:
+            return []
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT id, url, title, length(body), fetched_at FROM documents '
+                'WHERE source = ? ORDER BY fetched_at DESC', (source,)
+            ).fetchall()
+        return [{'id': row[0], 'url': row[1], 'title': row[2], 'length': row[3], 'added_at': row[4]}
+                for row in rows]
+
+    def search(self, query, limit=3, max_age=None, match_any=False):
+        """Best BM25 matches as [{'title', 'url', 'snippet', 'source', 'fetched_at'}].
+
+        Web pages older than max_age seconds are skipped (admin documents
+        never go stale); match_any relaxes the query from all terms to any.
+        """
+        expression = match_query(query, match_any)
+        if not self.enabled or expression is None:
+            return []
+
+        started = time.perf_counter()
+        sql = ("SELECT d.id, d.url, d.title, d.source, d.fetched_at, "
+               "snippet(documents_fts, 1, '', '', ' ... ', 40) "
+               "FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid "
+               "WHERE documents_fts MATCH ?")
+        params = [expression]
+        if max_age is not None:
+            sql += " AND (d.source = 'admin' OR d.fetched_at >= ?)"
+            params.append(time.time() - max_age)
+        # Title matches count more than body matches
+        sql += ' ORDER BY bm25(documents_fts, 5.0, 1.0) LIMIT ?'
+        params.append(limit)
+
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            print(f"Local index search error: {e}")
+            return []
+
+        results = []
+        for document_id, url, title, source, fetched_at, snippet in rows:
+            snippet = snippet.strip()
+            if len(snippet) > self.snippet_length:
+                snippet = snippet[:self.snippet_length] + "..."
+            results.append({
+                'title': title,
+                'url': url or f'local-document:{document_id}',
+                'snippet': snippet,
+                'source': source,
+                'fetched_at': fetched_at,
+            })
+
+        with self._lock:
+            self._stats['lookups'] += 1
+            self._stats['hits'] += 1 if results else 0
+            self._stats['lookup_ms_total'] += (time.perf_counter() - started) * 1000
+        return results
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['lookups'] or 1
+        stats['avg_lookup_ms'] = round(stats.pop('lookup_ms_total') / lookups, 2)
+        stats['enabled'] = self.enabled
+        if self.enabled:
+            try:
+                with self._connect() as conn:
+                    for source, count in conn.execute('SELECT source, COUNT(*) FROM documents GROUP BY source'):
+                        stats[f'{source}_documents'] = count
+            except sqlite3.Error:
+                pass
+        return stats
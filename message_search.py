@@ -0,0 +1,129 @@
+"""Full-text search over chat history.
+
+An FTS5 index over ChatMessage.content lives in the main SQLite database.
+It is an external-content table, so message text is not stored twice; the
+content source is a view that adds an ``owner`` token (``u<user_id>``) for
+each message. Every query is ANDed with the caller's owner token, so FTS5
+only intersects posting lists for that user instead of scanning the table.
+Triggers on chat_message keep the index in sync on insert, update and delete.
+
+Ranking and highlighting are two queries: the first ranks matching rowids
+with BM25 and keeps the top few, the second builds snippets for just those,
+since snippet() reads each message back through the view.
+"""
+import html
+import time
+from datetime import datetime
+
+from local_index import match_query
+from models import db
+
+# Highlight markers that cannot occur in message text; replaced after escaping
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+SCHEMA = [
+    'CREATE VIEW IF NOT EXISTS chat_message_search_source AS '
+    "SELECT m.id AS id, m.content AS content, 'u' || s.user_id AS owner "
+    'FROM chat_message m JOIN chat_session s ON s.id = m.session_id',
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_message_fts USING fts5("
+    "content, owner, content='chat_message_search_source', content_rowid='id', "
+    "tokenize='porter unicode61')",
+    'CREATE TRIGGER IF NOT EXISTS chat_message_fts_ai AFTER INSERT ON chat_message BEGIN '
+    'INSERT INTO chat_message_fts(rowid, content, owner) VALUES ('
+    "new.id, new.content, (SELECT 'u' || user_id FROM chat_session WHERE id = new.session_id)); END",
+    # Messages are deleted before their session, so the owner is still known here
+    'CREATE TRIGGER IF NOT EXISTS chat_message_fts_bd BEFORE DELETE ON chat_message BEGIN '
+    "INSERT INTO chat_message_fts(chat_message_fts, rowid, content, owner) VALUES ('delete', "
+    "old.id, old.content, (SELECT 'u' || user_id FROM chat_session WHERE id = old.session_id)); END",
+    'CREATE TRIGGER IF NOT EXISTS chat_message_fts_au AFTER UPDATE OF content ON chat_message BEGIN '
+    "INSERT INTO chat_message_fts(chat_message_fts, rowid, content, owner) VALUES ('delete', "
+    "old.id, old.content, (SELECT 'u' || user_id FROM chat_session WHERE id = old.session_id)); "
+    'INSERT INTO chat_message_fts(rowid, content, owner) VALUES ('
+    "new.id, new.content, (SELECT 'u' || user_id FROM chat_session WHERE id = new.session_id)); END",
+]
+
+RANK_SQL = (
+    'SELECT rowid, rank FROM chat_message_fts '
+    'WHERE chat_message_fts MATCH :expression ORDER BY rank LIMIT :limit'
+)
+
+DETAIL_SQL = db.text(
+    'SELECT m.id, m.session_id, s.title, m.role, m.timestamp, '
+    f"snippet(chat_message_fts, 0, '{_MARK_START}', '{_MARK_END}', ' ... ', 24) "
+    'FROM chat_message_fts '
+    'JOIN chat_message m ON m.id = chat_message_fts.rowid '
+    'JOIN chat_session s ON s.id = m.session_id '
+    'WHERE chat_message_fts MATCH :expression AND chat_message_fts.rowid IN :ids '
+    'AND s.user_id = :user_id'
+).bindparams(db.bindparam('ids', expanding=True))
+
+
+def available():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def ensure_index():
+    """Create the index and its triggers, filling it from existing messages once"""
+    if not available():
+        print("Message search needs SQLite FTS5; skipping index setup")
+        return False
+    exists = db.session.execute(db.text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_message_fts'"
+    )).first()
+    for statement in SCHEMA:
+        db.session.execute(db.text(statement))
+    if not exists:
+        db.session.execute(db.text("INSERT INTO chat_message_fts(chat_message_fts) VALUES ('rebuild')"))
+        print("Built chat message search index")
+    db.session.commit()
+    return True
+
+
+def _highlight(snippet):
+    escaped = html.escape(snippet)
+    return escaped.replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def _timestamp(value):
+    # Raw SQL returns SQLite's "YYYY-MM-DD HH:MM:SS.ffffff"; the API uses ISO 8601
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.isoformat() if value else None
+
+
+def search_messages(user_id, query, limit=20):
+    """Ranked hits for one user's messages as (results, took_ms)"""
+    expression = match_query(query)
+    if expression is None:
+        return [], 0.0
+    # The owner token restricts matching to this user's messages inside FTS5
+    expression = f'owner : "u{int(user_id)}" AND content : ({expression})'
+    started = time.perf_counter()
+    ranked = db.session.execute(db.text(RANK_SQL), {'expression': expression, 'limit': limit}).fetchall()
+    if not ranked:
+        return [], round((time.perf_counter() - started) * 1000, 2)
+
+    rows = db.session.execute(DETAIL_SQL, {
+        'expression': expression,
+        'ids': [row[0] for row in ranked],
+        'user_id': user_id,
+    }).fetchall()
+    took_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    details = {row[0]: row for row in rows}
+    results = []
+    for message_id, rank in ranked:
+        row = details.get(message_id)
+        if row is None:
+            continue
+        results.append({
+            'message_id': row[0],
+            'session_id': row[1],
+            'session_title': row[2],
+            'role': row[3],
+            'timestamp': _timestamp(row[4]),
+            'highlight': _highlight(row[5]),
+            'score': -rank,
+        })
+    return results, took_ms
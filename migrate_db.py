@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations for the SQLite database.
+
+db.create_all() only creates missing tables, so columns and indexes added
+after a database was first created never reach an existing deployment.
+Each migration below has a version number; the highest applied version is
+kept in the database header (PRAGMA user_version) and pending migrations
+run in order, each inside its own transaction, when the app starts.
+
+Usage:
+    python3 migrate_db.py [--status] [path/to/chatbot.db]
+
+The default path is instance/chatbot.db, where Flask-SQLAlchemy puts
+sqlite:///chatbot.db.
+"""
+import argparse
+import os
+import sqlite3
+
+import usage_rollup
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'chatbot.db')
+
+# Composite indexes for the hot queries: a session's messages in order, a
+# user's sessions newest first, a user's rating of a session, and the 24 h
+# windows on the status page. models.py declares the same indexes so new
+# databases get them from create_all().
+HOT_PATH_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS ix_chat_message_session_timestamp ON chat_message (session_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS ix_chat_message_timestamp ON chat_message (timestamp)',
+    'CREATE INDEX IF NOT EXISTS ix_chat_session_user_created ON chat_session (user_id, created_at)',
+    'CREATE INDEX IF NOT EXISTS ix_chat_session_created ON chat_session (created_at)',
+    'CREATE INDEX IF NOT EXISTS ix_model_rating_session_user ON model_rating (session_id, user_id)',
+]
+
+
+# Tables added to models.py after the first release. The app gets them from
+# create_all(), but the migrations below must also run on a database that
+# only has the original tables (python3 migrate_db.py old.db).
+MESSAGE_METRICS_TABLE = (
+    'CREATE TABLE IF NOT EXISTS message_metrics ('
+    'id INTEGER NOT NULL PRIMARY KEY, message_id INTEGER NOT NULL UNIQUE REFERENCES chat_message (id), '
+    'model_name VARCHAR(50) NOT NULL, prompt_tokens INTEGER, completion_tokens INTEGER, '
+    'prompt_eval_ms FLOAT, eval_ms FLOAT, load_ms FLOAT, total_ms FLOAT, wall_time_ms FLOAT, '
+    'time_to_first_token_ms FLOAT, queue_wait_ms FLOAT, tokens_per_second FLOAT, '
+    'estimated BOOLEAN, cached BOOLEAN, created_at DATETIME)'
+)
+LATENCY_ROLLUP_TABLE = [
+    'CREATE TABLE IF NOT EXISTS latency_rollup ('
+    'id INTEGER NOT NULL PRIMARY KEY, model_name VARCHAR(50) NOT NULL, hour DATETIME NOT NULL, '
+    'prompt_bucket VARCHAR(20) NOT NULL, samples INTEGER, ttft_ms_sum FLOAT, tps_sum FLOAT, '
+    'prompt_eval_ms_sum FLOAT, eval_ms_sum FLOAT, ttft_histogram TEXT NOT NULL, tps_histogram TEXT NOT NULL, '
+    'UNIQUE (model_name, hour, prompt_bucket))',
+    'CREATE INDEX IF NOT EXISTS ix_latency_rollup_hour ON latency_rollup (hour)',
+]
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def _add_columns(*columns):
+    """Migration step adding (table, column, definition) columns that are missing"""
+    def step(conn):
+        for table, column, definition in columns:
+            if column not in _columns(conn, table):
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return step
+
+
+def _run_statements(statements):
+    def step(conn):
+        for statement in statements:
+            conn.execute(statement)
+    return step
+
+
+def _steps(*steps):
+    def step(conn):
+        for each in steps:
+            each(conn)
+    return step
+
+
+# (version, description, step); never renumber or edit an applied migration
+MIGRATIONS = [
+    (1, 'Add chat_session.web_search and message_metrics prompt budget columns', _steps(
+        _run_statements([MESSAGE_METRICS_TABLE]),
+        _add_columns(
+            ('chat_session', 'web_search', "VARCHAR(10) DEFAULT 'auto'"),
+            ('message_metrics', 'prompt_budget', 'INTEGER'),
+            ('message_metrics', 'prompt_estimate', 'INTEGER'),
+        ),
+    )),
+    (2, 'Index hot query paths', _run_statements(HOT_PATH_INDEXES)),
+    (3, 'Add hourly usage_rollup counters kept up to date by triggers',
+     _run_statements(usage_rollup.SCHEMA + usage_rollup.REBUILD)),
+    (4, 'Add chat_session.archived_at and the archived_session index', _steps(
+        _add_columns(('chat_session', 'archived_at', 'DATETIME')),
+        _run_statements([
+            'CREATE TABLE IF NOT EXISTS archived_session ('
+            'session_id INTEGER NOT NULL PRIMARY KEY REFERENCES chat_session (id), '
+            'segment VARCHAR(64) NOT NULL, byte_offset INTEGER NOT NULL, byte_length INTEGER NOT NULL, '
+            'message_count INTEGER, archived_at DATETIME)',
+        ]),
+    )),
+    (5, 'Skip usage_rollup message and metrics triggers while sessions are archived', _run_statements(
+        [f'DROP TRIGGER IF EXISTS {name}' for name in usage_rollup.PAUSABLE_TRIGGERS] + usage_rollup.SCHEMA
+    )),
+    (6, 'Record the time range of archived messages for incremental exports', _add_columns(
+        ('archived_session', 'first_message_at', 'DATETIME'),
+        ('archived_session', 'last_message_at', 'DATETIME'),
+    )),
+    (7, 'Add the hourly latency_rollup histograms', _run_statements(LATENCY_ROLLUP_TABLE)),
+    (8, 'Count archived messages per day for the usage statistics', _run_statements([
+        'CREATE TABLE IF NOT EXISTS archived_message_day ('
+        'session_id INTEGER NOT NULL REFERENCES chat_session (id), day VARCHAR(10) NOT NULL, '
+        'messages INTEGER NOT NULL, PRIMARY KEY (session_id, day))',
+    ])),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def configure_connection(conn, busy_timeout_ms=5000):
+    """Per-connection settings: WAL journal, NORMAL sync and a busy timeout.
+
+    WAL lets the status page and history reads run while a response is being
+    saved, and with WAL synchronous=NORMAL only syncs at checkpoints, which
+    matters on an SD card. The journal mode is stored in the file, the other
+    two have to be set on every connection.
+    """
+    conn.execute(f'PRAGMA busy_timeout = {int(busy_timeout_ms)}')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations to a sqlite3 connection; returns the versions applied"""
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+        conn.execute('BEGIN')
+        try:
+            step(conn)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        print(f"Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply pending schema migrations')
+    parser.add_argument('path', nargs='?', default=DEFAULT_DB_PATH)
+    parser.add_argument('--status', action='store_true', help='show the schema version and exit')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} does not exist; start the app once to create it")
+
+    # Autocommit mode, so migrate() controls the transactions
+    conn = sqlite3.connect(args.path, isolation_level=None)
+    try:
+        version = current_version(conn)
+        print(f"{args.path}: schema version {version} (latest {LATEST_VERSION})")
+        if args.status:
+            for number, description, _ in MIGRATIONS:
+                print(f"  {'applied' if number <= version else 'pending'}  {number}: {description}")
+            return
+        configure_connection(conn)
+        if not migrate(conn):
+            print("Database is up to date")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""In-process cache of the models installed in Ollama.
+
+Reading the model list used to cost a synchronous ``/api/tags`` round trip on
+every session creation and admin page call, which stalls for seconds while
+Ollama is busy generating. ModelCatalog keeps the last good listing in memory,
+refreshes it in the background once it is older than the TTL, and keeps
+serving the stale copy while Ollama is slow or unreachable.
+"""
+import threading
+import time
+
+# Don't retry a failed fetch more often than this while serving stale data
+FAILURE_BACKOFF_SECONDS = 10
+FETCH_TIMEOUT = (1, 3)
+
+
+class ModelCatalog:
+    """TTL-cached model list with per-model metadata"""
+
+    def __init__(self, client, ttl=60):
+        self.client = client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._models = {}
+        self._loaded = False
+        self._fetched_at = 0.0
+        self._last_attempt = 0.0
+        self._last_error = None
+        self._refreshing = False
+        self._spawn = None
+
+    def start(self, socketio):
+        """Start the background refresher on the Socket.IO async backend"""
+        self._spawn = socketio.start_background_task
+        socketio.start_background_task(self._refresh_loop, socketio.sleep)
+
+    def _refresh_loop(self, sleep):
+        while True:
+            self.refresh()
+            sleep(self.ttl)
+
+    def refresh(self):
+        """Fetch /api/tags now and replace the cached listing; returns True on success"""
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+            self._last_attempt = time.monotonic()
+
+        try:
+            response = self.client.get('/api/tags', timeout=FETCH_TIMEOUT)
+            if response.status_code != 200:
+                raise RuntimeError(f'HTTP {response.status_code}')
+            models = {}
+            for entry in response.json().get('models', []):
+                details = entry.get('details') or {}
+                models[entry['name']] = {
+                    'name': entry['name'],
+                    'size': entry.get('size', 0),
+                    'digest': entry.get('digest'),
+                    'modified_at': entry.get('modified_at'),
+                    'family': details.get('family'),
+                    'parameter_size': details.get('parameter_size'),
+                    'quantization': details.get('quantization_level'),
+                    'format': details.get('format'),
+                }
+        except Exception as e:
+            print(f"Model catalogue refresh failed: {e}")
+            with self._lock:
+                self._last_error = str(e)
+                self._refreshing = False
+            return False
+
+        with self._lock:
+            self._models = models
+            self._loaded = True
+            self._fetched_at = time.monotonic()
+            self._last_error = None
+            self._refreshing = False
+        return True
+
+    def invalidate(self):
+        """Drop freshness after a model was pulled and reload the listing right away"""
+        with self._lock:
+            self._fetched_at = 0.0
+            self._last_attempt = 0.0
+        self.refresh()
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        with self._lock:
+            loaded = self._loaded
+            expired = now - self._fetched_at > self.ttl
+            backing_off = now - self._last_attempt < FAILURE_BACKOFF_SECONDS
+            refreshing = self._refreshing
+
+        if not expired or backing_off or refreshing:
+            return
+        if loaded and self._spawn:
+            # Serve the stale copy and let a green thread reload it
+            self._spawn(self.refresh)
+        else:
+            self.refresh()
+
+    def names(self):
+        """Return installed model names (empty if Ollama has never answered)"""
+        self._ensure_fresh()
+        with self._lock:
+            return list(self._models)
+
+    def get(self, name):
+        """Return cached metadata for one model, or None if it is not installed"""
+        self._ensure_fresh()
+        with self._lock:
+            model = self._models.get(name)
+            return dict(model) if model else None
+
+    def all(self):
+        """Return cached metadata for every installed model"""
+        self._ensure_fresh()
+        with self._lock:
+            return [dict(model) for model in self._models.values()]
+
+    def status(self):
+        with self._lock:
+            age = time.monotonic() - self._fetched_at if self._loaded else None
+            return {
+                'loaded': self._loaded,
+                'model_count': len(self._models),
+                'age_seconds': round(age, 1) if age is not None else None,
+                'stale': age is None or age > self.ttl,
+                'last_error': self._last_error,
+            }
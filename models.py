@@ -25,6 +25,11 @@ class User(UserMixin, db.Model):
     ratings = db.relationship('ModelRating', backref='user', lazy=True)
 
 class ChatSession(db.Model):
+    __table_args__ = (
+        db.Index('ix_chat_session_user_created', 'user_id', 'created_at'),
+        db.Index('ix_chat_session_created', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     model_name = db.Column(db.String(50), nullable=False)
@@ -38,12 +43,19 @@ class ChatSession(db.Model):
     top_p = db.Column(db.Float, default=0.9)  # Nucleus sampling (0.1-1.0)
     top_k = db.Column(db.Integer, default=40)  # Top-k sampling (1-100)
     repeat_penalty = db.Column(db.Float, default=1.1)  # Repetition penalty (0.5-2.0)
+    web_search = db.Column(db.String(10), default='auto')  # 'auto', 'on' or 'off'
+    archived_at = db.Column(db.DateTime)  # Set while the messages live in the session archive
     
     # Relationships
     messages = db.relationship('ChatMessage', backref='session', lazy=True, cascade='all, delete-orphan')
     ratings = db.relationship('ModelRating', backref='session', lazy=True)
 
 class ChatMessage(db.Model):
+    __table_args__ = (
+        db.Index('ix_chat_message_session_timestamp', 'session_id', 'timestamp'),
+        db.Index('ix_chat_message_timestamp', 'timestamp'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id'), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # 'user' or 'assistant'
@@ -51,6 +63,10 @@ class ChatMessage(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
 class ModelRating(db.Model):
+    __table_args__ = (
+        db.Index('ix_model_rating_session_user', 'session_id', 'user_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -71,3 +87,59 @@ class UserFeedback(db.Model):
     
     # Relationships
     user = db.relationship('User', backref='feedback', lazy=True)
+
+class MessageMetrics(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('chat_message.id'), nullable=False, unique=True)
+    model_name = db.Column(db.String(50), nullable=False)
+    prompt_tokens = db.Column(db.Integer, default=0)  # Ollama prompt_eval_count
+    completion_tokens = db.Column(db.Integer, default=0)  # Ollama eval_count
+    prompt_eval_ms = db.Column(db.Float, default=0.0)
+    eval_ms = db.Column(db.Float, default=0.0)
+    load_ms = db.Column(db.Float, default=0.0)
+    total_ms = db.Column(db.Float, default=0.0)  # Ollama total_duration
+    wall_time_ms = db.Column(db.Float, default=0.0)  # Measured by the server, excluding queue wait
+    time_to_first_token_ms = db.Column(db.Float, default=0.0)
+    queue_wait_ms = db.Column(db.Float, default=0.0)
+    tokens_per_second = db.Column(db.Float, default=0.0)  # eval_count / eval_duration
+    estimated = db.Column(db.Boolean, default=False)  # True when Ollama gave no final counts (stopped)
+    cached = db.Column(db.Boolean, default=False)  # Served from the response cache
+    prompt_budget = db.Column(db.Integer)  # Token budget the prompt was fitted into
+    prompt_estimate = db.Column(db.Integer)  # Estimated prompt tokens before sending
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    message = db.relationship('ChatMessage', backref=db.backref('metrics', uselist=False, cascade='all, delete-orphan'), lazy=True)
+
+# Location of an archived session's messages in the append-only archive segments
+class ArchivedSession(db.Model):
+    session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id'), primary_key=True)
+    segment = db.Column(db.String(64), nullable=False)  # File name inside the archive directory
+    byte_offset = db.Column(db.Integer, nullable=False)  # Start of the session's gzip member
+    byte_length = db.Column(db.Integer, nullable=False)
+    message_count = db.Column(db.Integer, default=0)
+    first_message_at = db.Column(db.DateTime)  # Time range of the archived messages
+    last_message_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Archived messages per UTC day, so per-day statistics still count them
+class ArchivedMessageDay(db.Model):
+    session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id'), primary_key=True)
+    day = db.Column(db.String(10), primary_key=True)  # YYYY-MM-DD, as SQLite's date() returns
+    messages = db.Column(db.Integer, nullable=False, default=0)
+
+# Hourly per-model latency histograms, one row per model, hour and prompt-size bucket
+class LatencyRollup(db.Model):
+    __table_args__ = (db.UniqueConstraint('model_name', 'hour', 'prompt_bucket'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    model_name = db.Column(db.String(50), nullable=False)
+    hour = db.Column(db.DateTime, nullable=False, index=True)  # UTC, truncated to the hour
+    prompt_bucket = db.Column(db.String(20), nullable=False)
+    samples = db.Column(db.Integer, default=0)
+    ttft_ms_sum = db.Column(db.Float, default=0.0)
+    tps_sum = db.Column(db.Float, default=0.0)
+    prompt_eval_ms_sum = db.Column(db.Float, default=0.0)
+    eval_ms_sum = db.Column(db.Float, default=0.0)
+    ttft_histogram = db.Column(db.Text, nullable=False, default='[]')  # JSON bucket counts
+    tps_histogram = db.Column(db.Text, nullable=False, default='[]')
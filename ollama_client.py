@@ -0,0 +1,176 @@
+"""Shared HTTP client for the local Ollama server.
+
+Every code path that talks to Ollama (chat streaming, model listing, status
+checks and model downloads) goes through one OllamaClient so TCP connections
+are kept alive and reused instead of being set up again on every call.
+The client only uses blocking socket calls from ``requests``/``urllib3``,
+which eventlet monkey-patches, so it is safe to share between green threads.
+"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# (connect, read) timeouts in seconds for each Ollama endpoint
+ENDPOINT_TIMEOUTS = {
+    '/api/tags': (2, 5),
+    '/api/ps': (2, 5),
+    '/api/show': (2, 10),
+    '/api/version': (2, 5),
+    '/api/generate': (5, 120),
+    '/api/chat': (5, 120),
+    '/api/pull': (5, 1800),
+}
+DEFAULT_TIMEOUT = (5, 60)
+
+# Read-only endpoints that can safely be retried
+IDEMPOTENT_ENDPOINTS = {'/api/tags', '/api/ps', '/api/show', '/api/version'}
+RETRY_STATUS_CODES = {502, 503, 504}
+
+# Per green thread accounting of time spent opening new connections
+_timing = threading.local()
+
+
+class _TimedConnectionMixin:
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            _timing.connect_seconds = getattr(_timing, 'connect_seconds', 0.0) + (time.perf_counter() - started)
+            _timing.connections = getattr(_timing, 'connections', 0) + 1
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools record how long new connections take to open"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+class OllamaClient:
+    """Keep-alive connection pool to Ollama with timeouts, retries and timing counters"""
+
+    def __init__(self, base_url, pool_size=4, max_retries=2, backoff=0.25):
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        # At most pool_size idle connections are kept open; extra concurrent
+        # requests get a throwaway connection instead of blocking.
+        self._session = requests.Session()
+        adapter = _TimedAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def request(self, method, path, timeout=None, **kwargs):
+        """Send a request to Ollama, retrying idempotent endpoints with backoff.
+
+        Raises the usual ``requests`` exceptions once retries are exhausted.
+        Streaming callers must close the returned response (or read it to the
+        end) so its connection goes back to the pool.
+        """
+        if timeout is None:
+            timeout = ENDPOINT_TIMEOUTS.get(path, DEFAULT_TIMEOUT)
+        attempts = 1 + (self.max_retries if path in IDEMPOTENT_ENDPOINTS else 0)
+        url = self.base_url + path
+
+        for attempt in range(attempts):
+            _timing.connect_seconds = 0.0
+            _timing.connections = 0
+            try:
+                response = self._session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._record(path, None)
+                if attempt + 1 >= attempts:
+                    raise
+            else:
+                self._record(path, response)
+                if response.status_code not in RETRY_STATUS_CODES or attempt + 1 >= attempts:
+                    return response
+                response.close()
+
+            self._increment(path, 'retries')
+            time.sleep(self.backoff * (2 ** attempt))
+
+    def _endpoint_stats(self, path):
+        stats = self._stats.get(path)
+        if stats is None:
+            stats = self._stats[path] = {
+                'requests': 0,
+                'errors': 0,
+                'retries': 0,
+                'connections_opened': 0,
+                'connect_seconds': 0.0,
+                'first_byte_seconds': 0.0,
+            }
+        return stats
+
+    def _increment(self, path, counter):
+        with self._lock:
+            self._endpoint_stats(path)[counter] += 1
+
+    def _record(self, path, response):
+        connect_seconds = getattr(_timing, 'connect_seconds', 0.0)
+        connections = getattr(_timing, 'connections', 0)
+        with self._lock:
+            stats = self._endpoint_stats(path)
+            stats['requests'] += 1
+            stats['connections_opened'] += connections
+            stats['connect_seconds'] += connect_seconds
+            if response is None:
+                stats['errors'] += 1
+            else:
+                # response.elapsed covers connect + send + wait for headers
+                waited = response.elapsed.total_seconds() - connect_seconds
+                stats['first_byte_seconds'] += max(waited, 0.0)
+
+    def stats(self):
+        """Return a snapshot of per-endpoint counters with averages in milliseconds"""
+        with self._lock:
+            snapshot = {}
+            for path, stats in self._stats.items():
+                requests_made = stats['requests'] or 1
+                snapshot[path] = dict(
+                    stats,
+                    connect_seconds=round(stats['connect_seconds'], 3),
+                    first_byte_seconds=round(stats['first_byte_seconds'], 3),
+                    avg_connect_ms=round(stats['connect_seconds'] * 1000 / requests_made, 2),
+                    avg_first_byte_ms=round(stats['first_byte_seconds'] * 1000 / requests_made, 2),
+                )
+            return snapshot
+
+    def close(self):
+        self._session.close()
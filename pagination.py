@@ -0,0 +1,52 @@
+"""Keyset (cursor) pagination for history lists.
+
+OFFSET pagination reads and throws away every row before the page, so it
+gets slower the further back a user scrolls. Keyset pagination remembers
+the (timestamp, id) of the last row it returned and asks for rows strictly
+before it, which the (owner, timestamp) indexes answer with one range seek
+however much history there is. The id breaks ties between rows written in
+the same instant.
+
+Cursors are opaque URL-safe strings; clients pass back what they were given.
+"""
+import base64
+from datetime import datetime
+
+from models import db
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor this module did not produce"""
+
+
+def encode_cursor(timestamp, row_id):
+    raw = f'{timestamp.isoformat()}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from a cursor; raises InvalidCursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor!r}') from e
+
+
+def keyset_page(query, time_column, id_column, before=None, limit=50):
+    """Newest-first page of ``query`` older than the ``before`` cursor.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if before:
+        timestamp, row_id = decode_cursor(before)
+        query = query.filter(db.tuple_(time_column, id_column) < (timestamp, row_id))
+    rows = query.order_by(time_column.desc(), id_column.desc()).limit(limit + 1).all()
+
+    # One extra row tells us whether there is another page without a COUNT
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, time_column.key), getattr(last, id_column.key))
@@ -0,0 +1,235 @@
+"""Write-behind persistence for chat messages and ratings.
+
+SQLite allows one writer at a time, and a commit that waits on the lock or
+on an fsync is a blocking C call that eventlet cannot patch: run on the hub
+it stalls the only worker and every stream it is serving. Handlers hand
+their writes to WriteBehindQueue instead. A writer running in a real OS
+thread (unpatched even under eventlet) drains the queue in FIFO batches
+and commits each batch as one transaction on its own engine and session,
+so several messages cost one fsync and the hub never waits on the disk.
+
+Committed batches come back through a second queue and are collected on
+the Socket.IO async backend, which runs the on_commit callbacks and
+updates the pending counts, so application state is only touched from
+the hub. Jobs are committed in submission order, so writes for one chat
+session reach the database in the order they were made. Readers that need
+their own writes (the next turn, the history endpoint) call
+wait_for(session_id) first. Anything still queued is written by close()
+at shutdown.
+"""
+import queue
+import threading
+import time
+
+import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
+
+from models import db
+
+try:
+    from eventlet.patcher import original
+except ImportError:
+    original = None
+
+# Under eventlet's monkey patching these would be green; the writer needs real ones
+_threading = original('threading') if original else threading
+_queue = original('queue') if original else queue
+
+
+class _Job:
+    __slots__ = ('key', 'write', 'on_commit', 'queued_at')
+
+    def __init__(self, key, write, on_commit):
+        self.key = key
+        self.write = write
+        self.on_commit = on_commit
+        self.queued_at = time.monotonic()
+
+
+class WriteBehindQueue:
+    """Batches database writes into grouped transactions on one writer thread"""
+
+    def __init__(self, app, batch_size=64, flush_ms=25, on_connect=None):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.on_connect = on_connect
+        # Guards the pending counts and stats, which only the hub side touches
+        self._lock = threading.Lock()
+        self._jobs = _queue.Queue()
+        self._done = _queue.Queue()
+        self._pending = {}
+        self._queued = 0
+        self._thread = None
+        self._running = False
+        self._stats = {
+            'submitted': 0,
+            'written': 0,
+            'failed': 0,
+            'batches': 0,
+            'batch_size_max': 0,
+            'commit_ms_total': 0.0,
+            'commit_ms_max': 0.0,
+            'queue_delay_ms_total': 0.0,
+        }
+
+    def start(self, socketio):
+        """Start the writer thread, and the collector on the Socket.IO async backend"""
+        self._running = True
+        self._thread = _threading.Thread(target=self._writer_loop, name='write-behind', daemon=True)
+        self._thread.start()
+        socketio.start_background_task(self._collect_loop, socketio.sleep)
+
+    # Writer thread
+
+    def _writer_loop(self):
+        with self.app.app_context():
+            # A private engine and session: nothing here shares a pool or lock with the hub
+            engine = sa.create_engine(db.engine.url, poolclass=StaticPool,
+                                      connect_args={'check_same_thread': False})
+            if self.on_connect:
+                sa.event.listen(engine, 'connect', self.on_connect)
+            db.session.registry.set(sa.orm.Session(bind=engine))
+            try:
+                stopping = False
+                while not stopping:
+                    job = self._jobs.get()
+                    if job is None:
+                        break
+                    batch = [job]
+                    while len(batch) < self.batch_size:
+                        try:
+                            job = self._jobs.get_nowait()
+                        except _queue.Empty:
+                            break
+                        if job is None:
+                            stopping = True
+                            break
+                        batch.append(job)
+                    self._done.put(self._write(batch))
+            finally:
+                db.session.remove()
+                engine.dispose()
+
+    def _write(self, batch):
+        """Commit a batch on the current session; returns (batch, [(job, result)], started, commit_ms)"""
+        started = time.monotonic()
+        try:
+            results = [job.write() for job in batch]
+            db.session.commit()
+            written = list(zip(batch, results))
+        except Exception as e:
+            # Retry one job per transaction so a bad row only loses itself
+            db.session.rollback()
+            print(f"Write-behind batch of {len(batch)} failed ({e}), retrying jobs one by one")
+            written = self._write_individually(batch)
+        return batch, written, started, (time.monotonic() - started) * 1000
+
+    @staticmethod
+    def _write_individually(batch):
+        written = []
+        for job in batch:
+            try:
+                result = job.write()
+                db.session.commit()
+                written.append((job, result))
+            except Exception as e:
+                db.session.rollback()
+                print(f"Write-behind job for session {job.key} dropped: {e}")
+        return written
+
+    # Hub side
+
+    def _collect_loop(self, sleep):
+        while self._running:
+            if not self.collect():
+                sleep(self.flush_ms / 1000.0)
+
+    def collect(self):
+        """Run callbacks and bookkeeping for committed batches; returns the number of batches"""
+        collected = 0
+        while True:
+            try:
+                batch, written, started, commit_ms = self._done.get_nowait()
+            except _queue.Empty:
+                return collected
+            self._finish(batch, written, started, commit_ms)
+            collected += 1
+
+    def _finish(self, batch, written, started, commit_ms):
+        for job, result in written:
+            if job.on_commit:
+                try:
+                    job.on_commit(result)
+                except Exception as e:
+                    print(f"Write-behind commit callback error: {e}")
+
+        with self._lock:
+            for job in batch:
+                remaining = self._pending.get(job.key, 1) - 1
+                if remaining:
+                    self._pending[job.key] = remaining
+                else:
+                    self._pending.pop(job.key, None)
+            self._queued -= len(batch)
+            self._stats['written'] += len(written)
+            self._stats['failed'] += len(batch) - len(written)
+            self._stats['batches'] += 1
+            self._stats['batch_size_max'] = max(self._stats['batch_size_max'], len(batch))
+            self._stats['commit_ms_total'] += commit_ms
+            self._stats['commit_ms_max'] = max(self._stats['commit_ms_max'], commit_ms)
+            self._stats['queue_delay_ms_total'] += sum((started - job.queued_at) * 1000 for job in batch)
+
+    def submit(self, key, write, on_commit=None):
+        """Queue write() for the writer; key (the chat session id) orders reads against it.
+
+        write() runs inside the writer's transaction and may return a value
+        (e.g. a flushed row id) that is passed to on_commit() once committed.
+        Without a running writer the job is written immediately.
+        """
+        job = _Job(key, write, on_commit)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + 1
+            self._queued += 1
+            self._stats['submitted'] += 1
+        if self._running:
+            self._jobs.put(job)
+        else:
+            with self.app.app_context():
+                self._finish(*self._write([job]))
+
+    def pending(self, key=None):
+        """Jobs not yet committed and collected, for one key or in total"""
+        with self._lock:
+            return self._queued if key is None else self._pending.get(key, 0)
+
+    def wait_for(self, key, sleep, timeout=5.0):
+        """Block (cooperatively) until every queued write for key (None: all keys) is committed"""
+        deadline = time.monotonic() + timeout
+        while self.pending(key):
+            if time.monotonic() >= deadline:
+                print(f"Timed out waiting for queued writes of session {key}")
+                return False
+            sleep(self.flush_ms / 1000.0)
+        return True
+
+    def close(self, timeout=10.0):
+        """Stop the writer after it has written everything still queued (called at shutdown)"""
+        if not self._running:
+            return
+        self._running = False
+        self._jobs.put(None)
+        self._thread.join(timeout)
+        self.collect()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queued'] = self._queued
+        batches = stats['batches'] or 1
+        jobs = (stats['written'] + stats['failed']) or 1
+        stats['avg_batch_size'] = round((stats['written'] + stats['failed']) / batches, 2)
+        stats['avg_commit_ms'] = round(stats.pop('commit_ms_total') / batches, 2)
+        stats['commit_ms_max'] = round(stats['commit_ms_max'], 2)
+        stats['avg_queue_delay_ms'] = round(stats.pop('queue_delay_ms_total') / jobs, 2)
+        return stats
@@ -0,0 +1,134 @@
+"""Token-budgeted prompt assembly.
+
+Prompt evaluation time on the Pi grows linearly with prompt length, so every
+turn is fitted into a per-model token budget. The formatting guidance lives
+once in the system message instead of being repeated in every user turn,
+search snippets are de-duplicated, ranked by overlap with the question and
+trimmed to what fits, and old history is dropped once it no longer fits.
+Token counts come from a TokenEstimator calibrated against Ollama's
+``prompt_eval_count``.
+"""
+import re
+
+from local_index import STOPWORDS
+
+# Chat-template tokens Ollama wraps around each message (role markers etc.)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+FORMAT_GUIDE = (
+    "Format answers for easy reading: start with a direct answer, keep paragraphs short, "
+    "use bullet or numbered lists where they help and leave a blank line between sections."
+)
+
+SEARCH_GUIDE = "Use the web results above where they are relevant and cite them as [1], [2] and so on."
+
+_WORDS = re.compile(r'\w+', re.UNICODE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def parse_budgets(text):
+    """Parse "model=tokens,model=tokens" into a dict"""
+    budgets = {}
+    for item in (text or '').split(','):
+        name, _, value = item.partition('=')
+        if name.strip() and value.strip().isdigit():
+            budgets[name.strip()] = int(value)
+    return budgets
+
+
+def _terms(text):
+    return {word for word in _WORDS.findall(text.lower()) if word not in STOPWORDS}
+
+
+class PromptBuilder:
+    """Fits system prompt, search results, history and the new message into a token budget"""
+
+    def __init__(self, estimator, default_budget=2048, budgets=None, search_share=0.6, min_snippet_tokens=24):
+        self.estimator = estimator
+        self.default_budget = default_budget
+        self.budgets = budgets or {}
+        self.search_share = search_share
+        self.min_snippet_tokens = min_snippet_tokens
+
+    def budget_for(self, model):
+        """Budget for a model, matching "llama3.2:1b" before "llama3.2" before the default"""
+        if model in self.budgets:
+            return self.budgets[model]
+        return self.budgets.get(model.split(':')[0], self.default_budget)
+
+    def tokens(self, model, text):
+        return self.estimator.estimate(model, text) + MESSAGE_OVERHEAD_TOKENS
+
+    def count(self, model, messages):
+        return sum(self.tokens(model, message['content']) for message in messages)
+
+    @staticmethod
+    def system_prompt(admin_prompt):
+        """Admin system prompt plus the formatting guidance, sent once per conversation"""
+        admin_prompt = (admin_prompt or '').strip()
+        return f"{admin_prompt}\n\n{FORMAT_GUIDE}" if admin_prompt else FORMAT_GUIDE
+
+    def user_content(self, model, message, search_results, available):
+        """The user turn, with as many ranked search snippets as fit in ``available`` tokens.
+
+        Returns (content, snippets_kept, snippets_dropped).
+        """
+        if not search_results:
+            return message, 0, 0
+
+        question = f"Question: {message}"
+        budget = int(min(available, self.budget_for(model) * self.search_share))
+        budget -= self.tokens(model, question) + self.estimator.estimate(model, SEARCH_GUIDE)
+
+        # Drop repeated snippets (mirrors, syndicated copies), then rank by overlap with the question
+        unique = []
+        seen = set()
+        for result in search_results:
+            snippet = _WHITESPACE.sub(' ', result.get('snippet') or '').strip()
+            key = snippet.lower()[:120]
+            if not snippet or key in seen:
+                continue
+            seen.add(key)
+            unique.append(dict(result, snippet=snippet))
+        question_terms = _terms(message)
+        ranked = sorted(
+            enumerate(unique),
+            key=lambda item: (-len(question_terms & _terms(item[1]['title'] + ' ' + item[1]['snippet'])), item[0])
+        )
+
+        sources = []
+        for _, result in ranked:
+            header = f"[{len(sources) + 1}] {result['title']} ({result['url']})"
+            remaining = budget - self.estimator.estimate(model, header) - 1
+            snippet = result['snippet']
+            if self.estimator.estimate(model, snippet) > remaining:
+                if remaining < self.min_snippet_tokens:
+                    break
+                # Trim to the remaining budget at a word boundary
+                max_chars = int(remaining * self.estimator.chars_per_token(model))
+                snippet = snippet[:max_chars].rsplit(' ', 1)[0] + '...'
+            sources.append(f"{header}\n{snippet}")
+            budget -= self.estimator.estimate(model, sources[-1]) + 1
+
+        if not sources:
+            return message, 0, len(search_results)
+        content = "Web search results:\n\n" + "\n\n".join(sources) + f"\n\n{SEARCH_GUIDE}\n\n{question}"
+        return content, len(sources), len(search_results) - len(sources)
+
+    def trim_history(self, model, messages, budget):
+        """Drop the oldest turns once history exceeds budget.
+
+        History is cut to half the budget rather than just below it, so the
+        prefix Ollama has cached stays the same for several turns instead
+        of shifting on every message.
+        """
+        if self.count(model, messages) <= budget:
+            return messages
+        target = budget // 2
+        trimmed = list(messages)
+        while trimmed and self.count(model, trimmed) > target:
+            trimmed.pop(0)
+        # Always start with a user turn
+        while trimmed and trimmed[0]['role'] != 'user':
+            trimmed.pop(0)
+        return trimmed
@@ -0,0 +1,159 @@
+"""Opt-in cache of model responses for repeated prompts.
+
+Many users send the same openers ("what can you do", the suggested prompts),
+and at low temperature each one costs tens of seconds of Pi CPU for an almost
+identical answer. ResponseCache keys a response on the model, the normalised
+prompt, the session's sampling options and the system prompt, keeps the most
+recently used entries in a byte-bounded in-memory LRU and writes every entry
+through to a small SQLite spill file so the cache survives restarts.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_prompt(text):
+    """Lower-case, collapse whitespace and drop trailing punctuation"""
+    return _WHITESPACE.sub(' ', text.lower()).strip().rstrip('?!. ')
+
+
+class ResponseCache:
+    """Byte-bounded LRU of responses with an on-disk spill file"""
+
+    def __init__(self, enabled=False, max_temperature=0.3, max_bytes=4 * 1024 * 1024,
+                 path=None, max_disk_bytes=64 * 1024 * 1024):
+        self.enabled = enabled
+        self.max_temperature = max_temperature
+        self.max_bytes = max_bytes
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'stores': 0}
+        if enabled and path:
+            self._init_disk()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _init_disk(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS response_cache ('
+                             'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                             'size INTEGER NOT NULL, last_used REAL NOT NULL)')
+        except sqlite3.Error as e:
+            print(f"Response cache spill file disabled: {e}")
+            self.path = None
+
+    def eligible(self, session):
+        """Only low-temperature sessions get cached answers"""
+        return self.enabled and session.temperature <= self.max_temperature
+
+    @staticmethod
+    def make_key(session, prompt, system_prompt):
+        parts = [
+            session.model_name,
+            normalize_prompt(prompt),
+            session.temperature,
+            session.max_tokens,
+            session.top_p,
+            session.top_k,
+            session.repeat_penalty,
+            hashlib.sha1((system_prompt or '').encode('utf-8')).hexdigest(),
+        ]
+        return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached entry dict ({'response', 'eval_count'}) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[0]
+
+        entry = self._disk_get(key)
+        with self._lock:
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['disk_hits'] += 1
+            self._insert(key, entry)
+            return entry
+
+    def put(self, key, response, eval_count=0):
+        entry = {'response': response, 'eval_count': eval_count}
+        with self._lock:
+            self._stats['stores'] += 1
+            self._insert(key, entry)
+        self._disk_put(key, entry)
+
+    def _insert(self, key, entry):
+        # Caller holds the lock
+        size = len(entry['response'].encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (entry, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._stats['evictions'] += 1
+
+    def _disk_get(self, key):
+        if not self.path:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute('SELECT value FROM response_cache WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute('UPDATE response_cache SET last_used = ? WHERE key = ?', (time.time(), key))
+                return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Response cache read error: {e}")
+            return None
+
+    def _disk_put(self, key, entry):
+        if not self.path:
+            return
+        value = json.dumps(entry)
+        try:
+            with self._connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO response_cache (key, value, size, last_used) VALUES (?, ?, ?, ?)',
+                             (key, value, len(value), time.time()))
+                total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM response_cache').fetchone()[0]
+                if total > self.max_disk_bytes:
+                    # Drop the least recently used quarter of the spill file
+                    conn.execute('DELETE FROM response_cache WHERE key IN ('
+                                 'SELECT key FROM response_cache ORDER BY last_used '
+                                 'LIMIT (SELECT COUNT(*) / 4 + 1 FROM response_cache))')
+        except sqlite3.Error as e:
+            print(f"Response cache write error: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+            stats.update({
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hit_ratio': round((stats['hits'] + stats['disk_hits']) / lookups, 3) if lookups else 0.0,
+            })
+            return stats
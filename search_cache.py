@@ -0,0 +1,221 @@
+"""Two-tier cache for web search.
+
+Tier 1 maps a normalised query to the DuckDuckGo result list (titles and
+URLs) for a short TTL, so trending queries skip the search request. Tier 2
+maps a result URL to the snippet extracted from the page together with its
+``ETag``/``Last-Modified`` validators; once an entry is older than its TTL
+the page is revalidated with a conditional request and a 304 reuses the
+snippet. Both tiers are LRU-bounded in memory and can be written through to
+a SQLite file so they survive restarts; the file is kept under
+``max_disk_bytes`` by dropping the oldest entries.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r'\s+')
+
+# Check the size of the disk store every this many writes
+PRUNE_EVERY = 32
+
+
+def normalize_query(query):
+    return _WHITESPACE.sub(' ', query.lower()).strip()
+
+
+class _LRU:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        evicted = 0
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+
+class SearchCache:
+    """Query-result and per-URL snippet caches with optional disk persistence"""
+
+    def __init__(self, query_ttl=600, page_ttl=3600, max_queries=256, max_pages=1024, path=None,
+                 max_disk_bytes=16 * 1024 * 1024):
+        self.query_ttl = query_ttl
+        self.page_ttl = page_ttl
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._queries = _LRU(max_queries)
+        self._pages = _LRU(max_pages)
+        self._writes = 0
+        self._stats = {
+            'query_hits': 0, 'query_misses': 0,
+            'page_hits': 0, 'page_misses': 0, 'page_stale': 0, 'page_revalidated': 0,
+            'evictions': 0, 'disk_pruned': 0,
+        }
+        if path:
+            self._init_disk()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _init_disk(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS search_queries ('
+                             'query TEXT PRIMARY KEY, results TEXT NOT NULL, stored_at REAL NOT NULL)')
+                conn.execute('CREATE TABLE IF NOT EXISTS search_pages ('
+                             'url TEXT PRIMARY KEY, snippet TEXT NOT NULL, etag TEXT, '
+                             'last_modified TEXT, stored_at REAL NOT NULL)')
+                conn.execute('CREATE INDEX IF NOT EXISTS ix_search_queries_stored ON search_queries (stored_at)')
+                conn.execute('CREATE INDEX IF NOT EXISTS ix_search_pages_stored ON search_pages (stored_at)')
+        except sqlite3.Error as e:
+            print(f"Search cache disk store disabled: {e}")
+            self.path = None
+
+    def _disk(self, sql, params=(), fetch=False):
+        if not self.path:
+            return None
+        try:
+            with self._connect() as conn:
+                cursor = conn.execute(sql, params)
+                return cursor.fetchone() if fetch else None
+        except sqlite3.Error as e:
+            print(f"Search cache disk error: {e}")
+            return None
+
+    def _disk_write(self, sql, params):
+        self._disk(sql, params)
+        with self._lock:
+            self._writes += 1
+            due = self._writes % PRUNE_EVERY == 0
+        if due:
+            self._prune()
+
+    def _prune(self):
+        """Drop the oldest quarter of both tables while the disk store is over max_disk_bytes"""
+        if not self.path:
+            return
+        try:
+            with self._connect() as conn:
+                total = conn.execute(
+                    'SELECT (SELECT COALESCE(SUM(length(CAST(results AS BLOB))), 0) FROM search_queries) + '
+                    '(SELECT COALESCE(SUM(length(CAST(snippet AS BLOB))), 0) FROM search_pages)'
+                ).fetchone()[0]
+                if total <= self.max_disk_bytes:
+                    return
+                pruned = 0
+                for table, key in (('search_queries', 'query'), ('search_pages', 'url')):
+                    pruned += conn.execute(
+                        f'DELETE FROM {table} WHERE {key} IN (SELECT {key} FROM {table} ORDER BY stored_at '
+                        f'LIMIT (SELECT COUNT(*) / 4 + 1 FROM {table}))'
+                    ).rowcount
+        except sqlite3.Error as e:
+            print(f"Search cache disk error: {e}")
+            return
+        with self._lock:
+            self._stats['disk_pruned'] += pruned
+
+    # Tier 1: query -> result list
+
+    def get_query(self, query):
+        """Cached [{'title', 'url'}] for a query, or None if missing/expired"""
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._queries.get(key)
+        if entry is None:
+            row = self._disk('SELECT results, stored_at FROM search_queries WHERE query = ?', (key,), fetch=True)
+            if row:
+                entry = {'results': json.loads(row[0]), 'stored_at': row[1]}
+                with self._lock:
+                    self._stats['evictions'] += self._queries.put(key, entry)
+
+        with self._lock:
+            if entry is None or time.time() - entry['stored_at'] > self.query_ttl:
+                self._stats['query_misses'] += 1
+                return None
+            self._stats['query_hits'] += 1
+            return [dict(result) for result in entry['results']]
+
+    def put_query(self, query, results):
+        key = normalize_query(query)
+        entry = {
+            'results': [{'title': r['title'], 'url': r['url']} for r in results],
+            'stored_at': time.time(),
+        }
+        with self._lock:
+            self._stats['evictions'] += self._queries.put(key, entry)
+        self._disk_write('INSERT OR REPLACE INTO search_queries (query, results, stored_at) VALUES (?, ?, ?)',
+                         (key, json.dumps(entry['results']), entry['stored_at']))
+
+    # Tier 2: URL -> snippet with HTTP validators
+
+    def get_page(self, url):
+        """Cached page entry ({'snippet', 'etag', 'last_modified', 'fresh'}) or None"""
+        with self._lock:
+            entry = self._pages.get(url)
+        if entry is None:
+            row = self._disk('SELECT snippet, etag, last_modified, stored_at FROM search_pages WHERE url = ?',
+                             (url,), fetch=True)
+            if row:
+                entry = {'snippet': row[0], 'etag': row[1], 'last_modified': row[2], 'stored_at': row[3]}
+                with self._lock:
+                    self._stats['evictions'] += self._pages.put(url, entry)
+
+        with self._lock:
+            if entry is None:
+                self._stats['page_misses'] += 1
+                return None
+            fresh = time.time() - entry['stored_at'] <= self.page_ttl
+            # A stale entry is a hit only if revalidated() is called for it
+            self._stats['page_hits' if fresh else 'page_stale'] += 1
+            return dict(entry, fresh=fresh)
+
+    def put_page(self, url, snippet, etag=None, last_modified=None):
+        entry = {'snippet': snippet, 'etag': etag, 'last_modified': last_modified, 'stored_at': time.time()}
+        with self._lock:
+            self._stats['evictions'] += self._pages.put(url, entry)
+        self._disk_write('INSERT OR REPLACE INTO search_pages (url, snippet, etag, last_modified, stored_at) '
+                         'VALUES (?, ?, ?, ?, ?)', (url, snippet, etag, last_modified, entry['stored_at']))
+
+    def revalidated(self, url):
+        """Mark a stale page as fresh again after the server answered 304"""
+        with self._lock:
+            entry = self._pages.get(url)
+            if entry is None:
+                return
+            entry['stored_at'] = time.time()
+            self._stats['page_revalidated'] += 1
+        self._disk('UPDATE search_pages SET stored_at = ? WHERE url = ?', (entry['stored_at'], url))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            # Stale pages that were not revalidated were fetched again: misses
+            stats['page_misses'] += stats.pop('page_stale') - stats['page_revalidated']
+            query_lookups = stats['query_hits'] + stats['query_misses']
+            page_lookups = stats['page_misses'] + stats['page_hits'] + stats['page_revalidated']
+            stats.update({
+                'queries_cached': len(self._queries.entries),
+                'pages_cached': len(self._pages.entries),
+                'query_hit_ratio': round(stats['query_hits'] / query_lookups, 3) if query_lookups else 0.0,
+                'page_hit_ratio': round((stats['page_hits'] + stats['page_revalidated']) / page_lookups, 3) if page_lookups else 0.0,
+                'persistent': bool(self.path),
+            })
+            return stats
@@ -0,0 +1,122 @@
+"""Decides whether a chat message should trigger a web search.
+
+Trigger and negative patterns are compiled into one case-insensitive regex
+each, matched on word boundaries so "now" no longer fires inside "know" or
+"find" inside "findings". Negative patterns (e.g. "binary search", "status
+code") are blanked out of the message before the triggers are checked, so
+they only suppress the words they cover.
+
+Patterns are one per line: plain phrases match whole words with flexible
+whitespace, lines starting with ``re:`` are used as raw regular expressions
+and lines starting with ``#`` are ignored. Admins can override both lists
+through SystemConfig (``search_trigger_patterns`` and
+``search_negative_patterns``).
+"""
+import re
+from functools import lru_cache
+
+DEFAULT_PATTERNS = """\
+latest
+recent
+recently
+current
+currently
+today
+tonight
+news
+breaking news
+headlines
+search
+search for
+look up
+find
+what is happening
+what's happening
+what happened
+when did
+price of
+weather
+forecast
+stock
+right now
+now
+this week
+this month
+this year
+update
+status
+"""
+
+DEFAULT_NEGATIVE_PATTERNS = """\
+# Programming and maths senses of trigger words
+binary search
+linear search
+search algorithm
+search tree
+re:(?:depth|breadth)[- ]first search
+status code
+re:http status
+re:update (?:the|my|this|that) (?:code|function|script|query|table|record|row)s?
+update statement
+re:current (?:directory|working directory|user|index|node|element|line|value|flow|draw|density)
+re:find (?:the )?(?:bug|error|mistake|typo|value|area|volume|derivative|integral|sum|roots?|x|y)s?\\b
+re:stock (?:photo|image|footage)s?
+# Phrases where "now" or "today" do not ask for fresh information
+from now on
+just now
+now that
+re:(?:write|tell|give|explain|show) (?:me )?now
+re:\\bnow,? (?:write|tell|give|explain|show|make|do|try|can|let|translate|summari[sz]e)
+"""
+
+
+def parse_patterns(text):
+    """Split a pattern list into its non-empty, non-comment lines"""
+    lines = (line.strip() for line in (text or '').splitlines())
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def _to_regex(pattern):
+    if pattern.startswith('re:'):
+        return pattern[3:].strip()
+    words = [re.escape(word) for word in pattern.split()]
+    return r'\b' + r'\s+'.join(words) + r'\b'
+
+
+def compile_patterns(text):
+    """Compile a pattern list into one regex (None if empty); raises re.error"""
+    # Longest first so "breaking news" is reported rather than just "news"
+    patterns = sorted(parse_patterns(text), key=len, reverse=True)
+    parts = [_to_regex(pattern) for pattern in patterns]
+    if not parts:
+        return None
+    return re.compile('|'.join(f'(?:{part})' for part in parts), re.IGNORECASE)
+
+
+class SearchIntentClassifier:
+    """Word-boundary trigger matching with negative patterns"""
+
+    def __init__(self, patterns=DEFAULT_PATTERNS, negative_patterns=DEFAULT_NEGATIVE_PATTERNS):
+        self.triggers = compile_patterns(patterns)
+        self.negatives = compile_patterns(negative_patterns)
+
+    def matches(self, message):
+        """Trigger phrases found in message once negative phrases are removed"""
+        # Most messages contain no trigger at all, so check that before masking
+        if self.triggers is None or not self.triggers.search(message):
+            return []
+        if self.negatives is not None:
+            message = self.negatives.sub(lambda m: ' ' * len(m.group(0)), message)
+        return [match.group(0).lower() for match in self.triggers.finditer(message)]
+
+    def should_search(self, message):
+        return bool(self.matches(message))
+
+
+@lru_cache(maxsize=8)
+def classifier_for(patterns=None, negative_patterns=None):
+    """Shared classifier for a pair of pattern lists (None means the defaults)"""
+    return SearchIntentClassifier(
+        DEFAULT_PATTERNS if patterns is None else patterns,
+        DEFAULT_NEGATIVE_PATTERNS if negative_patterns is None else negative_patterns
+    )
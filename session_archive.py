@@ -0,0 +1,323 @@
+"""Archival of idle chat sessions to compressed, append-only segment files.
+
+Most sessions are never opened again a week or so after their last message,
+yet their messages stay in chatbot.db, making every index, query and backup
+bigger. SessionArchive moves the messages (and their MessageMetrics) of
+sessions idle for longer than ``max_idle_days`` out of the database into
+gzip JSONL segment files under the archive directory.
+
+Each session is written as its own gzip member holding one JSON line, so a
+segment is still a valid .jsonl.gz (``zcat`` reads all of it) and a single
+session can be read back by seeking to its member. ArchivedSession records
+the segment, byte offset and length. The small ChatSession row stays in the
+database with ``archived_at`` set, so the session keeps its place in the
+sidebar. The first time its messages are asked for again, restore() puts
+them back into the hot tables.
+
+Moving rows in either direction pauses the usage_rollup message and
+metrics triggers, so the admin and status counts keep including archived
+messages, and ArchivedMessageDay keeps their per-day counts for
+user_stats. The search index still drops them until they are restored,
+so archiving is off unless ``max_idle_days`` is set.
+
+Archiving and restoring run as jobs on the write-behind queue's writer
+thread, so the gzip work, fsyncs and commits never block the eventlet hub;
+callers wait for their job cooperatively.
+
+Segment bytes are fsynced before the database transaction that deletes the
+rows, so a crash can at worst leave an unreferenced member in a segment.
+Segments are never rewritten; a restored session is archived again as a
+new member if it goes idle again.
+"""
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import usage_rollup
+from models import db, ChatSession, MessageMetrics, ArchivedSession, ArchivedMessageDay
+from persistence_queue import WriteBehindQueue
+
+IDLE_SESSIONS_SQL = (
+    'SELECT s.id FROM chat_session s '
+    'WHERE s.archived_at IS NULL AND s.created_at < :cutoff '
+    'AND EXISTS (SELECT 1 FROM chat_message m WHERE m.session_id = s.id) '
+    'AND NOT EXISTS (SELECT 1 FROM chat_message m WHERE m.session_id = s.id AND m.timestamp >= :cutoff) '
+    'ORDER BY s.id LIMIT :limit'
+)
+MESSAGES_SQL = 'SELECT id, role, content, timestamp FROM chat_message WHERE session_id = :session_id ORDER BY timestamp, id'
+METRICS_SQL = (
+    'SELECT mm.* FROM message_metrics mm JOIN chat_message m ON m.id = mm.message_id '
+    'WHERE m.session_id = :session_id'
+)
+
+
+def _datetime(value):
+    # Raw SQL returns SQLite's "YYYY-MM-DD HH:MM:SS.ffffff" text
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+class SessionArchive:
+    """Moves idle sessions' messages into gzip JSONL segments and restores them on demand"""
+
+    def __init__(self, app, directory, writer=None, max_idle_days=0, segment_bytes=64 * 1024 * 1024,
+                 interval_hours=6, batch_size=200, timeout=60.0):
+        self.app = app
+        self.directory = directory
+        # Without a started writer, jobs are written as soon as they are submitted
+        self.writer = writer or WriteBehindQueue(app)
+        self.timeout = timeout
+        self.max_idle_days = max_idle_days
+        self.segment_bytes = segment_bytes
+        self.interval_hours = interval_hours
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._stats = {'runs': 0, 'archived': 0, 'restored': 0, 'last_run_at': None, 'last_run_ms': 0.0}
+
+    @property
+    def enabled(self):
+        return self.max_idle_days > 0
+
+    def start(self, socketio, is_busy=None):
+        """Run archive_idle() every interval_hours on the Socket.IO async backend"""
+        if self.enabled:
+            socketio.start_background_task(self._archive_loop, socketio.sleep, is_busy)
+
+    def _archive_loop(self, sleep, is_busy):
+        while True:
+            sleep(self.interval_hours * 3600)
+            with self.app.app_context():
+                try:
+                    self.archive_idle(sleep, is_busy)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Session archival failed: {e}")
+
+    # Segment files
+
+    def _current_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        segments = sorted(name for name in os.listdir(self.directory) if name.endswith('.jsonl.gz'))
+        if segments and os.path.getsize(os.path.join(self.directory, segments[-1])) < self.segment_bytes:
+            return segments[-1]
+        number = int(segments[-1].split('-')[1].split('.')[0]) + 1 if segments else 1
+        return f'segment-{number:06d}.jsonl.gz'
+
+    def _append(self, record):
+        """Append one record as its own gzip member; returns (segment, offset, length)"""
+        data = gzip.compress((json.dumps(record) + '\n').encode('utf-8'))
+        segment = self._current_segment()
+        with open(os.path.join(self.directory, segment), 'ab') as f:
+            offset = f.tell()
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return segment, offset, len(data)
+
+    def read(self, session_id):
+        """The archived record of a session ({'session', 'messages'}), or None if missing or unreadable"""
+        entry = db.session.get(ArchivedSession, session_id)
+        if entry is None:
+            return None
+        try:
+            with open(os.path.join(self.directory, entry.segment), 'rb') as f:
+                f.seek(entry.byte_offset)
+                data = f.read(entry.byte_length)
+            return json.loads(gzip.decompress(data))
+        except (OSError, EOFError, zlib.error, ValueError) as e:
+            print(f"Archived session {session_id} unreadable in {entry.segment}: {e}")
+            return None
+
+    def messages(self, session_id):
+        """Archived messages of a session as [{'role', 'content', 'timestamp'}] (timestamps as stored)"""
+        record = self.read(session_id)
+        return [{key: message[key] for key in ('role', 'content', 'timestamp')}
+                for message in (record or {}).get('messages', [])]
+
+    # Archive and restore
+
+    def _run(self, session_id, write, sleep=None, on_commit=None):
+        """Run write() as a writer job and wait for its commit; returns its result (0 if dropped)"""
+        results = []
+
+        def committed(result):
+            results.append(result)
+            if on_commit:
+                on_commit(result)
+
+        self.writer.submit(session_id, write, committed)
+        if sleep:
+            self.writer.wait_for(session_id, sleep, self.timeout)
+        # The writer committed on its own session; reload what this one has cached
+        db.session.expire_all()
+        return results[0] if results else 0
+
+    def archive_session(self, session_id, sleep=None):
+        """Move one session's messages into the archive; returns the number moved"""
+        return self._run(session_id, lambda: self._archive_rows(session_id), sleep)
+
+    def _archive_rows(self, session_id):
+        # Runs in the writer's transaction, which the writer commits
+        session = db.session.get(ChatSession, session_id)
+        if session is None or session.archived_at is not None:
+            return 0
+        params = {'session_id': session_id}
+        metrics = {}
+        for row in db.session.execute(db.text(METRICS_SQL), params):
+            row = dict(row._mapping)
+            metrics[row.pop('message_id')] = row
+        messages = [{
+            'id': message_id,
+            'role': role,
+            'content': content,
+            'timestamp': timestamp,
+            'metrics': metrics.get(message_id),
+        } for message_id, role, content, timestamp in db.session.execute(db.text(MESSAGES_SQL), params)]
+        if not messages:
+            return 0
+        # Flush other jobs' rows first so the paused triggers skip only these deletes
+        db.session.flush()
+
+        segment, offset, length = self._append({
+            'session': {
+                'id': session.id,
+                'user_id': session.user_id,
+                'model_name': session.model_name,
+                'title': session.title,
+                'created_at': session.created_at.isoformat(),
+            },
+            'messages': messages,
+        })
+
+        # The search index drops the rows; the usage rollups keep counting them
+        db.session.execute(db.text(usage_rollup.PAUSE))
+        db.session.execute(db.text(
+            'DELETE FROM message_metrics WHERE message_id IN (SELECT id FROM chat_message WHERE session_id = :session_id)'
+        ), params)
+        db.session.execute(db.text('DELETE FROM chat_message WHERE session_id = :session_id'), params)
+        db.session.execute(db.text(usage_rollup.RESUME))
+        session.archived_at = datetime.utcnow()
+        db.session.merge(ArchivedSession(
+            session_id=session_id,
+            segment=segment,
+            byte_offset=offset,
+            byte_length=length,
+            message_count=len(messages),
+            first_message_at=_datetime(messages[0]['timestamp']),
+            last_message_at=_datetime(messages[-1]['timestamp']),
+            archived_at=session.archived_at
+        ))
+        days = {}
+        for message in messages:
+            day = str(message['timestamp'])[:10]
+            days[day] = days.get(day, 0) + 1
+        for day, count in days.items():
+            db.session.merge(ArchivedMessageDay(session_id=session_id, day=day, messages=count))
+        return len(messages)
+
+    def archive_idle(self, sleep=None, is_busy=None):
+        """Archive sessions without messages for max_idle_days; returns the number archived.
+
+        is_busy() is checked between sessions so the job backs off while
+        the Pi is generating.
+        """
+        if not self.enabled:
+            return 0
+        started = time.perf_counter()
+        cutoff = (datetime.utcnow() - timedelta(days=self.max_idle_days)).strftime('%Y-%m-%d %H:%M:%S.%f')
+        session_ids = [row[0] for row in db.session.execute(
+            db.text(IDLE_SESSIONS_SQL), {'cutoff': cutoff, 'limit': self.batch_size}
+        )]
+
+        archived = 0
+        moved = 0
+        for session_id in session_ids:
+            while is_busy and sleep and is_busy():
+                sleep(5)
+            moved += self.archive_session(session_id, sleep)
+            archived += 1
+            if sleep:
+                sleep(0)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['archived'] += archived
+            self._stats['last_run_at'] = datetime.utcnow().isoformat()
+            self._stats['last_run_ms'] = round(elapsed_ms, 1)
+        if archived:
+            print(f"Archived {archived} idle sessions ({moved} messages) in {elapsed_ms:.0f} ms")
+        return archived
+
+    def restore(self, session_id, sleep=None):
+        """Put an archived session's messages back into the hot tables; returns the number restored"""
+        return self._run(session_id, lambda: self._restore_rows(session_id), sleep, self._restored)
+
+    def _restored(self, count):
+        if count:
+            with self._lock:
+                self._stats['restored'] += 1
+
+    def _restore_rows(self, session_id):
+        # Runs in the writer's transaction, which the writer commits
+        session = db.session.get(ChatSession, session_id)
+        if session is None or session.archived_at is None:
+            return 0
+        record = self.read(session_id)
+        if record is None:
+            # Leave it archived rather than drop the index entry of a damaged segment
+            return 0
+        messages = record['messages']
+
+        # Keep the original ids unless one has been reused since
+        ids = [message['id'] for message in messages]
+        keep_ids = bool(ids) and not db.session.execute(
+            db.text('SELECT 1 FROM chat_message WHERE id IN :ids LIMIT 1').bindparams(db.bindparam('ids', expanding=True)),
+            {'ids': ids}
+        ).first()
+
+        metric_columns = set(MessageMetrics.__table__.columns.keys()) - {'id', 'message_id'}
+        db.session.flush()
+        db.session.execute(db.text(usage_rollup.PAUSE))
+        for message in messages:
+            values = {'session_id': session_id, 'role': message['role'],
+                      'content': message['content'], 'timestamp': message['timestamp']}
+            if keep_ids:
+                values['id'] = message['id']
+            columns = ', '.join(values)
+            result = db.session.execute(db.text(
+                f"INSERT INTO chat_message ({columns}) VALUES ({', '.join(':' + key for key in values)})"
+            ), values)
+            if message.get('metrics'):
+                metric = {key: value for key, value in message['metrics'].items() if key in metric_columns}
+                metric['message_id'] = message['id'] if keep_ids else result.lastrowid
+                db.session.execute(db.text(
+                    f"INSERT INTO message_metrics ({', '.join(metric)}) VALUES ({', '.join(':' + key for key in metric)})"
+                ), metric)
+        db.session.execute(db.text(usage_rollup.RESUME))
+
+        session.archived_at = None
+        ArchivedSession.query.filter_by(session_id=session_id).delete()
+        ArchivedMessageDay.query.filter_by(session_id=session_id).delete()
+        print(f"Restored archived session {session_id} ({len(messages)} messages)")
+        return len(messages)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['max_idle_days'] = self.max_idle_days
+        sessions, messages = db.session.query(
+            db.func.count(ArchivedSession.session_id), db.func.coalesce(db.func.sum(ArchivedSession.message_count), 0)
+        ).one()
+        stats['archived_sessions'] = sessions
+        stats['archived_messages'] = messages
+        segments = [name for name in os.listdir(self.directory) if name.endswith('.jsonl.gz')] \
+            if os.path.isdir(self.directory) else []
+        stats['segments'] = len(segments)
+        stats['segment_mb'] = round(sum(os.path.getsize(os.path.join(self.directory, name)) for name in segments)
+                                    / 1024 / 1024, 2)
+        return stats
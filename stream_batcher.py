@@ -0,0 +1,67 @@
+"""Coalescing of streamed model output into fewer Socket.IO frames.
+
+Ollama streams one JSON line per token. Emitting a ``message_chunk`` event
+for each of them (to every connected client) costs a Socket.IO frame and an
+eventlet context switch per token. ChunkBatcher buffers the text and sends it
+to a single room when the time window elapses or enough bytes have piled up.
+The room is the user's, shared by all their tabs, so every frame carries the
+chat session id it belongs to.
+"""
+import time
+
+
+class ChunkBatcher:
+    """Buffers streamed text and emits it to one room in time/size-bounded batches"""
+
+    def __init__(self, socketio, room, session_id=None, window_ms=40, max_bytes=512, debug=False):
+        self.socketio = socketio
+        self.room = room
+        self.session_id = session_id
+        self.window = window_ms / 1000.0
+        self.max_bytes = max_bytes
+        self.debug = debug
+        self.pieces_in = 0
+        self.frames_out = 0
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._buffered_pieces = 0
+        self._metrics = {}
+        self._last_flush = time.monotonic()
+
+    def add(self, text, **metrics):
+        """Queue a piece of text plus its latest metrics; returns True if a frame was sent"""
+        self._buffer.append(text)
+        self._buffered_bytes += len(text.encode('utf-8'))
+        self._buffered_pieces += 1
+        self.pieces_in += 1
+        self._metrics.update(metrics)
+
+        # Send the very first token right away so time-to-first-token isn't delayed
+        if (self.frames_out == 0
+                or self._buffered_bytes >= self.max_bytes
+                or time.monotonic() - self._last_flush >= self.window):
+            self.flush()
+            return True
+        return False
+
+    def flush(self, **extra):
+        """Emit everything buffered so far (no-op when empty and no extra fields)"""
+        if not self._buffer and not extra:
+            return
+        chunk = ''.join(self._buffer)
+        payload = {'chunk': chunk, 'session_id': self.session_id}
+        payload.update(self._metrics)
+        payload.update(extra)
+        if self.debug:
+            payload['chunk_size'] = len(chunk)
+            payload['words_in_chunk'] = len(chunk.split())
+            payload['pieces'] = self._buffered_pieces
+
+        self.socketio.emit('message_chunk', payload, to=self.room)
+        self.frames_out += 1
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._buffered_pieces = 0
+        self._last_flush = time.monotonic()
+        # Let eventlet push the frame out before we block on the next line
+        self.socketio.sleep(0)
@@ -0,0 +1,149 @@
+"""Per-model latency telemetry aggregated into hourly histograms.
+
+Each completed generation adds one sample to a LatencyRollup row keyed by
+model, UTC hour and prompt-size bucket. Rows hold log-scale histograms of
+time-to-first-token and tokens per second, so p50/p90/p99 over any window
+can be read from a few hundred small rows instead of every message.
+"""
+import json
+from datetime import datetime, timedelta
+
+from models import db, LatencyRollup
+
+
+def _log_bounds(low, high, factor):
+    bounds = []
+    value = low
+    while value < high:
+        bounds.append(round(value, 3))
+        value *= factor
+    bounds.append(high)
+    return bounds
+
+
+# Upper bounds of histogram buckets; values above the last bound go in an overflow bucket
+TTFT_BOUNDS_MS = _log_bounds(25, 180000, 1.25)
+TPS_BOUNDS = _log_bounds(0.1, 500, 1.15)
+
+# (upper bound in prompt tokens, label)
+PROMPT_BUCKETS = [(256, '<256'), (1024, '256-1k'), (4096, '1k-4k'), (None, '4k+')]
+
+
+def prompt_bucket(prompt_tokens):
+    for limit, label in PROMPT_BUCKETS:
+        if limit is None or prompt_tokens < limit:
+            return label
+
+
+def _bucket_index(bounds, value):
+    for index, bound in enumerate(bounds):
+        if value <= bound:
+            return index
+    return len(bounds)
+
+
+def _add(histogram_json, bounds, value):
+    counts = json.loads(histogram_json or '[]') or [0] * (len(bounds) + 1)
+    counts[_bucket_index(bounds, value)] += 1
+    return json.dumps(counts)
+
+
+def _merge(total, histogram_json):
+    counts = json.loads(histogram_json or '[]')
+    if not total:
+        return list(counts)
+    return [a + b for a, b in zip(total, counts)]
+
+
+def percentile(counts, bounds, q):
+    """Estimate the q-th percentile (0-100) by interpolating inside the bucket"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = total * q / 100.0
+    seen = 0
+    for index, count in enumerate(counts):
+        if count and seen + count >= rank:
+            lower = bounds[index - 1] if index > 0 else 0.0
+            upper = bounds[index] if index < len(bounds) else bounds[-1]
+            return round(lower + (upper - lower) * (rank - seen) / count, 2)
+        seen += count
+    return bounds[-1]
+
+
+def record_generation(model_name, ttft_ms, tokens_per_second, prompt_tokens,
+                      prompt_eval_ms=0.0, eval_ms=0.0, when=None):
+    """Add one generation to its hourly rollup (the caller commits the session)"""
+    when = when or datetime.utcnow()
+    hour = when.replace(minute=0, second=0, microsecond=0)
+    bucket = prompt_bucket(prompt_tokens or 0)
+
+    rollup = LatencyRollup.query.filter_by(model_name=model_name, hour=hour, prompt_bucket=bucket).first()
+    if rollup is None:
+        rollup = LatencyRollup(
+            model_name=model_name,
+            hour=hour,
+            prompt_bucket=bucket,
+            samples=0,
+            ttft_ms_sum=0.0,
+            tps_sum=0.0,
+            prompt_eval_ms_sum=0.0,
+            eval_ms_sum=0.0,
+            ttft_histogram='[]',
+            tps_histogram='[]'
+        )
+        db.session.add(rollup)
+
+    rollup.samples += 1
+    rollup.ttft_ms_sum += ttft_ms
+    rollup.tps_sum += tokens_per_second
+    rollup.prompt_eval_ms_sum += prompt_eval_ms
+    rollup.eval_ms_sum += eval_ms
+    rollup.ttft_histogram = _add(rollup.ttft_histogram, TTFT_BOUNDS_MS, ttft_ms)
+    rollup.tps_histogram = _add(rollup.tps_histogram, TPS_BOUNDS, tokens_per_second)
+    return rollup
+
+
+def _summarize(group):
+    samples = group['samples']
+    return {
+        'samples': samples,
+        'ttft_ms_p50': percentile(group['ttft'], TTFT_BOUNDS_MS, 50),
+        'ttft_ms_p90': percentile(group['ttft'], TTFT_BOUNDS_MS, 90),
+        'ttft_ms_p99': percentile(group['ttft'], TTFT_BOUNDS_MS, 99),
+        'tps_p50': percentile(group['tps'], TPS_BOUNDS, 50),
+        'tps_p90': percentile(group['tps'], TPS_BOUNDS, 90),
+        'tps_p99': percentile(group['tps'], TPS_BOUNDS, 99),
+        'avg_ttft_ms': round(group['ttft_sum'] / samples, 1) if samples else None,
+        'avg_tps': round(group['tps_sum'] / samples, 2) if samples else None,
+        'avg_prompt_eval_ms': round(group['prompt_eval_sum'] / samples, 1) if samples else None,
+    }
+
+
+def latency_summary(hours=24):
+    """Percentiles per model (and per model/prompt bucket) over the last N hours"""
+    since = (datetime.utcnow() - timedelta(hours=hours)).replace(minute=0, second=0, microsecond=0)
+    rows = LatencyRollup.query.filter(LatencyRollup.hour >= since).all()
+
+    groups = {}
+    for row in rows:
+        for key in ((row.model_name, None), (row.model_name, row.prompt_bucket)):
+            group = groups.setdefault(key, {
+                'samples': 0, 'ttft': [], 'tps': [],
+                'ttft_sum': 0.0, 'tps_sum': 0.0, 'prompt_eval_sum': 0.0,
+            })
+            group['samples'] += row.samples
+            group['ttft'] = _merge(group['ttft'], row.ttft_histogram)
+            group['tps'] = _merge(group['tps'], row.tps_histogram)
+            group['ttft_sum'] += row.ttft_ms_sum
+            group['tps_sum'] += row.tps_sum
+            group['prompt_eval_sum'] += row.prompt_eval_ms_sum
+
+    models = {}
+    for (model_name, bucket), group in groups.items():
+        entry = models.setdefault(model_name, {'prompt_buckets': {}})
+        if bucket is None:
+            entry.update(_summarize(group))
+        else:
+            entry['prompt_buckets'][bucket] = _summarize(group)
+    return {'hours': hours, 'since': since.isoformat(), 'models': models}
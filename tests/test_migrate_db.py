@@ -0,0 +1,66 @@
+"""Migrating a database created by the original models.py with the CLI"""
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import migrate_db
+from benchmark_db_indexes import build_database
+from models import LatencyRollup
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _migrate(path, *args):
+    return subprocess.run([sys.executable, os.path.join(REPO, 'migrate_db.py'), *args, path],
+                          capture_output=True, text=True)
+
+
+def test_cli_migrates_baseline_database(tmp_path):
+    path = str(tmp_path / 'chatbot.db')
+    build_database(path, users=3, sessions=20, messages=200).close()
+
+    result = _migrate(path)
+    assert result.returncode == 0, result.stderr
+
+    conn = sqlite3.connect(path)
+    assert migrate_db.current_version(conn) == migrate_db.LATEST_VERSION
+    assert 'web_search' in migrate_db._columns(conn, 'chat_session')
+    assert 'archived_at' in migrate_db._columns(conn, 'chat_session')
+    assert {'prompt_budget', 'prompt_estimate'} <= set(migrate_db._columns(conn, 'message_metrics'))
+    # The rollups were filled from the existing rows
+    assert conn.execute('SELECT SUM(messages) FROM usage_rollup').fetchone()[0] == 200
+    assert 'ttft_histogram' in migrate_db._columns(conn, 'latency_rollup')
+    conn.close()
+
+    # A second run has nothing left to do
+    result = _migrate(path)
+    assert result.returncode == 0, result.stderr
+    assert 'up to date' in result.stdout
+
+
+def test_migrated_tables_accept_metrics(tmp_path):
+    path = str(tmp_path / 'chatbot.db')
+    conn = build_database(path, users=1, sessions=1, messages=2)
+    migrate_db.migrate(conn)
+    conn.execute("INSERT INTO message_metrics (message_id, model_name, prompt_tokens, completion_tokens, "
+                 "prompt_budget, created_at) VALUES (2, 'tinyllama', 10, 5, 2048, '2024-01-01 00:00:00.000000')")
+    assert conn.execute('SELECT SUM(prompt_tokens), SUM(completion_tokens) FROM usage_rollup').fetchone() == (10, 5)
+    conn.close()
+
+
+def test_migrated_latency_rollup_matches_model(tmp_path):
+    path = str(tmp_path / 'chatbot.db')
+    conn = build_database(path, users=1, sessions=1, messages=2)
+    migrate_db.migrate(conn)
+
+    assert migrate_db._columns(conn, 'latency_rollup') == list(LatencyRollup.__table__.columns.keys())
+    assert 'ix_latency_rollup_hour' in [row[1] for row in conn.execute('PRAGMA index_list(latency_rollup)')]
+    row = "INSERT INTO latency_rollup (model_name, hour, prompt_bucket, ttft_histogram, tps_histogram) " \
+          "VALUES ('tinyllama', '2024-01-01 00:00:00.000000', 'short', '[]', '[]')"
+    conn.execute(row)
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute(row)
+    conn.close()
@@ -0,0 +1,183 @@
+"""SessionArchive: archive and restore keep messages and usage rollups intact"""
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+import migrate_db
+import usage_rollup
+from models import db, User, ChatSession, ChatMessage, MessageMetrics, ArchivedSession
+import user_stats
+from chat_export import iter_sessions
+from persistence_queue import WriteBehindQueue
+from session_archive import SessionArchive
+
+
+def _rows(sql, params):
+    return db.session.execute(db.text(sql), params).fetchall()
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    path = tmp_path / 'chatbot.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        conn = sqlite3.connect(str(path), isolation_level=None)
+        migrate_db.migrate(conn)
+        conn.close()
+
+        old = datetime.utcnow() - timedelta(days=60)
+        user = User(username='alice', email='alice@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        for number in range(2):
+            session = ChatSession(user_id=user.id, model_name='tinyllama', title=f'Chat {number}', created_at=old)
+            db.session.add(session)
+            db.session.flush()
+            for turn in range(3):
+                sent = old + timedelta(minutes=turn)
+                db.session.add(ChatMessage(session_id=session.id, role='user', content=f'question {turn}', timestamp=sent))
+                reply = ChatMessage(session_id=session.id, role='assistant', content=f'answer {turn}', timestamp=sent)
+                db.session.add(reply)
+                db.session.flush()
+                db.session.add(MessageMetrics(message_id=reply.id, model_name='tinyllama', prompt_tokens=10,
+                                              completion_tokens=20, created_at=sent))
+        db.session.commit()
+        yield app
+
+
+def test_archive_and_restore_keep_rollups(app, tmp_path):
+    archive = SessionArchive(app, str(tmp_path / 'archive'), max_idle_days=30)
+    with app.app_context():
+        totals = usage_rollup.totals(_rows)
+        models = usage_rollup.by_model(_rows)
+        assert totals['messages'] == 12 and totals['completion_tokens'] == 120
+
+        assert archive.archive_idle() == 2
+        assert ChatMessage.query.count() == 0 and MessageMetrics.query.count() == 0
+        assert ArchivedSession.query.count() == 2
+        assert usage_rollup.totals(_rows) == totals
+        assert usage_rollup.by_model(_rows) == models
+
+        session_id = ChatSession.query.first().id
+        assert [m['content'] for m in archive.messages(session_id)][:2] == ['question 0', 'answer 0']
+        assert archive.restore(session_id) == 6
+        assert ChatMessage.query.filter_by(session_id=session_id).count() == 6
+        assert MessageMetrics.query.count() == 3
+        assert db.session.get(ChatSession, session_id).archived_at is None
+        assert usage_rollup.totals(_rows) == totals
+        assert usage_rollup.by_model(_rows) == models
+        # Nothing is left paused once the archive has committed
+        assert not _rows('SELECT * FROM usage_rollup_pause', {})
+
+
+def test_deleting_archived_session_removes_its_counts(app, tmp_path):
+    archive = SessionArchive(app, str(tmp_path / 'archive'), max_idle_days=30)
+    with app.app_context():
+        archive.archive_idle()
+        session = ChatSession.query.first()
+        archive.restore(session.id)
+        ChatMessage.query.filter_by(session_id=session.id).delete()
+        db.session.commit()
+        assert usage_rollup.totals(_rows)['messages'] == 6
+
+
+def test_incremental_export_includes_archived_messages(app, tmp_path):
+    archive = SessionArchive(app, str(tmp_path / 'archive'), max_idle_days=30)
+    with app.app_context():
+        archive.archive_idle()
+        created_at = ChatSession.query.first().created_at
+        now = datetime.utcnow()
+        # Sessions created before `since` are found only through their archived messages
+        records = list(iter_sessions(since=created_at + timedelta(seconds=30), until=now,
+                                     archived_messages=archive.messages))
+        assert [len(record['messages']) for record in records] == [4, 4]
+        assert records[0]['messages'][0]['timestamp'] == (created_at + timedelta(minutes=1)).isoformat()
+        assert not list(iter_sessions(since=now - timedelta(days=1), until=now,
+                                      archived_messages=archive.messages))
+
+
+def test_unreadable_segment_leaves_session_archived(app, tmp_path):
+    archive = SessionArchive(app, str(tmp_path / 'archive'), max_idle_days=30)
+    with app.app_context():
+        archive.archive_idle()
+        entry = ArchivedSession.query.first()
+        path = tmp_path / 'archive' / entry.segment
+        path.write_bytes(path.read_bytes()[:entry.byte_offset + entry.byte_length // 2])
+
+        assert archive.read(entry.session_id) is None
+        assert archive.messages(entry.session_id) == []
+        assert archive.restore(entry.session_id) == 0
+        assert db.session.get(ChatSession, entry.session_id).archived_at is not None
+        assert db.session.get(ArchivedSession, entry.session_id) is not None
+
+
+def test_export_merges_live_rows_of_archived_session(app, tmp_path):
+    archive = SessionArchive(app, str(tmp_path / 'archive'), max_idle_days=30)
+    with app.app_context():
+        archive.archive_idle()
+        first, second = ChatSession.query.order_by(ChatSession.id).all()
+        # A message written to the first session while it stayed archived
+        db.session.add(ChatMessage(session_id=first.id, role='user', content='late question',
+                                   timestamp=datetime.utcnow() - timedelta(minutes=1)))
+        db.session.commit()
+        archive.restore(second.id)
+        db.session.add(ChatMessage(session_id=second.id, role='user', content='follow-up',
+                                   timestamp=datetime.utcnow() - timedelta(minutes=1)))
+        db.session.commit()
+
+        records = list(iter_sessions(archived_messages=archive.messages))
+        assert [len(record['messages']) for record in records] == [7, 7]
+        assert records[0]['messages'][-1]['content'] == 'late question'
+        assert records[1]['messages'][-1]['content'] == 'follow-up'
+
+
+def test_user_stats_count_archived_messages(app, tmp_path):
+    archive = SessionArchive(app, str(tmp_path / 'archive'), max_idle_days=30)
+    with app.app_context():
+        def stats():
+            return (user_stats.user_totals(_rows), user_stats.by_model(_rows), user_stats.by_day(_rows, 90))
+
+        before = stats()
+        assert before[0][0]['total_messages'] == 12 and before[2][0]['messages'] == 12
+        archive.archive_idle()
+        assert stats() == before
+        archive.restore(ChatSession.query.first().id)
+        assert stats() == before
+
+
+class _ThreadingSocketIO:
+    sleep = staticmethod(time.sleep)
+
+    @staticmethod
+    def start_background_task(target, *args):
+        threading.Thread(target=target, args=args, daemon=True).start()
+
+
+def test_archive_and_restore_run_on_the_writer_thread(app, tmp_path):
+    writer = WriteBehindQueue(app, flush_ms=5)
+    writer.start(_ThreadingSocketIO)
+    archive = SessionArchive(app, str(tmp_path / 'archive'), writer=writer, max_idle_days=30)
+    threads = []
+    write_rows = archive._archive_rows
+    archive._archive_rows = lambda session_id: threads.append(threading.get_ident()) or write_rows(session_id)
+    try:
+        with app.app_context():
+            assert archive.archive_idle(time.sleep) == 2
+            assert len(threads) == 2 and threading.get_ident() not in threads
+            session = ChatSession.query.first()
+            assert session.archived_at is not None and ChatMessage.query.count() == 0
+
+            assert archive.restore(session.id, time.sleep) == 6
+            # The hub's session sees the writer's commit
+            assert session.archived_at is None
+            assert ChatMessage.query.filter_by(session_id=session.id).count() == 6
+            assert archive.stats()['restored'] == 1
+    finally:
+        writer.close()
@@ -0,0 +1,67 @@
+"""Token accounting for streamed responses.
+
+Final numbers always come from Ollama's own counters (``eval_count``,
+``eval_duration`` and friends on the last stream line). While a response is
+still streaming, TokenEstimator gives a live estimate from the character
+count using a chars-per-token ratio calibrated per model against those real
+counts, so the chat page shows realistic numbers before the final line.
+"""
+import threading
+
+DEFAULT_CHARS_PER_TOKEN = 4.0
+
+
+class TokenEstimator:
+    """Per-model chars-per-token ratio calibrated from Ollama's real counts"""
+
+    def __init__(self, default_chars_per_token=DEFAULT_CHARS_PER_TOKEN, smoothing=0.2):
+        self.default_chars_per_token = default_chars_per_token
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._ratios = {}
+
+    def chars_per_token(self, model):
+        with self._lock:
+            return self._ratios.get(model, self.default_chars_per_token)
+
+    def estimate(self, model, text_or_length):
+        """Estimated token count for a string (or a character count)"""
+        length = text_or_length if isinstance(text_or_length, int) else len(text_or_length)
+        if length <= 0:
+            return 0
+        return max(1, int(round(length / self.chars_per_token(model))))
+
+    def calibrate(self, model, chars, tokens):
+        """Fold one observed (characters, tokens) pair into the model's ratio"""
+        if chars <= 0 or tokens <= 0:
+            return
+        observed = chars / tokens
+        with self._lock:
+            current = self._ratios.get(model)
+            if current is None:
+                self._ratios[model] = observed
+            else:
+                self._ratios[model] = current + self.smoothing * (observed - current)
+
+    def ratios(self):
+        with self._lock:
+            return {model: round(ratio, 3) for model, ratio in self._ratios.items()}
+
+
+def ollama_timings(done_line):
+    """Convert the counters on Ollama's final stream line to tokens and milliseconds"""
+    def ms(key):
+        value = done_line.get(key) or 0
+        return round(value / 1_000_000, 2)
+
+    eval_count = done_line.get('eval_count') or 0
+    eval_ms = ms('eval_duration')
+    return {
+        'prompt_tokens': done_line.get('prompt_eval_count') or 0,
+        'completion_tokens': eval_count,
+        'prompt_eval_ms': ms('prompt_eval_duration'),
+        'eval_ms': eval_ms,
+        'load_ms': ms('load_duration'),
+        'total_ms': ms('total_duration'),
+        'tokens_per_second': round(eval_count / (eval_ms / 1000), 2) if eval_ms else 0.0,
+    }
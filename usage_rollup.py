@@ -0,0 +1,154 @@
+"""Hourly usage counters per model, maintained by SQLite triggers.
+
+The admin and status pages used to COUNT(*) the session, message and rating
+tables on every load. usage_rollup instead holds one row per UTC hour and
+model with session, message and rating counts, the rating sum and token
+totals. Triggers on chat_session, chat_message, model_rating and
+message_metrics update it in the same transaction as every insert, update
+and delete, so it always matches the live tables whichever code path
+wrote them (request handlers, the write-behind queue, maintenance scripts).
+
+Moving messages to and from the session archive is not usage, so the
+message and metrics triggers are skipped while a row is present in
+usage_rollup_pause; the archive inserts one at the start of its
+transaction and deletes it before committing (PAUSE/RESUME), so no other
+connection ever sees it.
+
+Totals are a SUM over a few hundred small rows. Windows such as the last
+24 hours add whole hours from the rollup plus a live, index-bounded count
+of the partial hour at the start of the window, so they are exact too.
+
+Like user_stats, readers take ``execute(sql, params)`` returning rows.
+"""
+from datetime import datetime, timedelta
+
+# Same text format SQLAlchemy stores DateTime values in, truncated to the hour
+_HOUR = "strftime('%Y-%m-%d %H:00:00.000000', {})"
+_SESSION_MODEL = '(SELECT model_name FROM chat_session WHERE id = {}.session_id)'
+
+
+def _bump(hour, model, **deltas):
+    """Upsert adding deltas to one (hour, model) row"""
+    columns = ', '.join(deltas)
+    values = ', '.join(str(value) for value in deltas.values())
+    updates = ', '.join(f'{column} = {column} + excluded.{column}' for column in deltas)
+    return (f'INSERT INTO usage_rollup (hour, model_name, {columns}) '
+            f'VALUES ({_HOUR.format(hour)}, {model}, {values}) '
+            f'ON CONFLICT(hour, model_name) DO UPDATE SET {updates};')
+
+
+def _trigger(name, event, table, *statements, when=None):
+    condition = f' WHEN {when}' if when else ''
+    return (f'CREATE TRIGGER IF NOT EXISTS {name} {event} ON {table}{condition} BEGIN '
+            + ' '.join(statements) + ' END')
+
+
+_NOT_PAUSED = 'NOT EXISTS (SELECT 1 FROM usage_rollup_pause)'
+PAUSE = 'INSERT OR IGNORE INTO usage_rollup_pause (id) VALUES (1)'
+RESUME = 'DELETE FROM usage_rollup_pause'
+
+# Triggers skipped while the archive moves rows (migration 5 recreates them)
+PAUSABLE_TRIGGERS = ['usage_rollup_message_ai', 'usage_rollup_message_bd',
+                     'usage_rollup_metrics_ai', 'usage_rollup_metrics_ad']
+
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS usage_rollup ('
+    'hour DATETIME NOT NULL, model_name VARCHAR(50) NOT NULL, '
+    'sessions INTEGER NOT NULL DEFAULT 0, messages INTEGER NOT NULL DEFAULT 0, '
+    'ratings INTEGER NOT NULL DEFAULT 0, rating_sum INTEGER NOT NULL DEFAULT 0, '
+    'prompt_tokens INTEGER NOT NULL DEFAULT 0, completion_tokens INTEGER NOT NULL DEFAULT 0, '
+    'PRIMARY KEY (hour, model_name))',
+    'CREATE TABLE IF NOT EXISTS usage_rollup_pause (id INTEGER PRIMARY KEY)',
+    _trigger('usage_rollup_session_ai', 'AFTER INSERT', 'chat_session',
+             _bump('new.created_at', 'new.model_name', sessions=1)),
+    _trigger('usage_rollup_session_ad', 'AFTER DELETE', 'chat_session',
+             _bump('old.created_at', 'old.model_name', sessions=-1)),
+    # Messages are deleted before their session, so the model can still be looked up
+    _trigger('usage_rollup_message_ai', 'AFTER INSERT', 'chat_message',
+             _bump('new.timestamp', _SESSION_MODEL.format('new'), messages=1), when=_NOT_PAUSED),
+    _trigger('usage_rollup_message_bd', 'BEFORE DELETE', 'chat_message',
+             _bump('old.timestamp', _SESSION_MODEL.format('old'), messages=-1), when=_NOT_PAUSED),
+    _trigger('usage_rollup_rating_ai', 'AFTER INSERT', 'model_rating',
+             _bump('new.created_at', 'new.model_name', ratings=1, rating_sum='new.rating')),
+    _trigger('usage_rollup_rating_au', 'AFTER UPDATE OF rating', 'model_rating',
+             _bump('old.created_at', 'old.model_name', rating_sum='new.rating - old.rating')),
+    _trigger('usage_rollup_rating_ad', 'AFTER DELETE', 'model_rating',
+             _bump('old.created_at', 'old.model_name', ratings=-1, rating_sum='-old.rating')),
+    _trigger('usage_rollup_metrics_ai', 'AFTER INSERT', 'message_metrics',
+             _bump('new.created_at', 'new.model_name',
+                   prompt_tokens='COALESCE(new.prompt_tokens, 0)', completion_tokens='COALESCE(new.completion_tokens, 0)'),
+             when=_NOT_PAUSED),
+    _trigger('usage_rollup_metrics_ad', 'AFTER DELETE', 'message_metrics',
+             _bump('old.created_at', 'old.model_name',
+                   prompt_tokens='-COALESCE(old.prompt_tokens, 0)', completion_tokens='-COALESCE(old.completion_tokens, 0)'),
+             when=_NOT_PAUSED),
+]
+
+# Recompute every row from the live tables (first install, or after a manual repair).
+# Archived messages are not in the live tables, so restore them before a rebuild.
+# "WHERE true" keeps SQLite from reading ON CONFLICT as a join constraint.
+REBUILD = [
+    'DELETE FROM usage_rollup',
+    f'INSERT INTO usage_rollup (hour, model_name, sessions) '
+    f'SELECT {_HOUR.format("created_at")}, model_name, COUNT(*) FROM chat_session WHERE true GROUP BY 1, 2',
+    f'INSERT INTO usage_rollup (hour, model_name, messages) '
+    f'SELECT {_HOUR.format("m.timestamp")}, s.model_name, COUNT(*) FROM chat_message m '
+    f'JOIN chat_session s ON s.id = m.session_id WHERE true GROUP BY 1, 2 '
+    f'ON CONFLICT(hour, model_name) DO UPDATE SET messages = excluded.messages',
+    f'INSERT INTO usage_rollup (hour, model_name, ratings, rating_sum) '
+    f'SELECT {_HOUR.format("created_at")}, model_name, COUNT(*), SUM(rating) FROM model_rating WHERE true GROUP BY 1, 2 '
+    f'ON CONFLICT(hour, model_name) DO UPDATE SET ratings = excluded.ratings, rating_sum = excluded.rating_sum',
+    f'INSERT INTO usage_rollup (hour, model_name, prompt_tokens, completion_tokens) '
+    f'SELECT {_HOUR.format("created_at")}, model_name, SUM(COALESCE(prompt_tokens, 0)), '
+    f'SUM(COALESCE(completion_tokens, 0)) FROM message_metrics WHERE true GROUP BY 1, 2 '
+    f'ON CONFLICT(hour, model_name) DO UPDATE SET prompt_tokens = excluded.prompt_tokens, '
+    f'completion_tokens = excluded.completion_tokens',
+]
+
+# Live counts for the partial hour at the start of a window
+_EDGE_SQL = {
+    'sessions': 'SELECT COUNT(*) FROM chat_session WHERE created_at >= :since AND created_at < :hour',
+    'messages': 'SELECT COUNT(*) FROM chat_message WHERE timestamp >= :since AND timestamp < :hour',
+    'ratings': 'SELECT COUNT(*) FROM model_rating WHERE created_at >= :since AND created_at < :hour',
+}
+
+
+def _format(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def totals(execute):
+    """All-time session, message, rating and token totals"""
+    row = execute('SELECT COALESCE(SUM(sessions), 0), COALESCE(SUM(messages), 0), COALESCE(SUM(ratings), 0), '
+                  'COALESCE(SUM(prompt_tokens), 0), COALESCE(SUM(completion_tokens), 0) FROM usage_rollup', {})[0]
+    return dict(zip(('sessions', 'messages', 'ratings', 'prompt_tokens', 'completion_tokens'), row))
+
+
+def recent(execute, hours=24, now=None):
+    """Exact session, message and rating counts for the last ``hours`` hours"""
+    since = (now or datetime.utcnow()) - timedelta(hours=hours)
+    next_hour = since.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    params = {'since': _format(since), 'hour': _format(next_hour)}
+    row = execute('SELECT COALESCE(SUM(sessions), 0), COALESCE(SUM(messages), 0), COALESCE(SUM(ratings), 0) '
+                  'FROM usage_rollup WHERE hour >= :hour', params)[0]
+    counts = dict(zip(('sessions', 'messages', 'ratings'), row))
+    for measure, sql in _EDGE_SQL.items():
+        counts[measure] += execute(sql, params)[0][0]
+    return counts
+
+
+def by_model(execute):
+    """Per-model totals, most used first"""
+    rows = execute('SELECT model_name, SUM(sessions), SUM(messages), SUM(ratings), SUM(rating_sum), '
+                   'SUM(prompt_tokens), SUM(completion_tokens) FROM usage_rollup GROUP BY model_name '
+                   'HAVING SUM(sessions) > 0 ORDER BY SUM(sessions) DESC', {})
+    return [{
+        'model_name': model_name,
+        'usage_count': sessions,
+        'messages': messages,
+        'ratings': ratings,
+        'avg_rating': rating_sum / ratings if ratings else None,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+    } for model_name, sessions, messages, ratings, rating_sum, prompt_tokens, completion_tokens in rows]
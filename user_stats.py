@@ -0,0 +1,133 @@
+"""Per-user usage statistics computed with grouped SQL.
+
+Counts and averages are computed by the database in one GROUP BY query per
+measure (sessions, messages, ratings), and the results are merged per user
+in Python. The work in Python is proportional to the number of users (or
+users x models, users x days), not to the number of messages.
+
+Messages moved out by the session archive are counted from
+archived_session (totals, per model) and archived_message_day (per day).
+
+The queries are plain SQLite SQL. Callers pass ``execute(sql, params)``
+returning rows, so the same code runs on the app's SQLAlchemy session and on
+a bare sqlite3 connection (see benchmark_user_stats.py).
+"""
+import csv
+import io
+from datetime import datetime, timedelta
+
+USERS_SQL = 'SELECT id, username, email, created_at FROM user ORDER BY id'
+
+# Live messages per session, counted on the (session_id, timestamp) index, plus archived ones
+SESSION_MESSAGES_SQL = (
+    'SELECT session_id, COUNT(*) AS n FROM chat_message GROUP BY session_id '
+    'UNION ALL SELECT session_id, message_count FROM archived_session'
+)
+
+TOTALS_SQL = {
+    'sessions': 'SELECT user_id, COUNT(*) FROM chat_session GROUP BY user_id',
+    'messages': f'SELECT s.user_id, SUM(c.n) FROM ({SESSION_MESSAGES_SQL}) c '
+                'JOIN chat_session s ON s.id = c.session_id GROUP BY s.user_id',
+    'ratings': 'SELECT user_id, COUNT(*), AVG(rating) FROM model_rating GROUP BY user_id',
+}
+
+BY_MODEL_SQL = {
+    'sessions': 'SELECT user_id, model_name, COUNT(*) FROM chat_session GROUP BY user_id, model_name',
+    'messages': f'SELECT s.user_id, s.model_name, SUM(c.n) FROM ({SESSION_MESSAGES_SQL}) c '
+                'JOIN chat_session s ON s.id = c.session_id GROUP BY s.user_id, s.model_name',
+    'ratings': 'SELECT user_id, model_name, COUNT(*), AVG(rating) FROM model_rating GROUP BY user_id, model_name',
+}
+
+# Days are UTC dates; each query only reads rows inside the window through its time index
+BY_DAY_SQL = {
+    'sessions': 'SELECT user_id, date(created_at), COUNT(*) FROM chat_session '
+                'WHERE created_at >= :since GROUP BY 1, 2',
+    'messages': 'SELECT user_id, day, SUM(n) FROM ('
+                'SELECT s.user_id, date(m.timestamp) AS day, COUNT(*) AS n FROM chat_message m '
+                'JOIN chat_session s ON s.id = m.session_id WHERE m.timestamp >= :since GROUP BY 1, 2 '
+                'UNION ALL SELECT s.user_id, a.day, a.messages FROM archived_message_day a '
+                'JOIN chat_session s ON s.id = a.session_id WHERE a.day >= date(:since)'
+                ') GROUP BY 1, 2',
+    'ratings': 'SELECT user_id, date(created_at), COUNT(*), AVG(rating) FROM model_rating '
+               'WHERE created_at >= :since GROUP BY 1, 2',
+}
+
+TOTAL_FIELDS = ['username', 'email', 'created_at', 'total_sessions', 'total_messages',
+                'ratings_given', 'avg_rating_given']
+MODEL_FIELDS = ['username', 'model', 'sessions', 'messages', 'ratings', 'avg_rating']
+DAY_FIELDS = ['username', 'day', 'sessions', 'messages', 'ratings', 'avg_rating']
+
+
+def _users(execute):
+    return {row[0]: row for row in execute(USERS_SQL, {})}
+
+
+def _grouped(execute, queries, params):
+    """{key: {'sessions', 'messages', 'ratings', 'avg_rating'}} keyed on the GROUP BY columns"""
+    groups = {}
+    for measure, sql in queries.items():
+        for row in execute(sql, params):
+            if measure == 'ratings':
+                *key, count, average = row
+            else:
+                *key, count = row
+            group = groups.setdefault(tuple(key), {'sessions': 0, 'messages': 0, 'ratings': 0, 'avg_rating': 0})
+            group[measure] = int(count or 0)
+            if measure == 'ratings':
+                group['avg_rating'] = round(average, 2) if average is not None else 0
+    return groups
+
+
+def _timestamp(value):
+    # Raw SQLite rows hold "YYYY-MM-DD HH:MM:SS.ffffff"; report ISO 8601 like the ORM did
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value.replace(' ', 'T') if value else None
+
+
+def user_totals(execute):
+    """One row per user: sessions, messages, ratings given and their average"""
+    users = _users(execute)
+    groups = _grouped(execute, TOTALS_SQL, {})
+    rows = []
+    for user_id, (_, username, email, created_at) in users.items():
+        group = groups.get((user_id,), {})
+        rows.append({
+            'username': username,
+            'email': email,
+            'created_at': _timestamp(created_at),
+            'total_sessions': group.get('sessions', 0),
+            'total_messages': group.get('messages', 0),
+            'ratings_given': group.get('ratings', 0),
+            'avg_rating_given': group.get('avg_rating', 0),
+        })
+    return rows
+
+
+def by_model(execute):
+    """One row per user and model they have used"""
+    users = _users(execute)
+    rows = []
+    for (user_id, model), group in sorted(_grouped(execute, BY_MODEL_SQL, {}).items()):
+        if user_id in users:
+            rows.append(dict(username=users[user_id][1], model=model, **group))
+    return rows
+
+
+def by_day(execute, days=30):
+    """One row per user and UTC day with activity in the last ``days`` days"""
+    since = (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d 00:00:00')
+    users = _users(execute)
+    rows = []
+    for (user_id, day), group in sorted(_grouped(execute, BY_DAY_SQL, {'since': since}).items()):
+        if user_id in users:
+            rows.append(dict(username=users[user_id][1], day=day, **group))
+    return rows
+
+
+def to_csv(rows, fields):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=fields)
+    writer.writeheader()
+    writer.writerows(rows)
+    return output.getvalue()